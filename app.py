@@ -1,66 +1,129 @@
+import time
+IMPORT_STARTED = time.perf_counter()  # 啟動各階段的耗時從這裡開始算 (startup_phase_seconds)
+import hashlib
+import json
 import logging
 import secrets
 import datetime
 import os
-import psutil
-import time
-import psycopg2
+import tempfile
+import threading
+from functools import partial
+import click
 from dotenv import load_dotenv
-from flask import Flask, session, jsonify, request, render_template
+from flask import Flask, Response, session, jsonify, request, render_template, stream_with_context
+from flask.cli import AppGroup
 from flask_cors import CORS
-from featuretoggles import TogglesList
 from werkzeug.middleware.proxy_fix import ProxyFix
 from prometheus_flask_exporter import PrometheusMetrics
-from prometheus_client import Gauge, Histogram
+from prometheus_flask_exporter.multiprocess import GunicornInternalPrometheusMetrics
+from prometheus_client import Counter, Gauge, Histogram
+from db_pool import ConnectionPool, PoolTimeout
+from seat_snapshot import SeatAvailabilityCache
+from seat_allocator import SeatIndex
+from system_metrics import SystemMetricsSampler
+from booking_limiter import BookingRejected, ShowLimiter
+from circuit_breaker import LatencyCircuitBreaker
+from idempotency import IdempotencyCache, fingerprint
+from tracing import JsonLinesSpanExporter, Tracer
+from static_pages import PrerenderedPage, PrerenderedPages
+from server_session import MemorySessionStore, ServerSessionInterface, SqliteSessionStore
+from seat_holds import HoldSweeper
+from write_behind import WriteBehindBuffer
+from startup import StartupTimer, run_in_background
+from seat_stream import SEAT_CHANNEL, SeatBroadcaster, SeatChangeListener, stream_events
+from toggle_provider import ReloadingToggles
+from event_log import EventLogger, parse_sample_rates, start_async_logging
+from seat_layout import AUDITORIUMS, DEFAULT_AUDITORIUM, layout_document, layout_fingerprint, make_layout, seat_map, seat_positions, sold_bits
 
 load_dotenv()
+# psycopg2 / psutil / featuretoggles / brotli 都延到第一次用到才 import；DB 連線與預先 render 頁面在 create_app() 之後的背景 thread 進行
+startup = StartupTimer(IMPORT_STARTED)
+startup.mark("imports")
 
-SEAT_MAP = []
-ROWS = "ABCDEFGHIJ" 
-COLS = 10
-
-for r_idx, row_char in enumerate(ROWS):
-    for col_num in range(1, COLS + 1):
-        s_type = "center"
-        if r_idx < 3: s_type = "front" 
-        elif r_idx > 7: s_type = "back" 
-        if col_num <= 2 or col_num >= 19: s_type = "aisle"
-
-        SEAT_MAP.append({
-            "id": f"{row_char}{col_num}", 
-            "row": row_char, 
-            "col": col_num, 
-            "type": s_type, 
-            "status": 0
-        })
-
-class CinemaToggles(TogglesList):
+class CinemaToggles:
     guest_checkout: bool
     auto_seating: bool
 
-try:
-    toggles = CinemaToggles("toggles.yaml")
-except Exception:
-    class Mock:
-        guest_checkout = False
-        auto_seating = False
-    toggles = Mock()
+def load_cinema_toggles(path):
+    # featuretoggles 只有在讀 toggles.yaml 時才需要
+    from featuretoggles import TogglesList
+
+    class Toggles(TogglesList):
+        __annotations__ = dict(CinemaToggles.__annotations__)
+
+    return Toggles(path)
 
 os.environ["DEBUG_METRICS"] = "true"
 
 app = Flask(__name__)   
 app.secret_key = os.environ.get("SECRET_KEY", "dev-key-for-local-only")
 DATABASE_URL = os.environ.get("DATABASE_URL") 
+DEFAULT_SHOW_ID = int(os.environ.get("DEFAULT_SHOW_ID", "1"))
+SEAT_SNAPSHOT_TTL = float(os.environ.get("SEAT_SNAPSHOT_TTL", "2"))
 
-metrics = PrometheusMetrics(app, path='/metrics', group_by='path')
+# 多個 gunicorn worker 時 (gunicorn.conf.py 會設定 PROMETHEUS_MULTIPROC_DIR)，
+# 各 worker 的數值寫到共用目錄，/metrics 回傳所有 worker 彙總後的結果
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    metrics = GunicornInternalPrometheusMetrics(app, path='/metrics', group_by='path')
+else:
+    metrics = PrometheusMetrics(app, path='/metrics', group_by='path')
 metrics.info('app_info', 'Cinema Booking App', version='1.0.3')
 
 auto_seat_latency = Histogram('auto_seat_latency_seconds', 'Latency of smart seat allocation')
 manual_seat_latency = Histogram('manual_seat_latency_seconds', 'Latency of manual seat selection')
 auto_manual_seat_latency = Histogram('auto_manual_seat_latency_seconds', 'Latency of auto/manual seat selection')
-system_cpu_usage = Gauge('system_cpu_usage_percent', 'System CPU usage percent')
-system_memory_usage = Gauge('system_memory_usage_bytes', 'System memory usage in bytes')
-db_write_latency = Gauge('db_write_latency_seconds', 'Latency of writing booking to DB')
+system_cpu_usage = Gauge('system_cpu_usage_percent', 'System CPU usage percent', ['worker'], multiprocess_mode='liveall')
+system_memory_usage = Gauge('system_memory_usage_bytes', 'System memory usage in bytes', ['worker'], multiprocess_mode='liveall')
+db_write_latency = Gauge('db_write_latency_seconds', 'Latency of writing booking to DB', multiprocess_mode='livemostrecent')
+db_pool_in_use = Gauge('db_pool_connections_in_use', 'DB connections checked out of the pool', multiprocess_mode='livesum')
+db_pool_idle = Gauge('db_pool_connections_idle', 'Idle DB connections kept in the pool', multiprocess_mode='livesum')
+db_pool_wait = Histogram('db_pool_wait_seconds', 'Time spent waiting to check out a DB connection')
+booking_rejected = Counter('booking_rejected_total', 'Bookings shed by the per-show admission limiter', ['reason'])
+booking_in_flight = Gauge('booking_in_flight', 'Bookings currently holding a per-show admission slot', multiprocess_mode='livesum')
+toggles_reloads = Counter('toggles_reload_total', 'toggles.yaml reload attempts', ['result'])
+toggles_last_reload = Gauge('toggles_last_reload_timestamp_seconds', 'Unix time of the last successful toggles.yaml load', multiprocess_mode='livemax')
+auto_seating_breaker_state = Gauge('auto_seating_breaker_state', 'Auto seating circuit breaker (0=closed, 1=half_open, 2=open)', multiprocess_mode='livemax')
+auto_seating_breaker_transitions = Counter('auto_seating_breaker_transitions_total', 'Auto seating circuit breaker state changes', ['from_state', 'to_state'])
+booking_replays = Counter('booking_idempotent_replays_total', 'Repeated booking submits answered with the stored result', ['source'])
+seat_stream_clients = Gauge('seat_stream_clients', 'Open /api/seat-stream connections', multiprocess_mode='livesum')
+booking_stage_latency = Histogram('booking_stage_seconds', 'Time spent in each stage of a booking request', ['stage'],
+                                  buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+trace_spans_dropped = Counter('trace_spans_dropped_total', 'Spans dropped because the trace export buffer was full')
+seat_hold_requests = Counter('seat_hold_requests_total', 'Seat hold requests by result', ['result'])
+seat_hold_rejected = Counter('seat_hold_rejected_total', 'Seat holds shed by the per-show hold limiter', ['reason'])
+seat_holds_expired = Counter('seat_holds_expired_total', 'Expired seat holds released by the sweeper')
+page_views = Counter('page_views_total', 'Page views (pre-rendered or rendered)', ['page'])
+booking_audit_queued = Gauge('booking_audit_queued', 'Booking audit rows waiting to be written', multiprocess_mode='livesum')
+booking_audit_dropped = Counter('booking_audit_dropped_total', 'Booking audit rows dropped (buffer full or failed batch)')
+booking_audit_written = Counter('booking_audit_written_total', 'Booking audit rows written in batches')
+startup_phase_seconds = Gauge('startup_phase_seconds', 'Wall time of each startup phase of a worker', ['phase'], multiprocess_mode='livemax')
+log_events_dropped = Counter('log_events_dropped_total', 'Log records dropped because the async log buffer was full')
+
+# METRIC_* 事件：key=value (或 LOG_FORMAT=json)；高流量事件可用 LOG_SAMPLE_RATES 抽樣
+log_event = EventLogger(
+    sample_rates=parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES")),
+    as_json=os.environ.get("LOG_FORMAT") == "json",
+)
+
+# 訂票各階段 (連線、挑位、搶位、commit...) 的耗時：Prometheus histogram 一律記錄 (TRACE_STAGES=false 可關)，
+# 設定 TRACE_EXPORT_PATH 時再把 span 以 OTLP/JSON 格式寫進檔案 (TRACE_SAMPLE_RATE 抽樣)
+tracer = Tracer(
+    stage_histogram=booking_stage_latency,
+    exporter=JsonLinesSpanExporter(os.environ["TRACE_EXPORT_PATH"], dropped_counter=trace_spans_dropped) if os.environ.get("TRACE_EXPORT_PATH") else None,
+    sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", "1")),
+    enabled=os.environ.get("TRACE_STAGES", "true").lower() == "true",
+)
+
+# 改 toggles.yaml 後幾秒內生效 (不用重新部署)；讀取 toggle 不加鎖、不碰檔案
+toggles = ReloadingToggles(
+    "toggles.yaml", CinemaToggles,
+    interval=float(os.environ.get("TOGGLES_POLL_INTERVAL", "2")),
+    reload_counter=toggles_reloads,
+    last_reload_gauge=toggles_last_reload,
+    load=False,
+    loader=load_cinema_toggles,
+)
 
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
 IS_PRODUCTION = os.environ.get('RENDER') is not None
@@ -75,64 +138,130 @@ else:
         SESSION_COOKIE_SAMESITE="Lax", 
         SESSION_COOKIE_SECURE=False
     )
-CORS(app, supports_credentials=True)
+
+# SESSION_BACKEND=memory (單一 worker) / sqlite (同一台機器的所有 worker 共用)：cookie 只放隨機 id，
+# 資料有變才寫入，不用每個回應都重新簽章；預設仍是 Flask 的 signed cookie
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "cookie")
+if SESSION_BACKEND in ("memory", "sqlite"):
+    app.session_interface = ServerSessionInterface(
+        MemorySessionStore(maxsize=int(os.environ.get("SESSION_CACHE_SIZE", "10000")))
+        if SESSION_BACKEND == "memory" else
+        SqliteSessionStore(os.environ.get("SESSION_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "cinema-sessions.sqlite3"))),
+        ttl=int(os.environ.get("SESSION_TTL", "86400")),
+        guest_ttl=int(os.environ.get("GUEST_SESSION_TTL", "1800")),
+    )
+CORS(app, supports_credentials=True, expose_headers=["ETag"])  # 輪詢 seat-config 時前端要讀 ETag
+
+db_pool = ConnectionPool(
+    DATABASE_URL,
+    minconn=int(os.environ.get("DB_POOL_MIN", "1")),
+    maxconn=int(os.environ.get("DB_POOL_MAX", "10")),
+    timeout=float(os.environ.get("DB_POOL_TIMEOUT", "5")),
+    check_after=float(os.environ.get("DB_POOL_CHECK_AFTER", "30")),
+    in_use_gauge=db_pool_in_use,
+    idle_gauge=db_pool_idle,
+    wait_histogram=db_pool_wait,
+) if DATABASE_URL else None
 
 def get_db_connection():
-    if not DATABASE_URL: return None
+    if not db_pool: return None
     try:
-        return psycopg2.connect(DATABASE_URL)
+        with tracer.span("db.connect"):
+            return db_pool.getconn()
+    except PoolTimeout:
+        raise
     except Exception as e:
         logging.error(f"DB_CONNECTION_ERROR: {e}")
         return None
 
-def init_db_seats():
+def release_db_connection(conn, discard=False):
+    if conn is not None and db_pool:
+        db_pool.putconn(conn, discard=discard)
+
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(e):
+    logging.warning(f"DB_POOL_EXHAUSTED: {e}")
+    response = jsonify({"success": False, "error": "系統忙碌中，請稍後再試"})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+PROVISION_SEATS_SQL = """
+    INSERT INTO tickets (ticket_id, show_id, seat_code, seat_type)
+    SELECT 'TKT-' || lpad(seq::text, greatest(3, length(seq::text)), '0'), %(show_id)s, code, s_type
+    FROM (
+        SELECT nextval('ticket_seq') AS seq, code, s_type
+        FROM unnest(%(codes)s::text[], %(types)s::text[]) WITH ORDINALITY AS u(code, s_type, n)
+        ORDER BY n
+    ) seats
+    ON CONFLICT (show_id, seat_code) DO NOTHING
+"""
+
+def provision_show_seats(cur, show_id, layout):
+    # 整個影廳一個 INSERT，ticket_id 由 DB 端的 sequence 產生
+    seats = seat_map(layout)
+    cur.execute(PROVISION_SEATS_SQL, {
+        "show_id": show_id,
+        "codes": [s["id"] for s in seats],
+        "types": [s["type"] for s in seats],
+    })
+    return cur.rowcount
+
+def provision_show(show_id, layout):
     conn = get_db_connection()
-    if not conn: return
+    if not conn:
+        raise click.ClickException("DATABASE_URL is not configured or the DB is unreachable")
     try:
         cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM tickets")
-        count = cur.fetchone()[0]
-        
-        if count == 0:
-            logging.info("Initializing 400 seats into DB...")
-            rows = "ABCDEFGHIJ"
-            cols = 10
-            args_list = []
-            
-            for r_idx, r in enumerate(rows):
-                for c in range(1, cols + 1):
-                    seat_code = f"{r}{c}"
-                    s_type = "center"
-                    if r_idx < 3: s_type = "front" 
-                    elif r_idx > 6: s_type = "back" 
-                    if c == 1 or c == 6 or c == 5 or c == 10: s_type = "aisle"
-                    cur.execute("SELECT nextval('ticket_seq')")
-                    seq = cur.fetchone()[0]
-                    tkt_id = f"TKT-{seq:03d}"
-                    args_list.append((tkt_id, seat_code, s_type))
-            
-            sql = "INSERT INTO tickets (ticket_id, seat_code, seat_type) VALUES (%s, %s, %s)"
-            cur.executemany(sql, args_list)
-            conn.commit()
-            logging.info("Seats initialized successfully.")
-        
+        # 同一場次同時只允許一個初始化 (多台機器 / 多個 worker 一起啟動也安全)
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('seats-init'), %s)", (show_id,))
+        cur.execute("""
+            INSERT INTO shows (show_id, auditorium, seat_rows, seat_cols) VALUES (%s, %s, %s, %s)
+            ON CONFLICT (show_id) DO NOTHING
+        """, (show_id, layout.name, len(layout.rows), layout.cols))
+        # 指定 show_id 寫入不會推進 SERIAL 的 sequence，之後不指定 show_id 的 INSERT 才不會撞號
+        cur.execute("SELECT setval(pg_get_serial_sequence('shows', 'show_id'), GREATEST((SELECT MAX(show_id) FROM shows), 1))")
+        cur.execute("SELECT auditorium FROM shows WHERE show_id = %s", (show_id,))
+        auditorium = cur.fetchone()[0]
+        if auditorium != layout.name:
+            raise click.ClickException(f"show {show_id} already uses auditorium {auditorium!r}")
+        created = provision_show_seats(cur, show_id, layout)
+        conn.commit()
         cur.close()
-        conn.close()
-    except Exception as e:
-        logging.error(f"Init DB failed: {e}")
+        forget_unknown_show(show_id)
+        return created
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
 
-with app.app_context():
-    init_db_seats()
+seats_cli = AppGroup("seats", help="Seat inventory provisioning.")
 
-@app.before_request
-def gather_system_metrics():
-    try:
-        cpu = psutil.cpu_percent(interval=None)
-        system_cpu_usage.set(cpu)
-        memory = psutil.Process(os.getpid()).memory_info().rss
-        system_memory_usage.set(memory)
-    except Exception as e:
-        app.logger.error(f"Metrics error: {e}")
+@seats_cli.command("init")
+@click.option("--show-id", type=int, default=None, help="Show to provision (defaults to DEFAULT_SHOW_ID).")
+@click.option("--auditorium", type=click.Choice(sorted(AUDITORIUMS)), default=None, help="Predefined auditorium layout.")
+@click.option("--rows", type=click.IntRange(1, 26), default=None, help="Number of rows for an ad-hoc layout.")
+@click.option("--cols", type=click.IntRange(1, 99), default=None, help="Seats per row for an ad-hoc layout.")
+def seats_init_command(show_id, auditorium, rows, cols):
+    """Create the tickets for a show. Safe to re-run."""
+    show_id = DEFAULT_SHOW_ID if show_id is None else show_id
+    if rows or cols:
+        if auditorium or not (rows and cols):
+            raise click.UsageError("use either --auditorium or both --rows and --cols")
+        layout = make_layout(f"grid-{rows}x{cols}", rows, cols)
+    else:
+        layout = AUDITORIUMS[auditorium or DEFAULT_AUDITORIUM]
+    created = provision_show(show_id, layout)
+    click.echo(f"show {show_id} ({layout.name}): {created} seats created, {len(seat_map(layout)) - created} already present")
+
+app.cli.add_command(seats_cli)
+
+# CPU / 記憶體改由背景 thread 定期取樣，不再佔用每個 request 的時間
+system_metrics = SystemMetricsSampler(
+    system_cpu_usage, system_memory_usage,
+    interval=float(os.environ.get("SYSTEM_METRICS_INTERVAL", "5")),
+)
 
 startup_logged = False
 @app.before_request
@@ -140,34 +269,71 @@ def log_startup_once():
     global startup_logged
     if startup_logged: return
     startup_logged = True
-    logging.info("STARTUP service=cinema_booking guest_checkout=%s auto_seating=%s",
-        getattr(toggles, "guest_checkout", False), getattr(toggles, "auto_seating", False))
+    # 沒透過 create_app() 啟動時 (gunicorn app:app)，第一個請求補做；
+    # 測試 (app.testing) 不啟動背景 thread，也不用 .env 的 DATABASE_URL 暖機
+    if not app.testing:
+        start_app()
+    log_event("STARTUP", service="cinema_booking",
+        guest_checkout=bool(getattr(toggles, "guest_checkout", False)), auto_seating=bool(getattr(toggles, "auto_seating", False)))
 
 @app.route("/")
 def page_index():
-    logging.info("METRIC_PAGE_VIEW page=index role=%s", session.get("role", "anon"))
+    log_event("METRIC_PAGE_VIEW", page="index", role=session.get("role", "anon"))
+    page_views.labels(page="index").inc()
     return render_template("index.html")
 
 @app.route("/login.html")
 def page_login():
-    logging.info("METRIC_PAGE_VIEW page=login role=%s", session.get("role", "anon"))
+    log_event("METRIC_PAGE_VIEW", page="login", role=session.get("role", "anon"))
+    page_views.labels(page="login").inc()
     return render_template("login.html")
 
 @app.route("/booking_std.html")
 def page_booking_std():
-    logging.info("METRIC_PAGE_VIEW page=booking_std role=%s", session.get("role", "member"))
+    log_event("METRIC_PAGE_VIEW", page="booking_std", role=session.get("role", "member"))
+    page_views.labels(page="booking_std").inc()
     return render_template("booking_std.html")
 
 @app.route("/booking_guest.html")
 def page_booking_guest():
-    logging.info("METRIC_PAGE_VIEW page=booking_guest role=%s", session.get("role", "guest"))
+    log_event("METRIC_PAGE_VIEW", page="booking_guest", role=session.get("role", "guest"))
+    page_views.labels(page="booking_guest").inc()
     return render_template("booking_guest.html")
 
 @app.route("/success.html")
 def page_success():
-    logging.info("METRIC_PAGE_VIEW page=success role=%s", session.get("role", "anon"))
+    log_event("METRIC_PAGE_VIEW", page="success", role=session.get("role", "anon"))
+    page_views.labels(page="success").inc()
     return render_template("success.html")
 
+# 這幾頁的 template 沒有任何變數：啟動時 render + 壓縮一次，由 WSGI middleware 直接回應；改 template 時可設 PRERENDER_PAGES=false
+# 刻意跳過的 Flask 行為：request context / session (不讀也不寫 cookie)、before_request (log_startup_once)、
+# CORS 標頭 (同源頁面用不到)、flask_http_request_total (改由 page_views_total 計數)。
+# METRIC_PAGE_VIEW 照常記，但讀不到 session，role 一律記成 "unknown" (booking_analytics 對缺 role 的事件也是用 "unknown")
+PRERENDERED_PAGES = {
+    "/": ("index", "index.html"),
+    "/login.html": ("login", "login.html"),
+    "/booking_std.html": ("booking_std", "booking_std.html"),
+    "/booking_guest.html": ("booking_guest", "booking_guest.html"),
+    "/success.html": ("success", "success.html"),
+}
+# render + 壓縮在啟動後的背景暖機做；完成之前這些頁面照常由下面的 route render
+prerendered_pages = None
+if os.environ.get("PRERENDER_PAGES", "true").lower() == "true":
+    prerendered_pages = app.wsgi_app = PrerenderedPages(
+        app.wsgi_app,
+        max_age=int(os.environ.get("PAGE_CACHE_MAX_AGE", "60")),
+        view_counter=page_views,
+        on_view=lambda page: log_event("METRIC_PAGE_VIEW", page=page, role="unknown"),
+    )
+
+def prerender_pages():
+    if prerendered_pages is None:
+        return
+    with startup.phase("prerender"), app.app_context():
+        prerendered_pages.load({path: PrerenderedPage(name, render_template(template).encode("utf-8"))
+                                for path, (name, template) in PRERENDERED_PAGES.items()})
+
 def generate_guest_token():
     return secrets.token_urlsafe(24)
 
@@ -177,10 +343,10 @@ def init_flow():
         token = generate_guest_token()
         session["guest_token"] = token
         session["role"] = "guest"
-        logging.info("METRIC_FLOW_START type=guest_checkout token_prefix=%s", token[:8])
+        log_event("METRIC_FLOW_START", type="guest_checkout", token_prefix=token[:8])
         return jsonify({"action": "redirect", "target": "booking_guest.html", "message": "進入快速訂票模式"})
     else:
-        logging.info("FLOW_START type=member_only has_user_session=%s", "user_id" in session)
+        log_event("FLOW_START", type="member_only", has_user_session="user_id" in session)
         if "user_id" in session:
             return jsonify({"action": "redirect", "target": "booking_std.html"})
         else:
@@ -193,80 +359,485 @@ def login():
     if username == "admin" and data.get("password") == "1234":
         session["user_id"] = "admin"
         session["role"] = "member"
-        logging.info("METRIC_LOGIN_SUCCESS user=%s", username)
+        log_event("METRIC_LOGIN_SUCCESS", user=username)
         return jsonify({"success": True, "target": "booking_std.html"})
-    logging.warning("SECURITY_LOGIN_FAILED user=%s", username)
+    log_event("SECURITY_LOGIN_FAILED", logging.WARNING, user=username)
     return jsonify({"success": False, "message": "帳號密碼錯誤"}), 401
 
+show_layouts = {}
+seat_caches = {}
+seat_indexes = {}
+# 查不到的場次也短暫記住 (show_id -> 到期時間)，亂帶 show_id 不會每次都打 DB；新開的場次最多晚 TTL 秒出現
+SHOW_NOT_FOUND_TTL = float(os.environ.get("SHOW_NOT_FOUND_TTL", "30"))
+SHOW_NOT_FOUND_CACHE_SIZE = int(os.environ.get("SHOW_NOT_FOUND_CACHE_SIZE", "10000"))
+unknown_shows = {}
+unknown_shows_lock = threading.Lock()
+
+def is_unknown_show(show_id):
+    with unknown_shows_lock:
+        expires_at = unknown_shows.get(show_id)
+        if expires_at is None:
+            return False
+        if expires_at > time.monotonic():
+            return True
+        del unknown_shows[show_id]
+        return False
+
+def remember_unknown_show(show_id):
+    with unknown_shows_lock:
+        unknown_shows.pop(show_id, None)
+        if len(unknown_shows) >= SHOW_NOT_FOUND_CACHE_SIZE:
+            # 滿了就丟掉最早記下的 (dict 保持插入順序)
+            del unknown_shows[next(iter(unknown_shows))]
+        unknown_shows[show_id] = time.monotonic() + SHOW_NOT_FOUND_TTL
+
+def forget_unknown_show(show_id):
+    with unknown_shows_lock:
+        unknown_shows.pop(show_id, None)
+
+def get_show_layout(show_id):
+    layout = show_layouts.get(show_id)
+    if layout: return layout
+    if is_unknown_show(show_id):
+        return None
+    auditorium = None
+    looked_up = False
+    conn = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            with tracer.span("db.show_lookup", show=show_id):
+                cur.execute("SELECT auditorium, seat_rows, seat_cols FROM shows WHERE show_id = %s", (show_id,))
+                row = cur.fetchone()
+            cur.close()
+            looked_up = True
+            if row:
+                auditorium, seat_rows, seat_cols = row
+                layout = AUDITORIUMS.get(auditorium)
+                if layout is None and seat_rows and seat_cols:
+                    layout = make_layout(auditorium, seat_rows, seat_cols)
+        except Exception as e:
+            logging.error(f"Error fetching show {show_id}: {e}")
+        finally:
+            release_db_connection(conn)
+    if auditorium is None and show_id == DEFAULT_SHOW_ID:
+        layout = AUDITORIUMS[DEFAULT_AUDITORIUM]
+    if layout:
+        show_layouts[show_id] = layout
+    elif looked_up:
+        remember_unknown_show(show_id)
+    return layout
+
+@tracer.traced("db.load_sold")
+def load_sold_seats(show_id):
+    conn = get_db_connection()
+    if not conn: return None
+    try:
+        cur = conn.cursor()
+        # 保留中 (且還沒過期) 的座位對其他人來說也不能選
+        cur.execute("SELECT seat_code FROM tickets WHERE show_id = %s AND (status = 1 OR (status = 2 AND held_until > now()))", (show_id,))
+        sold_seats = {row[0] for row in cur.fetchall()}
+        cur.close()
+        return sold_seats
+    finally:
+        release_db_connection(conn)
+
+def get_seat_cache(show_id):
+    cache = seat_caches.get(show_id)
+    if cache is None:
+        cache = seat_caches.setdefault(show_id, SeatAvailabilityCache(partial(load_sold_seats, show_id), ttl=SEAT_SNAPSHOT_TTL))
+    return cache
+
+def get_seat_index(show_id, layout):
+    index = seat_indexes.get(show_id)
+    if index is None:
+        index = seat_indexes.setdefault(show_id, SeatIndex((s["id"], s["type"]) for s in seat_map(layout)))
+    return index
+
+def parse_show_id(value):
+    try:
+        return int(value) if value not in (None, "") else DEFAULT_SHOW_ID
+    except (TypeError, ValueError):
+        return None
+
+def show_not_found(show_id):
+    logging.warning(f"Show not found: {show_id}")
+    return jsonify({"success": False, "error": "找不到場次"}), 404
+
+SEAT_PREFERENCES = [
+    {"key": "center", "label": "👑 視野最佳 (中間區域)"},
+    {"key": "aisle", "label": "🏃 進出方便 (靠走道)"},
+    {"key": "back", "label": "🕶️ 隱密性高 (後排)"},
+    {"key": "front", "label": "🔥 臨場感強 (前排)"},
+]
+
+# (show_id, mode, compact) -> (layout, sold, body, etag)：同一份快照只序列化一次
+seat_config_bodies = {}
+
+def build_seat_config(show_id, layout, mode, sold, compact):
+    response = {"mode": mode, "show_id": show_id}
+    if mode == "auto":
+        response.update(seats=[], preferences=SEAT_PREFERENCES)
+    elif compact:
+        # 座位表另外用 layout URL 拿 (瀏覽器長期快取)，這裡只帶每個座位 1 bit 的售出狀態
+        response.update(layout=f"/api/seat-layout?show_id={show_id}&v={layout_fingerprint(layout)}", sold=sold_bits(layout, sold))
+    else:
+        # seat_map 是共用的快取資料，每次回應都複製一份再標記狀態
+        response.update(seats=[dict(s, status=1 if s["id"] in sold else 0) for s in seat_map(layout)], preferences=[])
+    return response
+
+def seat_config_body(show_id, layout, mode, compact):
+    sold = get_seat_cache(show_id).get().sold if mode == "manual" else None
+    key = (show_id, mode, compact)
+    cached = seat_config_bodies.get(key)
+    if cached is None or cached[0] != layout or cached[1] is not sold:
+        body = json.dumps(build_seat_config(show_id, layout, mode, sold, compact), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        cached = seat_config_bodies[key] = (layout, sold, body, hashlib.blake2s(body, digest_size=8).hexdigest())
+    return cached[2], cached[3]
+
 @app.route("/api/seat-config", methods=["GET"])
 def get_seat_config():
-    mode = "auto" if toggles.auto_seating else "manual"
-    
-    response = {"mode": mode, "seats": [], "preferences": []}
-    current_seat_map = list(SEAT_MAP)
-    if mode == "manual":
-        conn = get_db_connection()
-        if conn:
-            try:
-                cur = conn.cursor()
-                cur.execute("SELECT seat_code FROM tickets WHERE status = 1")
-                sold_seats = {row[0] for row in cur.fetchall()}
-                cur.close()
-                conn.close()
-                
-                for s in current_seat_map:
-                    if s['id'] in sold_seats:
-                        s['status'] = 1
-            except Exception as e:
-                logging.error(f"Error fetching manual seat config: {e}")
-        response["seats"] = current_seat_map
+    show_id = parse_show_id(request.args.get("show_id"))
+    layout = get_show_layout(show_id) if show_id is not None else None
+    if not layout:
+        return show_not_found(request.args.get("show_id"))
+    mode = "auto" if toggles.auto_seating and not auto_seating_breaker.is_open() else "manual"
+    body, etag = seat_config_body(show_id, layout, mode, request.args.get("format") == "compact")
+
+    # 每次真的進頁面都更新進入時間 (停留時間從最近一次進頁面算)；
+    # SSE 滿了時前端的輪詢 (poll=1) 不算進頁面，也不寫 session，回應不帶 Set-Cookie
+    if request.args.get("poll") != "1":
+        now = datetime.datetime.now(datetime.timezone.utc)
+        session["seat_page_enter_at"] = now.isoformat()
+        # seat_visit 把這次進頁面和之後的 BOOKING_COMPLETED 連起來 (experiments.py 算轉換率)；重新整理沿用同一個
+        if session.get("seat_mode") != mode or "seat_visit" not in session:
+            session["seat_mode"] = mode
+            session["seat_visit"] = secrets.token_hex(6)
+        log_event("METRIC_SEAT_PAGE_ENTER", role=session.get("role", "anon"), mode=mode, show=show_id, time=now.isoformat(), visit=session["seat_visit"])
+
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+@app.route("/api/seat-layout", methods=["GET"])
+def get_seat_layout():
+    show_id = parse_show_id(request.args.get("show_id"))
+    layout = get_show_layout(show_id) if show_id is not None else None
+    if not layout:
+        return show_not_found(request.args.get("show_id"))
+    layout_version = layout_fingerprint(layout)
+    response = Response(layout_document(layout), mimetype="application/json")
+    response.set_etag(layout_version)
+    # URL 帶著座位表的指紋，內容不會變：可以永久快取；指紋不符 (舊連結) 就只短暫快取
+    if request.args.get("v") == layout_version:
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
     else:
-        response["preferences"] = [
-            {"key": "center", "label": "👑 視野最佳 (中間區域)"},
-            {"key": "aisle", "label": "🏃 進出方便 (靠走道)"},
-            {"key": "back", "label": "🕶️ 隱密性高 (後排)"},
-            {"key": "front", "label": "🔥 臨場感強 (前排)"},
-        ]
-    now = datetime.datetime.now(datetime.timezone.utc)
-    session["seat_page_enter_at"] = now.isoformat()
-    session["seat_mode"] = mode
-    logging.info("METRIC_SEAT_PAGE_ENTER role=%s mode=%s time=%s", session.get("role", "anon"), mode, now.isoformat())
-    return jsonify(response)
-
-def allocate_seats(pref):
-    condition_sql = "status = 0"
-    if pref == "center":
-        condition_sql += " AND seat_type = 'center'"
-    elif pref == "aisle":
-        condition_sql += " AND seat_type = 'aisle'"
-    elif pref == "front":
-        condition_sql += " AND seat_type = 'front'"
-    elif pref == "back":
-        condition_sql += " AND seat_type = 'back'"
-    
-    return condition_sql
+        response.headers["Cache-Control"] = "public, max-age=60"
+    return response.make_conditional(request)
+
+# 訂票交易裡送 NOTIFY，commit 後每個 worker 的 listener 都會收到：
+# 更新自己的座位快照，再推給連在這個 worker 上的 SSE client (只送有變動的座位)
+# 每條 SSE 連線佔住一個 gthread：預設把 GUNICORN_THREADS 留 4 條給一般請求，其餘給 SSE；
+# 滿了的 client 改用 /api/seat-config (ETag) 輪詢
+GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", "16"))
+seat_broadcaster = SeatBroadcaster(
+    max_subscribers=int(os.environ.get("SEAT_STREAM_MAX_CLIENTS", str(max(1, GUNICORN_THREADS - 4)))),
+    subscribers_gauge=seat_stream_clients,
+)
+SEAT_STREAM_MAX_AGE = float(os.environ.get("SEAT_STREAM_MAX_AGE", "120"))
+
+def on_seat_change(show_id, seats, status):
+    cache = seat_caches.get(show_id)
+    if cache is not None:
+        if status == 0:
+            cache.mark_available(seats)
+        else:
+            cache.mark_sold(seats)
+    seat_broadcaster.publish(show_id, seats, status)
+
+seat_listener = SeatChangeListener(DATABASE_URL, on_seat_change)
+
+@app.route("/api/seat-stream", methods=["GET"])
+def seat_stream():
+    show_id = parse_show_id(request.args.get("show_id"))
+    if show_id is None or not get_show_layout(show_id):
+        return show_not_found(request.args.get("show_id"))
+    sub = seat_broadcaster.subscribe(show_id)
+    if sub is None:
+        # 每個 SSE 連線佔一個 gthread；滿了就請前端改用 /api/seat-config 輪詢
+        response = jsonify({"success": False, "error": "即時座位連線已滿"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "10"
+        return response
+    seat_cache = get_seat_cache(show_id)
+    body = stream_events(sub, lambda: seat_cache.get().sold, max_age=SEAT_STREAM_MAX_AGE)
+    return Response(stream_with_context(body), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+ALLOCATION_ATTEMPTS = 3
+
+def allocate_seats(show_id, layout, pref, count, exclude=(), snapshot=None):
+    # 已經拿著 DB 連線時要傳 snapshot 進來：快照過期的話 get() 會再向 pool 借一條連線
+    if snapshot is None:
+        snapshot = get_seat_cache(show_id).get()
+    return get_seat_index(show_id, layout).find_block(snapshot, count, pref, exclude)
+
+# 一個 statement 完成「鎖位 -> 全部或全不 -> 寫訂單」，round-trip 數不隨座位數成長；
+# 訂單只寫成交必要的欄位，mode / 耗時等分析用的資料另外寫進 booking_audit (見 BOOKING_AUDIT_MODE)
+CLAIM_SQL = """
+    WITH picked AS (
+        {picked_sql}
+    ), claimed AS (
+        UPDATE tickets t SET status = 1, held_by = NULL, held_until = NULL
+        FROM picked
+        WHERE t.ticket_id = picked.ticket_id
+          AND (SELECT COUNT(*) FROM picked) = %(count)s
+          AND NOT EXISTS (SELECT 1 FROM bookings b WHERE b.idempotency_key = %(idempotency_key)s)
+        RETURNING t.ticket_id, t.seat_code
+    ), booking AS (
+        INSERT INTO bookings (order_id, show_id, user_email, seat_codes, idempotency_key)
+        SELECT 'ORD-' || lpad(seq::text, greatest(3, length(seq::text)), '0'),
+               %(show_id)s,
+               %(customer_id)s,
+               seat_codes,
+               %(idempotency_key)s
+        FROM (
+            SELECT nextval('order_seq') AS seq, string_agg(seat_code, ',' ORDER BY ticket_id) AS seat_codes
+            FROM claimed
+            HAVING COUNT(*) = %(count)s
+        ) agg
+        RETURNING order_id, seat_codes
+    )
+    SELECT order_id, seat_codes, false
+    FROM booking CROSS JOIN LATERAL pg_notify({channel!r}, json_build_object(
+        'show', %(show_id)s, 'seats', string_to_array(seat_codes, ','), 'status', 1
+    )::text)
+    UNION ALL
+    SELECT order_id, seat_codes, true FROM bookings WHERE idempotency_key = %(idempotency_key)s
+"""
+
+FIND_BOOKING_BY_KEY_SQL = "SELECT order_id, seat_codes FROM bookings WHERE idempotency_key = %s"
+
+def find_booking_by_key(conn, stored_key):
+    """已經用這個 Idempotency-Key 成交的訂單 (order_id, seat_codes)；沒有帶 key 或找不到時回傳 None"""
+    if not stored_key:
+        return None
+    cur = conn.cursor()
+    cur.execute(FIND_BOOKING_BY_KEY_SQL, (stored_key,))
+    row = cur.fetchone()
+    conn.rollback()
+    return row
+
+def unique_violation():
+    # 只有在有例外時才會被呼叫，psycopg2 那時已經載入
+    from psycopg2 import errors
+    return errors.UniqueViolation
+
+class DuplicateBooking(Exception):
+    """The idempotency key already has a committed booking (from another worker or before a restart)."""
+
+    def __init__(self, order_id, seats):
+        super().__init__(order_id)
+        self.order_id = order_id
+        self.seats = seats
+
+# 空位、自己保留中的座位、或別人已過期的保留都可以確認成交
+PICK_BY_CODE_SQL = """
+    SELECT ticket_id FROM tickets
+    WHERE show_id = %(show_id)s AND seat_code = ANY(%(seats)s)
+      AND (status = 0 OR (status = 2 AND (held_by = %(holder)s OR held_until <= now())))
+    FOR UPDATE SKIP LOCKED
+"""
+
+def claim_seats(cur, show_id, picked_sql, params, count, customer_id, idempotency_key=None, holder=None):
+    if count < 1:
+        return None
+    cur.execute(CLAIM_SQL.format(picked_sql=picked_sql, channel=SEAT_CHANNEL), dict(
+        params,
+        show_id=show_id,
+        count=count,
+        customer_id=customer_id,
+        idempotency_key=idempotency_key,
+        holder=holder,
+    ))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    order_id, seat_codes, replayed = row
+    if replayed:
+        raise DuplicateBooking(order_id, seat_codes.split(","))
+    return order_id, seat_codes.split(",")
+
+# 每個場次同時最多 N 筆訂票在跑 DB 交易，其餘排隊；排太長就直接請 client 稍後重試
+# (N 是每個 worker process 各自的上限，整體最多 workers × N 筆)
+booking_limiter = ShowLimiter(
+    max_concurrency=int(os.environ.get("BOOKING_MAX_CONCURRENCY", "4")),
+    max_queue=int(os.environ.get("BOOKING_MAX_QUEUE", "16")),
+    timeout=float(os.environ.get("BOOKING_QUEUE_TIMEOUT", "2")),
+    rejected_counter=booking_rejected,
+    active_gauge=booking_in_flight,
+    wait_histogram=booking_stage_latency.labels(stage="admission"),
+    max_lanes=int(os.environ.get("BOOKING_MAX_LANES", "1024")),
+)
+# 保留座位另外限流：選位時的連點 / 重送再多也只會被擋在 hold，不會吃掉訂票的名額
+hold_limiter = ShowLimiter(
+    max_concurrency=int(os.environ.get("HOLD_MAX_CONCURRENCY", "4")),
+    max_queue=int(os.environ.get("HOLD_MAX_QUEUE", "16")),
+    timeout=float(os.environ.get("HOLD_QUEUE_TIMEOUT", "1")),
+    rejected_counter=seat_hold_rejected,
+    max_lanes=int(os.environ.get("BOOKING_MAX_LANES", "1024")),
+)
+
+# 智慧配位的 P95 延遲 (或錯誤率) 太高時自動退回手動選位，冷卻後放少量請求試探
+auto_seating_breaker = LatencyCircuitBreaker(
+    latency_threshold=float(os.environ.get("BREAKER_P95_THRESHOLD", "0.4")),
+    window=float(os.environ.get("BREAKER_WINDOW", "60")),
+    min_samples=int(os.environ.get("BREAKER_MIN_SAMPLES", "20")),
+    error_rate=float(os.environ.get("BREAKER_ERROR_RATE", "0.5")),
+    cooldown=float(os.environ.get("BREAKER_COOLDOWN", "30")),
+    probes=int(os.environ.get("BREAKER_PROBES", "5")),
+    state_gauge=auto_seating_breaker_state,
+    transitions_counter=auto_seating_breaker_transitions,
+)
+
+# 訂票的分析資料 (mode、role、處理耗時) 寫在 booking_audit，不放在搶位的 statement 裡
+# BOOKING_AUDIT_MODE: async (預設；commit 後放記憶體，背景批次 INSERT，synchronous_commit=off，
+# worker 當掉或 buffer 滿時可能遺失) / sync (跟訂單同一個交易一起 commit) / off (不寫)
+BOOKING_AUDIT_MODE = os.environ.get("BOOKING_AUDIT_MODE", "async")
+BOOKING_AUDIT_SQL = """
+    INSERT INTO booking_audit (order_id, show_id, user_email, role, mode, seats, processing_time_ms, db_claim_ms, created_at)
+    VALUES %s
+"""
+
+def booking_audit_row(order_id, show_id, customer_id, role, mode, seats, process_duration, db_claim):
+    return (order_id, show_id, customer_id, role, mode, seats, round(process_duration * 1000, 3), round(db_claim * 1000, 3),
+            datetime.datetime.now(datetime.timezone.utc))
+
+def write_booking_audit(rows):
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("DB Connection Failed")
+    try:
+        cur = conn.cursor()
+        cur.execute("SET LOCAL synchronous_commit = off")
+        from psycopg2.extras import execute_values
+        execute_values(cur, BOOKING_AUDIT_SQL, rows, page_size=len(rows))
+        conn.commit()
+        cur.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+booking_audit = WriteBehindBuffer(
+    write_booking_audit,
+    max_size=int(os.environ.get("BOOKING_AUDIT_QUEUE", "10000")),
+    batch_size=int(os.environ.get("BOOKING_AUDIT_BATCH", "500")),
+    interval=float(os.environ.get("BOOKING_AUDIT_INTERVAL", "1")),
+    queued_gauge=booking_audit_queued,
+    dropped_counter=booking_audit_dropped,
+    written_counter=booking_audit_written,
+)
+
+@app.errorhandler(BookingRejected)
+def handle_booking_rejected(e):
+    log_event("BOOKING_SHED", logging.WARNING, reason=e.reason)
+    response = jsonify({"success": False, "error": "目前訂票人數眾多，請稍後再試"})
+    response.status_code = e.status
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+# 重送 (瀏覽器 / traffic_generator 逾時重試) 直接回傳上次的結果，不再跑一次搶位交易。
+# 有 Idempotency-Key header 時也寫進 bookings.idempotency_key (unique)，跨 worker / 重啟都有效；
+# 沒有 header 時只用 session + payload 的指紋在記憶體裡擋短時間內的連點
+booking_results = IdempotencyCache(
+    ttl=float(os.environ.get("IDEMPOTENCY_TTL", "600")),
+    maxsize=int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "10000")),
+    wait_timeout=float(os.environ.get("IDEMPOTENCY_WAIT_TIMEOUT", "5")),
+)
+IDEMPOTENCY_FINGERPRINT_TTL = float(os.environ.get("IDEMPOTENCY_FINGERPRINT_TTL", "10"))
+
+def booking_replay(result, source):
+    booking_replays.labels(source=source).inc()
+    log_event("BOOKING_REPLAYED", source=source, order=result["order_id"])
+    response = jsonify(result)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+def booking_show_key():
+    return parse_show_id((request.get_json(silent=True) or {}).get("show_id"))
 
 @app.route("/api/book", methods=["POST"])
+@tracer.traced("booking")
 def book_ticket():
     data = request.json
     role = session.get("role")
 
     if role == "guest":
         if "guest_token" not in session:
-            logging.warning("SECURITY_GUEST_NO_TOKEN")
+            log_event("SECURITY_GUEST_NO_TOKEN", logging.WARNING)
             return jsonify({"error": "Security Violation: Invalid Guest Session"}), 403
         customer_id = f"GUEST-{data.get('email')}"
     elif role == "member":
         if "user_id" not in session:
-            logging.warning("SECURITY_MEMBER_SESSION_EXPIRED")
+            log_event("SECURITY_MEMBER_SESSION_EXPIRED", logging.WARNING)
             return jsonify({"error": "Session Expired"}), 401
         customer_id = f"MEMBER-{session.get('user_id')}"
     else:
-        logging.warning("SECURITY_UNAUTHORIZED_BOOKING")
+        log_event("SECURITY_UNAUTHORIZED_BOOKING", logging.WARNING)
         return jsonify({"error": "Unauthorized"}), 401
 
+    show_id = parse_show_id(data.get("show_id"))
+    layout = get_show_layout(show_id) if show_id is not None else None
+    if not layout:
+        return show_not_found(data.get("show_id"))
+
+    idempotency_header = request.headers.get("Idempotency-Key")
+    if idempotency_header is not None and not 0 < len(idempotency_header) <= 255:
+        return jsonify({"success": False, "error": "Idempotency-Key 格式錯誤"}), 400
+    owner = (customer_id, session.get("guest_token"))
+    if idempotency_header:
+        idempotency_key = fingerprint(*owner, idempotency_header)
+        stored_key, result_ttl = idempotency_key, None
+    else:
+        seats_requested = sorted(data.get("selected_seats") or [])
+        idempotency_key = fingerprint(*owner, show_id, seats_requested, data.get("count"), data.get("preference"))
+        stored_key, result_ttl = None, IDEMPOTENCY_FINGERPRINT_TTL
+    try:
+        replay = booking_results.begin(idempotency_key)
+    except IdempotencyCache.InFlight:
+        return jsonify({"success": False, "error": "訂單處理中，請勿重複送出"}), 409
+    if replay is not None:
+        return booking_replay(replay, "cache")
+    # 身分、場次、重送都檢查完才排隊拿名額，未登入或重送的請求不會佔住訂票的 slot
+    try:
+        with booking_limiter.admit(show_id):
+            return process_booking(data, role, customer_id, show_id, layout, idempotency_key, stored_key, result_ttl)
+    finally:
+        booking_results.release(idempotency_key)
+
+def process_booking(data, role, customer_id, show_id, layout, idempotency_key, stored_key, result_ttl):
+    seat_cache = get_seat_cache(show_id)
+
+    auto_mode = toggles.auto_seating and auto_seating_breaker.allow()
+    if toggles.auto_seating and not auto_mode and not data.get("selected_seats"):
+        # 頁面還是智慧配位的畫面，但斷路器已打開：請前端重新載入改用手動選位
+        log_event("BOOKING_AUTO_SEATING_DEGRADED", logging.WARNING, role=role, show=show_id)
+        response = jsonify({"success": False, "mode": "manual", "error": "智慧配位暫時關閉，請重新整理頁面改用手動選位"})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(max(1, round(auto_seating_breaker.cooldown)))
+        return response
+
     assigned_seats = []
+    db_write = 0.0
+    holder = seat_holder()
     process_start = time.time()
+    # 座位快照在借連線之前先取好 (過期時重新載入要另外借一條連線，pool 滿了會卡住)
+    snapshot = seat_cache.get() if auto_mode else None
     conn = get_db_connection()
     if not conn:
         logging.error("DB Connection Failed during booking")
@@ -274,36 +845,44 @@ def book_ticket():
 
     try:
         cur = conn.cursor()
-        if toggles.auto_seating:
+        if auto_mode:
             
             # time.sleep(2.0) 
 
-            count = data.get('count', 1)
+            count = int(data.get('count', 1))
             pref = data.get('preference')
 
-            condition_sql = allocate_seats(pref)
-
-            cur.execute(f"""
-                SELECT ticket_id, seat_code FROM tickets
-                WHERE {condition_sql}
-                ORDER BY ticket_id ASC
-                LIMIT {count}
-                FOR UPDATE SKIP LOCKED
-            """)
-            rows = cur.fetchall()
+            # 先在記憶體裡挑出最佳的連續座位，再到 DB 原子地搶這幾個位子
+            claim = None
+            tried = set()
+            for _ in range(ALLOCATION_ATTEMPTS):
+                with tracer.span("allocate", pref=pref, count=count):
+                    seats = allocate_seats(show_id, layout, pref, count, tried, snapshot)
+                if not seats:
+                    break
+                with tracer.span("db.claim", mode="auto", seats=count) as span:
+                    claim = claim_seats(cur, show_id, PICK_BY_CODE_SQL, {"seats": seats}, count, customer_id, stored_key, holder)
+                db_write += span.duration
+                if claim:
+                    break
+                # 快照過期 (別的 worker 先賣掉了)：放掉鎖，排除這組後換一組；
+                # 這個請求沿用同一份快照，刷新留給之後的請求
+                with tracer.span("db.rollback"):
+                    conn.rollback()
+                seat_cache.invalidate()
+                tried.update(seats)
 
-            if len(rows) < int(count):
+            if claim is None:
                 conn.rollback()
+                # 同一個 key 的另一個請求正鎖著同一批座位 (SKIP LOCKED 讓這邊拿不到)，它可能剛成交
+                row = find_booking_by_key(conn, stored_key)
+                if row is not None:
+                    raise DuplicateBooking(row[0], row[1].split(","))
+                auto_seating_breaker.record(time.time() - process_start)
                 logging.warning(f"Booking failed: Not enough seats for preference {pref}")
                 return jsonify({"success": False, "error": f"所選區域 ({pref}) 剩餘座位不足"}), 400
 
-            for row in rows:
-                tkt_id, code = row
-                cur.execute("""
-                    UPDATE tickets SET status = 1
-                    WHERE ticket_id = %s
-                """, (tkt_id,))
-                assigned_seats.append(code)
+            order_id, assigned_seats = claim
 
         else:
             assigned_seats = data.get("selected_seats", [])
@@ -311,65 +890,316 @@ def book_ticket():
                 conn.rollback()
                 logging.warning("Booking failed: No seats selected in manual mode")
                 return jsonify({"error": "未選擇座位"}), 400
-            
-            placeholders = ','.join(['%s'] * len(assigned_seats))
-            cur.execute(f"""
-                SELECT ticket_id, seat_code FROM tickets
-                WHERE seat_code IN ({placeholders}) AND status = 0
-                FOR UPDATE SKIP LOCKED
-            """, tuple(assigned_seats))
-            rows = cur.fetchall()
-
-            if len(rows) < len(assigned_seats):
+
+            with tracer.span("db.claim", mode="manual", seats=len(assigned_seats)) as span:
+                claim = claim_seats(cur, show_id, PICK_BY_CODE_SQL, {"seats": list(assigned_seats)}, len(assigned_seats), customer_id, stored_key, holder)
+            db_write += span.duration
+
+            if claim is None:
                 conn.rollback()
+                row = find_booking_by_key(conn, stored_key)
+                if row is not None:
+                    raise DuplicateBooking(row[0], row[1].split(","))
                 logging.warning(f"Booking failed: Seats {assigned_seats} already taken")
+                seat_cache.invalidate()
                 return jsonify({"success": False, "error": "所選座位已被搶先預訂"}), 400
 
-            for row in rows:
-                tkt_id, code = row
-                cur.execute("UPDATE tickets SET status = 1 WHERE ticket_id = %s", (tkt_id,))
-
-        cur.execute("SELECT nextval('order_seq')")
-        seq = cur.fetchone()[0]
-        order_id = f"ORD-{seq:03d}"
+            order_id = claim[0]
 
         process_duration = time.time() - process_start
+        audit = booking_audit_row(order_id, show_id, customer_id, role, "auto" if auto_mode else "manual",
+                                  len(assigned_seats), process_duration, db_write)
+        if BOOKING_AUDIT_MODE == "sync":
+            from psycopg2.extras import execute_values
+            with tracer.span("db.audit"):
+                execute_values(cur, BOOKING_AUDIT_SQL, [audit])
 
-        cur.execute(f"""
-            INSERT INTO bookings (order_id, user_email, seat_codes, mode, processing_time_ms)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (order_id, customer_id, ",".join(assigned_seats), "auto" if toggles.auto_seating else "manual", int(process_duration * 1000)))
-
-        conn.commit()
+        with tracer.span("db.commit") as span:
+            conn.commit()
         cur.close()
-        conn.close()
+        if BOOKING_AUDIT_MODE == "async":
+            booking_audit.put(audit)
+        if tracer.enabled:
+            db_write_latency.set(db_write + span.duration)
+        seat_cache.mark_sold(assigned_seats)
 
         auto_manual_seat_latency.observe(process_duration)
 
-        if toggles.auto_seating:
+        if auto_mode:
+            auto_seating_breaker.record(process_duration)
             auto_seat_latency.observe(process_duration)
             pref = data.get('preference', 'any')
-            logging.info("METRIC_AUTO_SEATING_USED role=%s pref=%s seats=%s duration=%.3f", role, pref, assigned_seats, process_duration)
+            log_event("METRIC_AUTO_SEATING_USED", role=role, pref=pref, seats=assigned_seats, duration=process_duration)
         else:
             manual_seat_latency.observe(process_duration)
-            logging.info("METRIC_MANUAL_SEATING_USED role=%s seats=%s duration=%.3f", role, assigned_seats, process_duration)
+            log_event("METRIC_MANUAL_SEATING_USED", role=role, seats=assigned_seats, duration=process_duration)
 
-        logging.info("METRIC_BOOKING_COMPLETED role=%s customer=%s order=%s", role, customer_id, order_id)
+        # 座位頁停留時間：從進座位頁到成交；用過就清掉，下一次進頁面重新計時
+        entered = session.pop("seat_page_enter_at", None)
+        dwell = (datetime.datetime.now(datetime.timezone.utc) - datetime.datetime.fromisoformat(entered)).total_seconds() if entered else None
+        visit = session.pop("seat_visit", None)
+        session.pop("seat_mode", None)
+        log_event("METRIC_BOOKING_COMPLETED", role=role, customer=customer_id, order=order_id, show=show_id,
+                  mode="auto" if auto_mode else "manual", dwell="" if dwell is None else dwell, visit=visit or "")
 
-        return jsonify({
+        result = {
             "success": True,
             "order_id": order_id,
             "seats": assigned_seats,
             "target": "success.html"
-        })
+        }
+        booking_results.complete(idempotency_key, result, result_ttl)
+        return jsonify(result)
+    except (DuplicateBooking, unique_violation()) as e:
+        # 同一個 key 已經在別的 worker (或重啟前) 成交：回傳那筆訂單，不動 tickets
+        conn.rollback()
+        if isinstance(e, DuplicateBooking):
+            order_id, assigned_seats = e.order_id, e.seats
+        else:
+            row = find_booking_by_key(conn, stored_key)
+            if row is None:
+                logging.error(f"Booking Failed: {e}")
+                return jsonify({"success": False, "error": str(e)}), 500
+            order_id, assigned_seats = row[0], row[1].split(",")
+        result = {"success": True, "order_id": order_id, "seats": assigned_seats, "target": "success.html"}
+        booking_results.complete(idempotency_key, result, result_ttl)
+        return booking_replay(result, "db")
     except Exception as e:
         if conn: conn.rollback()
+        if auto_mode:
+            auto_seating_breaker.record(time.time() - process_start, error=True)
         logging.error(f"Booking Failed: {e}") # [補] 例外 Log
         return jsonify({"success": False, "error": str(e)}), 500
+    finally:
+        release_db_connection(conn)
+
+# 兩段式訂票：選位時先 /api/hold (status=2 + held_until)，送出表單時 /api/book 再確認成 1。
+# 搶位的衝突分散到選位的時間點，確認時只動自己保留的那幾列；過期的保留讀取時就視為空位，
+# 背景的 hold_sweeper 再批次放回 status=0 並通知各 worker
+HOLD_TTL = int(os.environ.get("HOLD_TTL", "300"))
+MAX_HOLD_SEATS = int(os.environ.get("MAX_HOLD_SEATS", "10"))
+
+# 一個 statement：全部保留成功才生效，同時放掉自己在這個場次之前保留、這次沒選的座位
+HOLD_SQL = """
+    WITH picked AS (
+        SELECT ticket_id FROM tickets
+        WHERE show_id = %(show_id)s AND seat_code = ANY(%(seats)s)
+          AND (status = 0 OR (status = 2 AND (held_by = %(holder)s OR held_until <= now())))
+        FOR UPDATE SKIP LOCKED
+    ), ok AS (
+        SELECT (SELECT COUNT(*) FROM picked) = %(count)s AS ok
+    ), held AS (
+        UPDATE tickets t SET status = 2, held_by = %(holder)s, held_until = now() + make_interval(secs => %(ttl)s)
+        FROM picked
+        WHERE t.ticket_id = picked.ticket_id AND (SELECT ok FROM ok)
+        RETURNING t.seat_code, t.held_until
+    ), released AS (
+        UPDATE tickets t SET status = 0, held_by = NULL, held_until = NULL
+        WHERE t.show_id = %(show_id)s AND t.status = 2 AND t.held_by = %(holder)s
+          AND NOT (t.seat_code = ANY(%(seats)s)) AND (SELECT ok FROM ok)
+        RETURNING t.seat_code
+    ), notified AS (
+        SELECT pg_notify({channel!r}, json_build_object('show', %(show_id)s, 'seats', seats, 'status', status)::text)
+        FROM (
+            SELECT array_agg(seat_code) AS seats, 2 AS status FROM held
+            UNION ALL
+            SELECT array_agg(seat_code), 0 FROM released
+        ) changes
+        WHERE seats IS NOT NULL
+    )
+    SELECT (SELECT ok FROM ok),
+           (SELECT array_agg(seat_code ORDER BY seat_code) FROM held),
+           (SELECT array_agg(seat_code) FROM released),
+           (SELECT max(held_until) FROM held),
+           (SELECT COUNT(*) FROM notified)
+"""
+
+HELD_BY_ME_SQL = """
+    SELECT seat_code, held_until FROM tickets
+    WHERE show_id = %(show_id)s AND status = 2 AND held_by = %(holder)s AND held_until > now()
+    ORDER BY seat_code
+"""
+
+SWEEP_HOLDS_SQL = """
+    WITH expired AS (
+        SELECT ticket_id FROM tickets
+        WHERE status = 2 AND held_until <= now()
+        ORDER BY held_until
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    ), released AS (
+        UPDATE tickets t SET status = 0, held_by = NULL, held_until = NULL
+        FROM expired
+        WHERE t.ticket_id = expired.ticket_id
+        RETURNING t.show_id, t.seat_code
+    )
+    SELECT COALESCE(SUM(n), 0) FROM (
+        SELECT COUNT(*) AS n,
+               pg_notify({channel!r}, json_build_object('show', show_id, 'seats', array_agg(seat_code), 'status', 0)::text)
+        FROM released
+        GROUP BY show_id
+    ) per_show
+"""
+
+def seat_holder():
+    """保留座位的擁有者：訪客用 guest_token、會員用 user_id；沒有身分時回傳 None"""
+    role = session.get("role")
+    identity = session.get("guest_token") if role == "guest" else session.get("user_id") if role == "member" else None
+    return fingerprint("hold", role, identity) if identity else None
+
+@app.route("/api/hold", methods=["POST"])
+@tracer.traced("hold")
+@hold_limiter.limited(booking_show_key)
+def hold_seats():
+    data = request.get_json(silent=True) or {}
+    holder = seat_holder()
+    if holder is None:
+        log_event("SECURITY_UNAUTHORIZED_HOLD", logging.WARNING)
+        return jsonify({"error": "Unauthorized"}), 401
+
+    show_id = parse_show_id(data.get("show_id"))
+    layout = get_show_layout(show_id) if show_id is not None else None
+    if not layout:
+        return show_not_found(data.get("show_id"))
+    seats = data.get("selected_seats") or []
+    if not isinstance(seats, list) or len(seats) > MAX_HOLD_SEATS:
+        return jsonify({"success": False, "error": f"一次最多保留 {MAX_HOLD_SEATS} 個座位"}), 400
+    seats = sorted({str(s) for s in seats})
+    unknown = [s for s in seats if s not in seat_positions(layout)]
+    if unknown:
+        return jsonify({"success": False, "error": f"座位不存在: {', '.join(unknown)}"}), 400
+
+    conn = get_db_connection()
+    if not conn:
+        logging.error("DB Connection Failed during hold")
+        return jsonify({"error": "DB Connection Failed"}), 500
+    try:
+        cur = conn.cursor()
+        with tracer.span("db.hold", seats=len(seats)):
+            cur.execute(HOLD_SQL.format(channel=SEAT_CHANNEL), {
+                "show_id": show_id, "seats": seats, "count": len(seats), "holder": holder, "ttl": HOLD_TTL,
+            })
+            ok, held, released, held_until, _ = cur.fetchone()
+        if not ok:
+            conn.rollback()
+            seat_hold_requests.labels(result="conflict").inc()
+            get_seat_cache(show_id).invalidate()
+            return jsonify({"success": False, "error": "所選座位已被搶先預訂"}), 409
+        conn.commit()
+        cur.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+    seat_cache = get_seat_cache(show_id)
+    seat_cache.mark_sold(held or ())
+    seat_cache.mark_available(released or ())
+    seat_hold_requests.labels(result="held" if held else "released").inc()
+    log_event("SEATS_HELD", show=show_id, seats=held or [], released=released or [])
+    return jsonify({
+        "success": True,
+        "seats": held or [],
+        "held_until": held_until.isoformat() if held_until else None,
+        "ttl": HOLD_TTL,
+    })
+
+@app.route("/api/hold", methods=["GET"])
+def get_held_seats():
+    """自己在這個場次還保留著的座位；重新整理頁面後前端用來接回選位"""
+    show_id = parse_show_id(request.args.get("show_id"))
+    layout = get_show_layout(show_id) if show_id is not None else None
+    if not layout:
+        return show_not_found(request.args.get("show_id"))
+    holder = seat_holder()
+    if holder is None:
+        return jsonify({"success": True, "seats": [], "held_until": None, "ttl": HOLD_TTL})
+
+    conn = get_db_connection()
+    if not conn:
+        logging.error("DB Connection Failed during held seats lookup")
+        return jsonify({"error": "DB Connection Failed"}), 500
+    try:
+        cur = conn.cursor()
+        cur.execute(HELD_BY_ME_SQL, {"show_id": show_id, "holder": holder})
+        rows = cur.fetchall()
+        cur.close()
+        conn.rollback()
+    finally:
+        release_db_connection(conn)
+
+    response = jsonify({
+        "success": True,
+        "seats": [seat for seat, _ in rows],
+        "held_until": max(until for _, until in rows).isoformat() if rows else None,
+        "ttl": HOLD_TTL,
+    })
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+def sweep_expired_holds(limit):
+    conn = get_db_connection()
+    if not conn:
+        return 0
+    try:
+        cur = conn.cursor()
+        cur.execute(SWEEP_HOLDS_SQL.format(channel=SEAT_CHANNEL), {"limit": limit})
+        released = int(cur.fetchone()[0])
+        conn.commit()
+        cur.close()
+        return released
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+hold_sweeper = HoldSweeper(
+    sweep_expired_holds,
+    interval=float(os.environ.get("HOLD_SWEEP_INTERVAL", "15")) if DATABASE_URL else 0,
+    released_counter=seat_holds_expired,
+)
+
+startup.mark("module")
+
+# 背景服務 + 暖機：每個 process (gunicorn fork 出來的 worker 也算) 只做一次
+_started_pid = None
+_start_lock = threading.Lock()
+
+def warm_db():
+    if not db_pool:
+        return
+    with startup.phase("db_warmup"):
+        db_pool.warm()
+        get_seat_cache(DEFAULT_SHOW_ID).get()
+
+def report_startup():
+    phases = startup.export(startup_phase_seconds)
+    log_event("STARTUP_PHASES", total=startup.total(), **phases)
+
+def start_app():
+    global _started_pid
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+    with startup.phase("toggles"):
+        toggles.reload()
+    with startup.phase("background"):
+        toggles.start()
+        system_metrics.start()
+        seat_listener.start()
+        hold_sweeper.start()
+        if BOOKING_AUDIT_MODE == "async" and DATABASE_URL:
+            booking_audit.start()
+    # 不擋住第一個請求：頁面與 DB 連線在背景準備，還沒好之前照常走原本的路徑
+    run_in_background("warm-up", [prerender_pages, warm_db, report_startup])
 
-print("=== 目前所有註冊的路由 ===")
-print(app.url_map)
-print("========================")
+def create_app():
+    """gunicorn 的進入點 (gunicorn.conf.py: wsgi_app = "app:create_app()")。"""
+    start_app()
+    return app
 
 if __name__ == "__main__":
     logging.basicConfig(
@@ -377,12 +1207,18 @@ if __name__ == "__main__":
         format='%(asctime)s [%(levelname)s] %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
-    app.run(host="127.0.0.1", port=5000, debug=True)
+    create_app().run(host="127.0.0.1", port=5000, debug=True)
 
 if __name__ != "__main__":
     gunicorn_logger = logging.getLogger("gunicorn.error")
-    app.logger.handlers = gunicorn_logger.handlers
+    handlers = gunicorn_logger.handlers
+    if handlers and os.environ.get("LOG_ASYNC", "true") == "true":
+        # request thread 只把 record 丟進有上限的 queue，真正寫 log 交給背景 listener thread
+        queue_handler, log_listener = start_async_logging(
+            handlers, maxsize=int(os.environ.get("LOG_QUEUE_SIZE", "10000")), dropped_counter=log_events_dropped)
+        handlers = [queue_handler]
+    app.logger.handlers = handlers
     app.logger.setLevel(gunicorn_logger.level)
     root_logger = logging.getLogger()
-    root_logger.handlers = gunicorn_logger.handlers
+    root_logger.handlers = handlers
     root_logger.setLevel(gunicorn_logger.level)
\ No newline at end of file
@@ -0,0 +1,92 @@
+import json
+import os
+import platform
+import statistics
+import time
+
+
+def measure(fn, rounds=50, warmup=5, setup=None, clock=time.perf_counter):
+    """Times ``fn()`` ``rounds`` times (after ``warmup`` untimed calls).
+
+    ``setup()``, if given, runs untimed before every call, e.g. to put the
+    seats back after a booking.
+    """
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        fn()
+    samples = []
+    for _ in range(rounds):
+        if setup is not None:
+            setup()
+        start = clock()
+        fn()
+        samples.append(clock() - start)
+    return summarize(samples)
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "rounds": len(ordered),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "max": ordered[-1],
+    }
+
+
+def machine_id():
+    """Where a baseline was recorded; wall-clock medians only compare on the same host, CPU and Python."""
+    return " ".join((platform.node(), platform.machine(), platform.processor() or "-",
+                     platform.python_implementation(), platform.python_version()))
+
+
+class BaselineStore:
+    """Benchmark medians kept in a local JSON file and compared on every run.
+
+    A result whose median is more than ``tolerance`` (0.25 = 25%) slower than
+    its recorded baseline is a regression. The file records ``machine_id()``;
+    baselines from another machine are ignored (``recorded_on`` says where
+    they came from), so every machine records its own with ``save()``, which
+    merges the results of this run into the file.
+    """
+
+    def __init__(self, path, tolerance=0.25, machine=None):
+        self.path = path
+        self.tolerance = tolerance
+        self.machine = machine_id() if machine is None else machine
+        self.results = {}
+        self.baselines = {}
+        self.recorded_on = None
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        self.recorded_on = data.get("machine")
+        if self.recorded_on == self.machine:
+            self.baselines = data.get("benchmarks", {})
+
+    def check(self, name, result):
+        """Records ``result``; returns a regression message or None."""
+        self.results[name] = result
+        baseline = self.baselines.get(name)
+        if baseline is None:
+            return None
+        limit = baseline["median"] * (1 + self.tolerance)
+        if result["median"] > limit:
+            return (f"{name}: median {result['median'] * 1000:.3f}ms is more than {self.tolerance:.0%} "
+                    f"slower than the baseline {baseline['median'] * 1000:.3f}ms")
+        return None
+
+    def save(self):
+        merged = dict(self.baselines)
+        merged.update({name: {k: round(v, 7) if isinstance(v, float) else v for k, v in result.items()}
+                       for name, result in self.results.items()})
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"machine": self.machine, "benchmarks": dict(sorted(merged.items()))}, f, indent=2)
+            f.write("\n")
+        os.replace(tmp, self.path)
@@ -0,0 +1,325 @@
+"""Booking latency analytics straight from Postgres or the METRIC_* log stream.
+
+    python booking_analytics.py --source db --since 2025-12-01 --chart latency.png
+    python booking_analytics.py --source log --log-file app.log --bucket 600 --json summary.json
+    gunicorn ... 2>&1 | python booking_analytics.py --source log
+
+Rows are streamed (a server-side cursor for ``bookings``, line by line for
+logs) into one t-digest per (mode, role) and per time bucket, so memory
+depends on the number of groups and buckets, not on the number of rows.
+"""
+import argparse
+import bisect
+import datetime
+import json
+import math
+import os
+import re
+import sys
+from collections import defaultdict
+
+
+class TDigest:
+    """Merging t-digest (Dunning & Ertl) with the arcsine scale function.
+
+    Keeps at most about ``compression`` centroids, small ones near the tails,
+    so extreme quantiles stay accurate; digests can be merged.
+    """
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self._means = []
+        self._weights = []
+        self._buffer = []
+        self._buffer_size = compression * 5
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k):
+        return (math.sin(min(k * 2 * math.pi / self.compression, math.pi / 2)) + 1) / 2
+
+    def add(self, value, weight=1):
+        self._buffer.append((value, weight))
+        self.count += weight
+        self.sum += value * weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= self._buffer_size:
+            self._compress()
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = sorted(list(zip(self._means, self._weights)) + self._buffer)
+        self._buffer = []
+        total = sum(w for _, w in points)
+        means, weights = [], []
+        mean, weight = points[0]
+        done = 0.0
+        limit = total * self._k_inverse(self._k(0.0) + 1)
+        for x, w in points[1:]:
+            if done + weight + w <= limit:
+                weight += w
+                mean += (x - mean) * w / weight
+            else:
+                means.append(mean)
+                weights.append(weight)
+                done += weight
+                limit = total * self._k_inverse(self._k(done / total) + 1)
+                mean, weight = x, w
+        means.append(mean)
+        weights.append(weight)
+        self._means, self._weights = means, weights
+
+    def centroids(self):
+        self._compress()
+        return list(zip(self._means, self._weights))
+
+    def merge(self, other):
+        for mean, weight in other.centroids():
+            self._buffer.append((mean, weight))
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self._buffer) >= self._buffer_size:
+            self._compress()
+        return self
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else math.nan
+
+    def quantile(self, q):
+        self._compress()
+        if not self._means:
+            return math.nan
+        if len(self._means) == 1:
+            return self._means[0]
+        total = sum(self._weights)
+        target = q * total
+        # 每個 centroid 的「中心」落在累積權重的中間，中間值用線性內插
+        centers, cumulative = [], 0.0
+        for w in self._weights:
+            centers.append(cumulative + w / 2)
+            cumulative += w
+        if target <= centers[0]:
+            return self.min + (self._means[0] - self.min) * (target / centers[0] if centers[0] else 0)
+        if target >= centers[-1]:
+            tail = total - centers[-1]
+            return self._means[-1] + (self.max - self._means[-1]) * ((target - centers[-1]) / tail if tail else 0)
+        i = bisect.bisect_right(centers, target) - 1
+        span = centers[i + 1] - centers[i]
+        return self._means[i] + (self._means[i + 1] - self._means[i]) * (target - centers[i]) / span
+
+
+class BookingStats:
+    """One digest per (mode, role), plus per-mode digests for each ``bucket``-second window."""
+
+    def __init__(self, bucket=3600, compression=100):
+        self.bucket = bucket
+        self.compression = compression
+        self.groups = defaultdict(self._digest)
+        self.timeline = defaultdict(self._digest)  # (bucket_start, mode) -> digest
+
+    def _digest(self):
+        return TDigest(self.compression)
+
+    def add(self, mode, role, seconds, at=None, weight=1):
+        self.groups[(mode, role)].add(seconds, weight)
+        if at is not None and self.bucket:
+            start = int(at.timestamp() // self.bucket * self.bucket)
+            self.timeline[(start, mode)].add(seconds, weight)
+
+    def by_mode(self):
+        modes = defaultdict(self._digest)
+        for (mode, _), digest in self.groups.items():
+            modes[mode].merge(digest)
+        return dict(modes)
+
+    def summary(self, quantiles=(0.5, 0.9, 0.95, 0.99)):
+        def row(digest):
+            stats = {"count": digest.count, "mean": digest.mean, "max": digest.max}
+            stats.update({f"p{q * 100:g}": digest.quantile(q) for q in quantiles})
+            return stats
+        return {
+            "by_mode": {mode: row(d) for mode, d in sorted(self.by_mode().items())},
+            "by_mode_role": {f"{mode}/{role}": row(d) for (mode, role), d in sorted(self.groups.items())},
+        }
+
+
+def role_of(customer):
+    prefix = (customer or "").split("-", 1)[0].lower()
+    return prefix if prefix in ("guest", "member") else "unknown"
+
+
+# mode / 耗時寫在 booking_audit (write-behind)；舊的訂單還留在 bookings 的欄位裡
+BOOKINGS_SQL = """
+    SELECT COALESCE(a.mode, b.mode), b.user_email, COALESCE(a.processing_time_ms, b.processing_time_ms), b.created_at
+    FROM bookings b LEFT JOIN booking_audit a ON a.order_id = b.order_id
+    WHERE COALESCE(a.processing_time_ms, b.processing_time_ms) IS NOT NULL
+      AND (%(since)s::timestamp IS NULL OR b.created_at >= %(since)s)
+"""
+
+
+def iter_bookings(conn, since=None, itersize=10000):
+    """(mode, role, seconds, created_at, weight) from ``bookings`` via a named (server-side) cursor."""
+    with conn.cursor(name="booking_analytics") as cur:
+        cur.itersize = itersize
+        cur.execute(BOOKINGS_SQL, {"since": since})
+        for mode, customer, ms, created_at in cur:
+            yield mode, role_of(customer), ms / 1000.0, created_at, 1
+
+
+SEATING_EVENTS = {"METRIC_AUTO_SEATING_USED": "auto", "METRIC_MANUAL_SEATING_USED": "manual"}
+_EVENT_RE = re.compile(r"\b(METRIC_[A-Z_]+)\b(.*)$")
+_FIELD_RE = re.compile(r'(\w+)=("(?:[^"\\]|\\.)*"|\S*)')
+_TIME_RE = re.compile(r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}")
+
+
+def parse_metric(line):
+    """(event, fields, at) for a METRIC_* log line (key=value or JSON), else None.
+
+    ``at`` is the log record's timestamp (None if the line has none).
+    """
+    if '"event"' in line and "{" in line:
+        try:
+            fields = json.loads(line[line.index("{"):])
+        except ValueError:
+            return None
+        event = fields.get("event")
+    else:
+        match = _EVENT_RE.search(line)
+        if not match:
+            return None
+        event = match.group(1)
+        fields = {k: json.loads(v) if v.startswith('"') else v for k, v in _FIELD_RE.findall(match.group(2))}
+    stamp = _TIME_RE.search(line)
+    at = datetime.datetime.fromisoformat(stamp.group(0).replace(" ", "T")) if stamp else None
+    return event, fields, at
+
+
+def parse_log_line(line):
+    """(mode, role, seconds, at, weight) for a seating METRIC line, else None.
+
+    A sampled event (``sample_rate`` field, see LOG_SAMPLE_RATES) counts 1/rate times.
+    """
+    parsed = parse_metric(line)
+    if parsed is None or parsed[0] not in SEATING_EVENTS:
+        return None
+    event, fields, at = parsed
+    try:
+        seconds = float(fields["duration"])
+        weight = 1 / float(fields.get("sample_rate", 1))
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+    return SEATING_EVENTS[event], fields.get("role") or "unknown", seconds, at, weight
+
+
+def iter_log_events(lines):
+    for line in lines:
+        parsed = parse_log_line(line)
+        if parsed is not None:
+            yield parsed
+
+
+def collect(rows, bucket=3600, compression=100):
+    stats = BookingStats(bucket=bucket, compression=compression)
+    for row in rows:
+        stats.add(*row)
+    return stats
+
+
+def print_summary(summary, out=sys.stdout):
+    header = f"{'':<18}{'count':>9}{'mean':>10}{'p50':>10}{'p90':>10}{'p95':>10}{'p99':>10}{'max':>10}"
+    for title in ("by_mode", "by_mode_role"):
+        print(header, file=out)
+        for name, row in summary[title].items():
+            print(f"{name:<18}{row['count']:>9.0f}" + "".join(
+                f"{row[k] * 1000:>8.1f}ms" for k in ("mean", "p50", "p90", "p95", "p99", "max")), file=out)
+        print(file=out)
+    modes = summary["by_mode"]
+    if "auto" in modes and "manual" in modes:
+        diff = (modes["manual"]["p50"] - modes["auto"]["p50"]) * 1000
+        print(f"manual - auto 的 P50 差：約 {diff:.1f} ms", file=out)
+
+
+def plot(stats, path):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    modes = stats.by_mode()
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 4))
+    names = sorted(modes)
+    width = 0.25
+    for offset, q in enumerate((0.5, 0.95, 0.99)):
+        values = [modes[m].quantile(q) * 1000 for m in names]
+        ax1.bar([i + (offset - 1) * width for i in range(len(names))], values, width, label=f"P{q * 100:g}")
+    ax1.set_xticks(range(len(names)), names)
+    ax1.set_ylabel("Processing time (ms)")
+    ax1.set_title("Booking latency by mode")
+    ax1.legend()
+
+    for mode in names:
+        points = sorted((start, d.quantile(0.95)) for (start, m), d in stats.timeline.items() if m == mode)
+        if points:
+            ax2.plot([datetime.datetime.fromtimestamp(s) for s, _ in points], [v * 1000 for _, v in points], marker="o", label=mode)
+    ax2.set_ylabel("P95 (ms)")
+    ax2.set_title(f"P95 per {stats.bucket}s")
+    ax2.legend()
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--source", choices=("db", "log"), default="db")
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="defaults to DATABASE_URL")
+    parser.add_argument("--since", type=datetime.datetime.fromisoformat, default=None, help="only bookings created at or after this time")
+    parser.add_argument("--log-file", default="-", help="log file to parse ('-' = stdin)")
+    parser.add_argument("--bucket", type=int, default=3600, help="timeline bucket in seconds")
+    parser.add_argument("--compression", type=int, default=100)
+    parser.add_argument("--chart", help="write charts to this image file")
+    parser.add_argument("--json", dest="json_path", help="write the summary as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.source == "db":
+        if not args.dsn:
+            raise SystemExit("--dsn or DATABASE_URL is required for --source db")
+        import psycopg2
+        conn = psycopg2.connect(args.dsn)
+        try:
+            stats = collect(iter_bookings(conn, args.since), args.bucket, args.compression)
+        finally:
+            conn.close()
+    else:
+        log = sys.stdin if args.log_file == "-" else open(args.log_file, encoding="utf-8", errors="replace")
+        with log:
+            rows = iter_log_events(log)
+            if args.since:
+                rows = (r for r in rows if r[3] is None or r[3] >= args.since)
+            stats = collect(rows, args.bucket, args.compression)
+
+    summary = stats.summary()
+    print_summary(summary)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    if args.chart:
+        plot(stats, args.chart)
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+
+class BookingRejected(Exception):
+    """Raised instead of queueing when a show's booking lane is saturated."""
+
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Lane:
+    __slots__ = ("cond", "active", "waiting", "users")
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.users = 0  # 正在 admit() 裡 (排隊或執行中) 的請求數，guarded by _lanes_lock
+
+
+class ShowLimiter:
+    """Bounded concurrency per show with a bounded, time-limited wait queue.
+
+    At most ``max_concurrency`` bookings per show run at once and at most
+    ``max_queue`` wait behind them. Anything beyond that is rejected
+    immediately (429); a waiter that doesn't get in within ``timeout`` seconds
+    gives up (503). Either way the worker thread is freed quickly instead of
+    piling up on row locks.
+
+    The counts are per process: with several gunicorn workers a show can have
+    up to ``workers * max_concurrency`` bookings in flight.
+
+    The key is admitted before the show is known to exist, so lanes are kept
+    in an LRU of at most ``max_lanes``; idle lanes are dropped first and a
+    lane in use is never dropped.
+    """
+
+    def __init__(self, max_concurrency=4, max_queue=16, timeout=2.0, rejected_counter=None, active_gauge=None, wait_histogram=None,
+                 max_lanes=1024):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.rejected_counter = rejected_counter
+        self.active_gauge = active_gauge
+        self.wait_histogram = wait_histogram
+        self.max_lanes = max_lanes
+        self._lanes = OrderedDict()
+        self._lanes_lock = threading.Lock()
+
+    def _acquire_lane(self, key):
+        with self._lanes_lock:
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = _Lane()
+                if len(self._lanes) > self.max_lanes:
+                    self._evict_idle()
+            else:
+                self._lanes.move_to_end(key)
+            lane.users += 1
+        return lane
+
+    def _release_lane(self, lane):
+        with self._lanes_lock:
+            lane.users -= 1
+
+    def _evict_idle(self):
+        # 從最久沒用的開始丟；都在用的話就先超過上限 (最多就是 worker thread 數)
+        for key in [key for key, lane in self._lanes.items() if lane.users == 0]:
+            if len(self._lanes) <= self.max_lanes:
+                break
+            del self._lanes[key]
+
+    def _reject(self, status, reason):
+        if self.rejected_counter is not None:
+            self.rejected_counter.labels(reason=reason).inc()
+        raise BookingRejected(status, reason, retry_after=max(1, round(self.timeout)))
+
+    @contextmanager
+    def admit(self, key):
+        if self.max_concurrency <= 0:
+            yield
+            return
+        lane = self._acquire_lane(key)
+        start = time.monotonic()
+        try:
+            with lane.cond:
+                if lane.active >= self.max_concurrency:
+                    if lane.waiting >= self.max_queue:
+                        self._reject(429, "queue_full")
+                    lane.waiting += 1
+                    try:
+                        admitted = lane.cond.wait_for(lambda: lane.active < self.max_concurrency, self.timeout)
+                    finally:
+                        lane.waiting -= 1
+                    if not admitted:
+                        self._reject(503, "queue_timeout")
+                lane.active += 1
+        except BookingRejected:
+            self._release_lane(lane)
+            raise
+        if self.wait_histogram is not None:
+            self.wait_histogram.observe(time.monotonic() - start)
+        if self.active_gauge is not None:
+            self.active_gauge.inc()
+        try:
+            yield
+        finally:
+            if self.active_gauge is not None:
+                self.active_gauge.dec()
+            with lane.cond:
+                lane.active -= 1
+                lane.cond.notify()
+            self._release_lane(lane)
+
+    def limited(self, key_func):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                with self.admit(key_func()):
+                    return view(*args, **kwargs)
+            return wrapper
+        return decorator
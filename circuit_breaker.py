@@ -0,0 +1,123 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class LatencyCircuitBreaker:
+    """Trips when the rolling P95 latency or error rate of a code path is too high.
+
+    CLOSED: every call is allowed and recorded into a ``window``-second
+    rolling window (capped at ``max_samples``); once it holds ``min_samples``
+    calls, a P95 above ``latency_threshold`` or an error rate above
+    ``error_rate`` opens the breaker. OPEN: calls are refused for ``cooldown``
+    seconds. HALF_OPEN: up to ``probes`` calls are let through; if they all
+    finish fast and without errors the breaker closes, otherwise it opens
+    again. Probes that never report back are re-issued after ``cooldown``.
+    """
+
+    def __init__(self, latency_threshold=0.4, quantile=0.95, error_rate=0.5, window=60.0, min_samples=20,
+                 max_samples=500, cooldown=30.0, probes=5, clock=time.monotonic, state_gauge=None, transitions_counter=None):
+        self.latency_threshold = latency_threshold
+        self.quantile = quantile
+        self.error_rate = error_rate
+        self.window = window
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.probes = probes
+        self._clock = clock
+        self._state_gauge = state_gauge
+        self._transitions_counter = transitions_counter
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=max_samples)  # (at, duration, error)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._half_opened_at = 0.0
+        self._probes_started = 0
+        self._probe_results = []
+        self._set_gauge()
+
+    @property
+    def state(self):
+        return self._state
+
+    def _set_gauge(self):
+        if self._state_gauge is not None:
+            self._state_gauge.set(STATE_VALUES[self._state])
+
+    def _transition(self, new_state, reason):
+        old_state, self._state = self._state, new_state
+        if new_state == OPEN:
+            self._opened_at = self._clock()
+        if new_state == HALF_OPEN:
+            self._half_opened_at = self._clock()
+            self._probes_started = 0
+            self._probe_results = []
+        if new_state == CLOSED:
+            self._samples.clear()
+        self._set_gauge()
+        if self._transitions_counter is not None:
+            self._transitions_counter.labels(from_state=old_state, to_state=new_state).inc()
+        logging.warning("CIRCUIT_BREAKER_TRANSITION from=%s to=%s reason=%s", old_state, new_state, reason)
+
+    def _cooldown_elapsed(self):
+        return self._clock() - self._opened_at >= self.cooldown
+
+    def is_open(self):
+        """Cheap check for read paths; doesn't consume a half-open probe.
+
+        True whenever ``allow()`` would refuse right now, including HALF_OPEN
+        with every probe already handed out.
+        """
+        if self._state == OPEN:
+            return not self._cooldown_elapsed()
+        if self._state == HALF_OPEN:
+            return self._probes_started >= self.probes and self._clock() - self._half_opened_at < self.cooldown
+        return False
+
+    def allow(self):
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if not self._cooldown_elapsed():
+                    return False
+                self._transition(HALF_OPEN, "cooldown_elapsed")
+            if self._probes_started >= self.probes:
+                if self._clock() - self._half_opened_at < self.cooldown:
+                    return False
+                self._transition(HALF_OPEN, "probes_lost")
+            self._probes_started += 1
+            return True
+
+    def _quantile(self, durations):
+        ordered = sorted(durations)
+        return ordered[min(len(ordered) - 1, math.ceil(self.quantile * len(ordered)) - 1)]
+
+    def record(self, duration, error=False):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_results.append((duration, error))
+                if error or duration > self.latency_threshold:
+                    self._transition(OPEN, "probe_failed")
+                elif len(self._probe_results) >= self.probes:
+                    self._transition(CLOSED, "probes_succeeded")
+                return
+            if self._state == OPEN:
+                return
+
+            now = self._clock()
+            self._samples.append((now, duration, error))
+            while self._samples and now - self._samples[0][0] > self.window:
+                self._samples.popleft()
+            if len(self._samples) < self.min_samples:
+                return
+            errors = sum(1 for _, _, e in self._samples if e)
+            if errors / len(self._samples) > self.error_rate:
+                self._transition(OPEN, "error_rate")
+            elif self._quantile(d for _, d, _ in self._samples) > self.latency_threshold:
+                self._transition(OPEN, "latency")
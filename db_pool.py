@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+def _connect(dsn):
+    # psycopg2 在第一次連線時才 import
+    import psycopg2
+    return psycopg2.connect(dsn)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection frees up within the checkout timeout."""
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 pool with bounded checkout wait.
+
+    Connections are opened lazily up to ``maxconn`` (``warm()`` pre-opens
+    ``minconn`` of them) and kept idle once returned. The pool remembers the
+    pid that created it and starts over after a fork, so a pool built before
+    gunicorn forks never hands a parent's socket to a worker.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=5.0, check_after=30.0,
+                 connect=_connect, in_use_gauge=None, idle_gauge=None, wait_histogram=None):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"invalid pool size min={minconn} max={maxconn}")
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+        self._connect = connect
+        self._in_use_gauge = in_use_gauge
+        self._idle_gauge = idle_gauge
+        self._wait_histogram = wait_histogram
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = []  # [(conn, returned_at)]
+        self._in_use = set()
+        self._report()
+
+    def _report(self):
+        if self._in_use_gauge is not None:
+            self._in_use_gauge.set(len(self._in_use))
+        if self._idle_gauge is not None:
+            self._idle_gauge.set(len(self._idle))
+
+    @property
+    def in_use(self):
+        return len(self._in_use)
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def _healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_after:
+            return True
+        # 閒置太久的連線可能已被 server / LB 切斷，先 ping 一次
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            reused = False
+            with self._cond:
+                if self._pid != os.getpid():
+                    # forked: drop inherited connections without closing the parent's sockets
+                    self._reset()
+                while True:
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        self._in_use.add(conn)
+                        reused = True
+                        break
+                    if len(self._in_use) < self.maxconn:
+                        # reserve the slot before the (slow) connect so waiters see it as taken
+                        conn = object()
+                        self._in_use.add(conn)
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._observe_wait(start)
+                        raise PoolTimeout(f"no DB connection available within {self.timeout:.1f}s")
+                    self._cond.wait(remaining)
+
+            if reused:
+                if self._healthy(conn, returned_at):
+                    self._observe_wait(start)
+                    return conn
+                self._release_slot(conn)
+                self._discard(conn)
+                continue
+
+            placeholder = conn
+            try:
+                conn = self._connect(self.dsn)
+            except Exception:
+                self._release_slot(placeholder)
+                raise
+            with self._cond:
+                self._in_use.discard(placeholder)
+                self._in_use.add(conn)
+            self._observe_wait(start)
+            return conn
+
+    def _release_slot(self, conn):
+        with self._cond:
+            self._in_use.discard(conn)
+            self._report()
+            self._cond.notify()
+
+    def _observe_wait(self, start):
+        self._report()
+        if self._wait_histogram is not None:
+            self._wait_histogram.observe(time.monotonic() - start)
+
+    def putconn(self, conn, discard=False):
+        with self._cond:
+            if conn not in self._in_use:
+                # checked out before a fork or already returned
+                return
+            self._in_use.discard(conn)
+            if not discard and not conn.closed:
+                from psycopg2 import extensions
+                try:
+                    if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                except Exception:
+                    discard = True
+            if discard or conn.closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._report()
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        except Exception:
+            self.putconn(conn, discard=conn.closed != 0)
+            raise
+        else:
+            self.putconn(conn)
+
+    def warm(self):
+        conns = []
+        try:
+            for _ in range(self.minconn - len(self._idle)):
+                conns.append(self.getconn())
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+            self._report()
@@ -0,0 +1,94 @@
+import atexit
+import json
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+
+def parse_sample_rates(spec):
+    """``"METRIC_PAGE_VIEW=0.1,METRIC_SEAT_PAGE_ENTER=0.5"`` -> dict."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def _kv_value(value):
+    if isinstance(value, (list, tuple, set, frozenset)):
+        value = ",".join(str(v) for v in value)
+    elif isinstance(value, float):
+        value = f"{value:.3f}"
+    value = str(value)
+    # 含空白、引號、= 或換行的值一律加引號，避免使用者輸入偽造欄位或整行 log
+    return json.dumps(value, ensure_ascii=False) if (not value or any(c in value for c in ' "=\t\n\r')) else value
+
+
+class Event:
+    """A structured log event, rendered lazily by whichever thread formats it."""
+
+    __slots__ = ("name", "fields", "as_json")
+
+    def __init__(self, name, fields, as_json=False):
+        self.name = name
+        self.fields = fields
+        self.as_json = as_json
+
+    def __str__(self):
+        if self.as_json:
+            return json.dumps({"event": self.name, **self.fields}, ensure_ascii=False, default=str)
+        return " ".join([self.name] + [f"{k}={_kv_value(v)}" for k, v in self.fields.items()])
+
+
+class EventLogger:
+    """``log_event("METRIC_PAGE_VIEW", page="index", role="anon")``.
+
+    Events listed in ``sample_rates`` are kept with that probability and
+    carry a ``sample_rate`` field so counts can be scaled back up.
+    """
+
+    def __init__(self, logger=None, sample_rates=None, as_json=False):
+        self.logger = logger or logging.getLogger()
+        self.sample_rates = sample_rates or {}
+        self.as_json = as_json
+
+    def __call__(self, name, level=logging.INFO, **fields):
+        rate = self.sample_rates.get(name)
+        if rate is not None:
+            if random.random() >= rate:
+                return
+            fields["sample_rate"] = rate
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, Event(name, fields, self.as_json))
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks the request thread: a full buffer drops the record."""
+
+    def __init__(self, log_queue, dropped_counter=None):
+        super().__init__(log_queue)
+        self.dropped_counter = dropped_counter
+
+    def prepare(self, record):
+        # 不在 request thread 做字串格式化；只保留 exc_info 的文字 (traceback 物件不能跨 thread 久留)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.dropped_counter is not None:
+                self.dropped_counter.inc()
+
+
+def start_async_logging(handlers, maxsize=10000, dropped_counter=None):
+    """Route records through a bounded queue to ``handlers`` on a listener thread."""
+    log_queue = queue.Queue(maxsize=maxsize)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return DroppingQueueHandler(log_queue, dropped_counter), listener
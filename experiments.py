@@ -0,0 +1,368 @@
+"""A/B analysis for the toggle hypotheses (DEVOPS-001 guest checkout, DEVOPS-002 auto seating).
+
+    python experiments.py --log-file app.log --save events.npz
+    python experiments.py --events events.npz --variant mode                  # auto vs manual seating
+    python experiments.py --events events.npz --variant role --json report.json   # guest vs member
+    python experiments.py --events events.npz --dsn "$DATABASE_URL"           # + processing time from bookings
+
+METRIC_SEAT_PAGE_ENTER / METRIC_BOOKING_COMPLETED lines are parsed once into
+NumPy columns (``--save`` keeps them as .npz, so re-running an analysis skips
+the text parsing). Everything after that is vectorized: per-variant
+conversion and seat-page dwell time, bootstrap confidence intervals, and an
+mSPRT sequential test telling whether (and when) the experiment could have
+been stopped.
+"""
+import argparse
+import json
+import logging
+import sys
+from array import array
+
+import numpy as np
+
+from booking_analytics import BOOKINGS_SQL, parse_metric, role_of
+
+MODES = ("manual", "auto")
+ROLES = ("member", "guest", "anon")
+VARIANTS = {"mode": MODES, "role": ROLES}
+DEFAULT_ARMS = {"mode": ("manual", "auto"), "role": ("member", "guest")}
+
+
+def _code(names, value):
+    try:
+        return names.index(value)
+    except ValueError:
+        return -1
+
+
+class ExperimentEvents:
+    """Seat-page visits (``enter_*``) and completed bookings (``done_*``) as columns.
+
+    ``*_visit`` is the 48-bit ``seat_visit`` id that ties a booking to its
+    seat-page visit, ``*_mode`` / ``*_role`` index into MODES / ROLES (-1 =
+    unknown), times are epoch seconds and ``done_dwell`` is seconds on the
+    seat page (NaN when unknown).
+    """
+
+    COLUMNS = {
+        "enter_visit": "q", "enter_time": "d", "enter_mode": "b", "enter_role": "b",
+        "done_visit": "q", "done_time": "d", "done_mode": "b", "done_role": "b", "done_dwell": "d",
+    }
+
+    def __init__(self, **columns):
+        for name, typecode in self.COLUMNS.items():
+            setattr(self, name, np.asarray(columns.get(name, ()), dtype=np.dtype(typecode)))
+
+    @classmethod
+    def from_log(cls, lines):
+        columns = {name: array(typecode) for name, typecode in cls.COLUMNS.items()}
+        sampled = False
+        for line in lines:
+            if "METRIC_SEAT_PAGE_ENTER" in line:
+                prefix = "enter"
+            elif "METRIC_BOOKING_COMPLETED" in line:
+                prefix = "done"
+            else:
+                continue
+            parsed = parse_metric(line)
+            if parsed is None or parsed[2] is None:
+                continue
+            _, fields, at = parsed
+            try:
+                # 舊格式的 log 沒有 visit，無法和訂單串起來，略過
+                visit = int(fields.get("visit") or "", 16)
+            except ValueError:
+                continue
+            sampled = sampled or "sample_rate" in fields
+            columns[f"{prefix}_visit"].append(visit)
+            columns[f"{prefix}_time"].append(at.timestamp())
+            columns[f"{prefix}_mode"].append(_code(MODES, fields.get("mode")))
+            columns[f"{prefix}_role"].append(_code(ROLES, fields.get("role")))
+            if prefix == "done":
+                try:
+                    columns["done_dwell"].append(float(fields.get("dwell") or "nan"))
+                except ValueError:
+                    columns["done_dwell"].append(float("nan"))
+        if sampled:
+            logging.warning("EXPERIMENT_EVENTS_SAMPLED: events carry sample_rate; conversion needs unsampled METRIC_SEAT_PAGE_ENTER")
+        return cls(**{name: np.frombuffer(col, dtype=np.dtype(col.typecode)) for name, col in columns.items()})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in cls.COLUMNS if name in data})
+
+    def save(self, path):
+        np.savez(path, **{name: getattr(self, name) for name in self.COLUMNS})
+
+
+def load_bookings(conn, since=None, chunk=100_000):
+    """(mode, role, processing_ms) columns from ``bookings`` via a server-side cursor."""
+    modes, roles, times = [], [], []
+    with conn.cursor(name="experiments") as cur:
+        cur.itersize = chunk
+        cur.execute(BOOKINGS_SQL, {"since": since})
+        while True:
+            rows = cur.fetchmany(chunk)
+            if not rows:
+                break
+            modes.append(np.fromiter((_code(MODES, r[0]) for r in rows), np.int8, len(rows)))
+            roles.append(np.fromiter((_code(ROLES, role_of(r[1])) for r in rows), np.int8, len(rows)))
+            times.append(np.fromiter((r[2] for r in rows), np.float64, len(rows)))
+    if not modes:
+        return {"mode": np.empty(0, np.int8), "role": np.empty(0, np.int8), "processing_ms": np.empty(0)}
+    return {"mode": np.concatenate(modes), "role": np.concatenate(roles), "processing_ms": np.concatenate(times)}
+
+
+def visits(events, variant="mode"):
+    """(visit, first_seen, arm, converted) per distinct visit, ordered by first_seen.
+
+    A visit's arm comes from its first event (normally the seat-page enter);
+    it converted if any METRIC_BOOKING_COMPLETED carries its id.
+    """
+    seen = np.concatenate([events.enter_time, events.done_time])
+    # log 本來就依時間排序：兩段各自有序時 stable sort 只做一次合併
+    by_time = np.argsort(seen, kind="stable")
+    seen = seen[by_time]
+    visit = np.concatenate([events.enter_visit, events.done_visit])[by_time]
+    arm = np.concatenate([getattr(events, f"enter_{variant}"), getattr(events, f"done_{variant}")])[by_time]
+    is_done = by_time >= events.enter_visit.size
+
+    # 依 visit 分組 (不需要 stable)：每組最小的位置就是最早的事件
+    order = np.argsort(visit)
+    grouped = visit[order]
+    starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]]) if grouped.size else np.empty(0, np.intp)
+    first = np.minimum.reduceat(order, starts) if starts.size else starts
+    converted = np.zeros(visit.size, dtype=bool)
+    converted[first] = np.logical_or.reduceat(is_done[order], starts) if starts.size else False
+    picked = np.zeros(visit.size, dtype=bool)
+    picked[first] = True
+    positions = np.flatnonzero(picked)
+    return visit[positions], seen[positions], arm[positions], converted[positions]
+
+
+def _binned(x, bins):
+    """Sorted bin means and counts: ``x`` split into at most ``bins`` equal-count bins."""
+    x = np.sort(x)
+    if x.size <= bins:
+        return x, np.ones(x.size, dtype=np.int64)
+    starts = np.linspace(0, x.size, bins, endpoint=False).astype(np.int64)
+    counts = np.diff(np.r_[starts, x.size])
+    return np.add.reduceat(x, starts) / counts, counts
+
+
+def bootstrap(x, n_boot=2000, bins=2048, rng=None):
+    """(means, medians): ``n_boot`` bootstrap replicates of the mean and median of ``x``.
+
+    Rows are grouped into ``bins`` equal-count bins first, so a replicate is
+    one multinomial draw over the bins rather than a resample of every row:
+    the cost no longer grows with ``len(x)``.
+    """
+    rng = rng or np.random.default_rng()
+    x = np.asarray(x, dtype=np.float64)
+    if x.size == 0:
+        return np.full(n_boot, np.nan), np.full(n_boot, np.nan)
+    values, counts = _binned(x, bins)
+    draws = rng.multinomial(x.size, counts / counts.sum(), size=n_boot)
+    medians = values[np.argmax(np.cumsum(draws, axis=1) >= x.size / 2, axis=1)]
+    return draws @ values / x.size, medians
+
+
+def bootstrap_rate(successes, n, n_boot=2000, rng=None):
+    """Bootstrap replicates of a conversion rate (resampling n Bernoulli rows = one binomial draw)."""
+    rng = rng or np.random.default_rng()
+    return rng.binomial(n, successes / n, size=n_boot) / n if n else np.full(n_boot, np.nan)
+
+
+def interval(samples, alpha=0.05):
+    samples = samples[np.isfinite(samples)]
+    if samples.size == 0:
+        return [float("nan"), float("nan")]
+    lo, hi = np.percentile(samples, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    return [float(lo), float(hi)]
+
+
+def sequential_test(arm, values, control, treatment, alpha=0.05, tau=None, min_samples=100, times=None, looks=10_000):
+    """mSPRT (Johari et al., "Always Valid Inference") for treatment - control.
+
+    ``values`` are taken in arrival order and the always-valid p-value is
+    computed from running sums at ``looks`` evenly spaced points, so peeking
+    at any of them keeps the false-positive rate at ``alpha``. ``tau`` is the
+    scale of effects we care about (default: 10% of the control mean).
+    """
+    arm = np.asarray(arm)
+    values = np.asarray(values, dtype=np.float64)
+    selected = (arm == control) | (arm == treatment)
+    is_b = arm[selected] == treatment
+    x = values[selected]
+    if x.size == 0:
+        return {"samples": 0, "estimate": float("nan"), "p_value": 1.0, "stopped": False, "stop_after": None, "stop_time": None}
+
+    at = np.unique(np.linspace(0, x.size - 1, min(x.size, looks)).astype(np.int64))
+    n_b = np.cumsum(is_b)[at]
+    n_a = at + 1 - n_b
+    xb = np.where(is_b, x, 0.0)
+    s_b, s = np.cumsum(xb)[at], np.cumsum(x)[at]
+    q_b, q = np.cumsum(xb * x)[at], np.cumsum(x * x)[at]
+    s_a, q_a = s - s_b, q - q_b
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_a, mean_b = s_a / n_a, s_b / n_b
+        var = (q_a / n_a - mean_a ** 2) / n_a + (q_b / n_b - mean_b ** 2) / n_b
+        theta = mean_b - mean_a
+        if tau is None:
+            tau = 0.1 * abs(mean_a[-1]) if np.isfinite(mean_a[-1]) and mean_a[-1] else 1.0
+        tau2 = tau * tau
+        log_lr = 0.5 * np.log(var / (var + tau2)) + theta ** 2 * tau2 / (2 * var * (var + tau2))
+    log_lr = np.where((n_a >= min_samples) & (n_b >= min_samples) & (var > 0), log_lr, -np.inf)
+    p_values = np.minimum(1.0, np.exp(-np.maximum.accumulate(log_lr)))
+    crossed = np.flatnonzero(p_values <= alpha)
+    stop = int(at[crossed[0]]) if crossed.size else None
+    return {
+        "samples": int(x.size),
+        "estimate": float(theta[-1]),
+        "p_value": float(p_values[-1]),
+        "stopped": stop is not None,
+        "stop_after": stop + 1 if stop is not None else None,
+        "stop_time": float(np.asarray(times)[selected][stop]) if stop is not None and times is not None else None,
+    }
+
+
+def _describe(x, n_boot, alpha, rng):
+    if x.size == 0:
+        return {"n": 0}, np.full(n_boot, np.nan), np.full(n_boot, np.nan)
+    means, medians = bootstrap(x, n_boot, rng=rng)
+    return {
+        "n": int(x.size),
+        "mean": float(x.mean()),
+        "median": float(np.median(x)),
+        "mean_ci": interval(means, alpha),
+        "median_ci": interval(medians, alpha),
+    }, means, medians
+
+
+def analyze(events, variant="mode", control=None, treatment=None, bookings=None, alpha=0.05, n_boot=2000, seed=None):
+    names = VARIANTS[variant]
+    default_control, default_treatment = DEFAULT_ARMS[variant]
+    control, treatment = control or default_control, treatment or default_treatment
+    rng = np.random.default_rng(seed)
+
+    _, seen, arm, converted = visits(events, variant)
+    done_order = np.argsort(events.done_time, kind="stable")
+    done_arm = getattr(events, f"done_{variant}")[done_order]
+    dwell = events.done_dwell[done_order]
+    dwell_ok = np.isfinite(dwell) & (dwell >= 0)
+
+    report = {"variant": variant, "control": control, "treatment": treatment, "alpha": alpha, "variants": {}}
+    replicates = {}
+    for code, name in enumerate(names):
+        in_arm = arm == code
+        n = int(in_arm.sum())
+        k = int(np.count_nonzero(converted & in_arm))
+        rates = bootstrap_rate(k, n, n_boot, rng)
+        dwell_stats, means, medians = _describe(dwell[dwell_ok & (done_arm == code)], n_boot, alpha, rng)
+        if n == 0 and dwell_stats["n"] == 0:
+            continue
+        report["variants"][name] = {
+            "visits": n,
+            "conversions": k,
+            "conversion_rate": k / n if n else None,
+            "conversion_ci": interval(rates, alpha) if n else None,
+            "dwell_s": dwell_stats,
+        }
+        replicates[name] = (rates, means, medians)
+
+    if control in replicates and treatment in replicates:
+        (rate_a, mean_a, median_a), (rate_b, mean_b, median_b) = replicates[control], replicates[treatment]
+        a, b = names.index(control), names.index(treatment)
+        report["difference"] = {
+            "conversion_ci": interval(rate_b - rate_a, alpha),
+            "dwell_mean_ci": interval(mean_b - mean_a, alpha),
+            "dwell_median_ci": interval(median_b - median_a, alpha),
+        }
+        report["sequential"] = {
+            "conversion": sequential_test(arm, converted, a, b, alpha, times=seen),
+            "dwell": sequential_test(done_arm[dwell_ok], dwell[dwell_ok], a, b, alpha, times=events.done_time[done_order][dwell_ok]),
+        }
+
+    if bookings is not None:
+        column = bookings[variant]
+        processing, means = {}, {}
+        for code, name in enumerate(names):
+            stats, means[name], _ = _describe(bookings["processing_ms"][column == code], n_boot, alpha, rng)
+            if stats["n"]:
+                processing[name] = stats
+        if control in processing and treatment in processing:
+            processing["difference_mean_ci"] = interval(means[treatment] - means[control], alpha)
+        report["processing_ms"] = processing
+    return report
+
+
+def print_report(report, out=sys.stdout):
+    print(f"=== {report['treatment']} vs {report['control']} ({report['variant']}) ===", file=out)
+    for name, row in report["variants"].items():
+        rate = "-" if row["conversion_rate"] is None else (
+            f"{row['conversion_rate']:.2%} [{row['conversion_ci'][0]:.2%}, {row['conversion_ci'][1]:.2%}]")
+        dwell = row["dwell_s"]
+        dwell_text = "-" if not dwell["n"] else (
+            f"mean {dwell['mean']:.1f}s [{dwell['mean_ci'][0]:.1f}, {dwell['mean_ci'][1]:.1f}], median {dwell['median']:.1f}s")
+        print(f"{name:<8} visits={row['visits']:<9} conversion={rate}  dwell={dwell_text}", file=out)
+    if "difference" in report:
+        diff = report["difference"]
+        print(f"轉換率差 {report['treatment']} - {report['control']}：[{diff['conversion_ci'][0]:+.2%}, {diff['conversion_ci'][1]:+.2%}]", file=out)
+        print(f"停留時間差 (平均)：[{diff['dwell_mean_ci'][0]:+.1f}s, {diff['dwell_mean_ci'][1]:+.1f}s]", file=out)
+        for metric, test in report["sequential"].items():
+            verdict = f"可在第 {test['stop_after']} 筆停止" if test["stopped"] else "尚未達到顯著，繼續收集"
+            print(f"mSPRT {metric}: p={test['p_value']:.4f} ({verdict})", file=out)
+    if "processing_ms" in report:
+        for name, row in report["processing_ms"].items():
+            if isinstance(row, dict):
+                print(f"processing {name}: mean {row['mean']:.1f}ms [{row['mean_ci'][0]:.1f}, {row['mean_ci'][1]:.1f}] n={row['n']}", file=out)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--log-file", default="-", help="log file with METRIC_* events ('-' = stdin)")
+    source.add_argument("--events", help="events saved earlier with --save (.npz)")
+    parser.add_argument("--save", help="save the parsed events to this .npz file")
+    parser.add_argument("--dsn", default=None, help="also compare processing time from the bookings table")
+    parser.add_argument("--variant", choices=sorted(VARIANTS), default="mode")
+    parser.add_argument("--control")
+    parser.add_argument("--treatment")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--bootstrap", type=int, default=2000, help="bootstrap replicates")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", dest="json_path", help="write the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.events:
+        events = ExperimentEvents.load(args.events)
+    else:
+        log = sys.stdin if args.log_file == "-" else open(args.log_file, encoding="utf-8", errors="replace")
+        with log:
+            events = ExperimentEvents.from_log(log)
+    if args.save:
+        events.save(args.save)
+
+    bookings = None
+    if args.dsn:
+        import psycopg2
+        conn = psycopg2.connect(args.dsn)
+        try:
+            bookings = load_bookings(conn)
+        finally:
+            conn.close()
+
+    report = analyze(events, args.variant, args.control, args.treatment, bookings, args.alpha, args.bootstrap, args.seed)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import os
+import shutil
+import sys
+import tempfile
+
+# 每個 worker 的 Prometheus 數值寫進這個目錄 (mmap)，/metrics 再把所有 worker 加總
+# prometheus_client 在 import 時就決定要不要用 mmap，所以一定要在任何 import 之前設定
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "cinema-prometheus"))
+
+from prometheus_flask_exporter.multiprocess import GunicornInternalPrometheusMetrics  # noqa: E402
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+# gthread：訂票卡在 DB lock 時，同一個 worker 仍有 thread 可以服務頁面與座位查詢
+# (訂票本身再由 app.booking_limiter 限流 (保留座位是另一個 app.hold_limiter)，每個 worker 各自計算，整體最多 workers × BOOKING_MAX_CONCURRENCY；
+#  每條 /api/seat-stream 也會佔住一個 thread，
+#  上限 SEAT_STREAM_MAX_CLIENTS 預設是 threads - 4，app.py 讀同一個 GUNICORN_THREADS)
+threads = int(os.environ.get("GUNICORN_THREADS", "16"))
+# app factory：import app 不碰 DB、不啟動 thread；create_app() 再啟動背景服務並在背景暖機
+wsgi_app = "app:create_app()"
+
+
+def on_starting(server):
+    # 清掉上一次執行留下的 .db 檔，否則已結束的 pid 會一直被算進去
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def post_fork(server, worker):
+    # preload_app 時 app 在 master 就 import 了，背景 thread 不會跟著 fork 過來
+    app_module = sys.modules.get("app")
+    if app_module is not None:
+        app_module.start_app()
+
+
+def worker_exit(server, worker):
+    # 正常結束 (重啟 / 縮減 worker) 前把還沒寫進 DB 的稽核紀錄寫完
+    app_module = sys.modules.get("app")
+    if app_module is not None:
+        app_module.booking_audit.close()
+
+
+def child_exit(server, worker):
+    GunicornInternalPrometheusMetrics.mark_process_dead_on_child_exit(worker.pid)
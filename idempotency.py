@@ -0,0 +1,80 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def fingerprint(*parts):
+    """Stable 64-char key for ``parts`` (used both in memory and in ``bookings.idempotency_key``)."""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("done", "result", "expires_at")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.expires_at = None
+
+
+class IdempotencyCache:
+    """Remembers the result of a booking for ``ttl`` seconds, keyed by idempotency key.
+
+    ``begin(key)`` either returns a stored result, or reserves the key for the
+    caller, who must then call ``complete(key, result)`` or ``release(key)``.
+    A duplicate that arrives while the first request is still running waits
+    up to ``wait_timeout`` seconds for its result instead of redoing the work;
+    ``InFlight`` is raised if it isn't ready by then. Only the most recent
+    ``maxsize`` keys are kept.
+    """
+
+    class InFlight(Exception):
+        pass
+
+    def __init__(self, ttl=600.0, maxsize=10000, wait_timeout=5.0, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.wait_timeout = wait_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at is not None and entry.expires_at <= now:
+            del self._entries[key]
+            return None
+        return entry
+
+    def begin(self, key):
+        with self._lock:
+            entry = self._live(key, self._clock())
+            if entry is None:
+                self._entries[key] = _Entry()
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                return None
+            if entry.expires_at is not None:
+                return entry.result
+        if not entry.done.wait(self.wait_timeout) or entry.result is None:
+            raise self.InFlight(key)
+        return entry.result
+
+    def complete(self, key, result, ttl=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            entry.result = result
+            entry.expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+            self._entries.move_to_end(key)
+        entry.done.set()
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at is None:
+                del self._entries[key]
+        if entry is not None:
+            entry.done.set()
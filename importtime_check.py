@@ -0,0 +1,109 @@
+"""Cold-start regression check: how long ``import app`` takes, from ``python -X importtime``.
+
+    python importtime_check.py                 # compare with benchmark_baseline.json ("import_app")
+    python importtime_check.py --save          # record a baseline for this machine
+    python importtime_check.py --top 15        # also list the slowest imports
+
+Every round imports the module in a fresh interpreter without DATABASE_URL,
+so nothing connects; the median of the cumulative import time is compared
+with this machine's baseline the same way test_benchmarks.py does (no
+baseline recorded here yet: nothing to compare). The check also fails
+when a module that should only load on first use (LAZY_MODULES) is imported.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+from benchmark import BaselineStore, summarize
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(HERE, "benchmark_baseline.json")
+# 只在第一次連 DB / 取樣 / 讀 toggles.yaml / render 頁面時才需要的套件
+LAZY_MODULES = ("psycopg2", "psutil", "featuretoggles", "brotli")
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_importtime(text):
+    """``-X importtime`` stderr -> [(module, self_seconds, cumulative_seconds, depth)] in output order.
+
+    The output is post-order: a module's own imports are listed (one level
+    deeper) right before it.
+    """
+    rows = []
+    for line in text.splitlines():
+        match = _LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            rows.append((name, int(own) / 1e6, int(cumulative) / 1e6, len(indent) // 2))
+    return rows
+
+
+def direct_imports(rows, module):
+    """The modules ``module`` imported itself (its children in the tree)."""
+    children = []
+    for name, _, cumulative, depth in rows:
+        if depth == 0:
+            if name == module:
+                return children
+            children = []
+        elif depth == 1:
+            children.append((cumulative, name))
+    return []
+
+
+def import_once(module="app", env=None):
+    env = dict(os.environ if env is None else env, DATABASE_URL="")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=HERE, env=env, capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def measure_import(module="app", rounds=5, env=None):
+    """Summary of the cumulative import time over ``rounds``, plus the parsed output of the last round."""
+    samples, rows = [], []
+    for _ in range(rounds):
+        rows = import_once(module, env)
+        samples.append(next(cumulative for name, _, cumulative, depth in rows if name == module and depth == 0))
+    return summarize(samples), rows
+
+
+def eager_lazy_modules(rows):
+    imported = {row[0] for row in rows}
+    return [name for name in LAZY_MODULES if name in imported]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=float(os.environ.get("BENCHMARK_TOLERANCE", "0.5")))
+    parser.add_argument("--top", type=int, default=0, help="list the N imports with the largest cumulative time")
+    parser.add_argument("--save", action="store_true", help="record this run as the new baseline")
+    args = parser.parse_args(argv)
+
+    result, rows = measure_import(args.module, args.rounds)
+    print(f"import {args.module}: median={result['median'] * 1000:.1f}ms min={result['min'] * 1000:.1f}ms rounds={result['rounds']}")
+    if args.top:
+        # 只列直接 import 的那一層，子模組的時間已經算在裡面
+        for cumulative, name in sorted(direct_imports(rows, args.module), reverse=True)[:args.top]:
+            print(f"  {cumulative * 1000:8.1f}ms  {name}")
+
+    failures = [f"{name} is imported by `import {args.module}` (should load on first use)" for name in eager_lazy_modules(rows)]
+    store = BaselineStore(BASELINE_PATH, tolerance=args.tolerance)
+    regression = store.check(f"import_{args.module}", result)
+    if args.save:
+        store.save()
+    elif regression:
+        failures.append(regression)
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
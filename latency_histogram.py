@@ -0,0 +1,90 @@
+import math
+
+
+class LatencyHistogram:
+    """HDR-style log-linear histogram of latencies.
+
+    Values are recorded in whole ``unit``s (microseconds by default). Below
+    ``2 ** precision_bits`` every value has its own bucket; above that each
+    power of two is split into ``2 ** (precision_bits - 1)`` equal buckets, so
+    a reported percentile is within ~``2 ** -(precision_bits - 1)`` (1.6% at
+    the default 7 bits) of the true value, at any magnitude, with a few
+    hundred sparse buckets. Histograms with the same settings can be merged.
+    """
+
+    def __init__(self, precision_bits=7, unit=1e-6):
+        self.precision_bits = precision_bits
+        self.unit = unit
+        self._counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def _index(self, value):
+        b = self.precision_bits
+        if value < (1 << b):
+            return value
+        shift = value.bit_length() - b
+        top = value >> shift
+        return (1 << b) + (shift - 1) * (1 << (b - 1)) + (top - (1 << (b - 1)))
+
+    def _bounds(self, index):
+        b = self.precision_bits
+        if index < (1 << b):
+            return index, index
+        shift, offset = divmod(index - (1 << b), 1 << (b - 1))
+        shift += 1
+        top = offset + (1 << (b - 1))
+        return top << shift, ((top + 1) << shift) - 1
+
+    def record(self, seconds, count=1):
+        value = max(0, int(seconds / self.unit))
+        index = self._index(value)
+        self._counts[index] = self._counts.get(index, 0) + count
+        self.count += count
+        self.total += seconds * count
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        if (other.precision_bits, other.unit) != (self.precision_bits, self.unit):
+            raise ValueError("histograms must share precision_bits and unit to merge")
+        for index, n in other._counts.items():
+            self._counts[index] = self._counts.get(index, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, q):
+        """``q`` in [0, 100]; the midpoint of the bucket holding that rank, in seconds."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q / 100.0 * self.count))
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= rank:
+                low, high = self._bounds(index)
+                return min(self.max, max(self.min, (low + high) / 2 * self.unit))
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def buckets(self):
+        """``[(low_seconds, high_seconds, count), ...]`` for the non-empty buckets."""
+        return [
+            (low * self.unit, (high + 1) * self.unit, self._counts[index])
+            for index in sorted(self._counts)
+            for low, high in [self._bounds(index)]
+        ]
+
+    def summary(self, percentiles=(50, 90, 95, 99, 99.9)):
+        result = {"count": self.count, "mean": self.mean, "min": self.min if self.count else 0.0, "max": self.max}
+        for q in percentiles:
+            result[f"p{q:g}"] = self.percentile(q)
+        return result
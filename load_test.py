@@ -0,0 +1,320 @@
+"""Open-loop load test for the booking flow (asyncio + aiohttp).
+
+    python load_test.py --target http://127.0.0.1:5000 --rate 200 --duration 60 \\
+        --mix guest=6,member=3,browse=1 --json report.json --csv report.csv
+
+Virtual users arrive as a Poisson process at ``--rate`` per second no matter
+how slow the server gets (open loop), so queueing shows up as latency instead
+of silently lowering the offered load. Each one walks the same steps as
+``traffic_generator.py`` with its own cookie jar: guest (init-flow ->
+seat-config -> book), member (login -> seat-config -> book) or browse (index
+-> seat-config). Auto or manual seating follows whatever the server says.
+Per-endpoint latency histograms, status codes and error kinds are printed
+and optionally written as JSON / CSV.
+"""
+import argparse
+import asyncio
+import base64
+import csv
+import json
+import random
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import aiohttp
+
+from latency_histogram import LatencyHistogram
+
+PERCENTILES = (50, 90, 95, 99, 99.9)
+PREFERENCES = ("center", "aisle", "back", "front")
+
+
+class EndpointStats:
+    __slots__ = ("histogram", "statuses", "errors")
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.statuses = Counter()
+        self.errors = Counter()
+
+    def observe(self, seconds, status=None, error=None):
+        self.histogram.record(seconds)
+        if status is not None:
+            self.statuses[str(status)] += 1
+        if error:
+            self.errors[error] += 1
+
+    def report(self, elapsed):
+        requests = self.histogram.count
+        errors = sum(self.errors.values())
+        latency = self.histogram.summary(PERCENTILES)
+        return {
+            "requests": requests,
+            "rps": requests / elapsed if elapsed else 0.0,
+            "errors": errors,
+            "error_rate": errors / requests if requests else 0.0,
+            "status": dict(self.statuses),
+            "error_kinds": dict(self.errors),
+            "latency_ms": {k: (v * 1000 if k != "count" else v) for k, v in latency.items()},
+            "histogram": [[low * 1000, high * 1000, n] for low, high, n in self.histogram.buckets()],
+        }
+
+
+class LoadStats:
+    def __init__(self):
+        self.endpoints = defaultdict(EndpointStats)
+        self.scenarios = defaultdict(EndpointStats)
+        self.arrivals = 0
+        self.dropped = 0
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+
+    def report(self, config):
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        return {
+            "target": config.target,
+            "rate": config.rate,
+            "duration_s": elapsed,
+            "arrivals": self.arrivals,
+            "dropped_arrivals": self.dropped,
+            "endpoints": {name: s.report(elapsed) for name, s in sorted(self.endpoints.items())},
+            "scenarios": {name: s.report(elapsed) for name, s in sorted(self.scenarios.items())},
+        }
+
+
+def classify(status, body):
+    if status < 400:
+        return None
+    try:
+        error = json.loads(body).get("error")
+    except (ValueError, AttributeError):
+        error = None
+    return f"http_{status}" + (f": {error}" if error else "")
+
+
+class VirtualUser:
+    def __init__(self, http, config, stats):
+        self.http = http
+        self.config = config
+        self.stats = stats
+
+    async def call(self, name, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            async with self.http.request(method, self.config.target + path, **kwargs) as resp:
+                body = await resp.read()
+        except asyncio.TimeoutError:
+            self.stats.endpoints[name].observe(time.perf_counter() - start, error="timeout")
+            raise
+        except aiohttp.ClientError as e:
+            self.stats.endpoints[name].observe(time.perf_counter() - start, error=type(e).__name__)
+            raise
+        self.stats.endpoints[name].observe(time.perf_counter() - start, resp.status, classify(resp.status, body))
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+        return resp.status, data
+
+    def _show_query(self):
+        return f"&show_id={self.config.show_id}" if self.config.show_id else ""
+
+    async def seat_config(self):
+        status, config = await self.call("seat_config", "GET", "/api/seat-config?format=compact" + self._show_query())
+        if status != 200 or not config:
+            return None, None
+        if config["mode"] != "manual":
+            return config, None
+        status, layout = await self.call("seat_layout", "GET", config["layout"])
+        if status != 200 or not layout:
+            return None, None
+        sold = base64.b64decode(config["sold"])
+        free = [
+            layout["rows"][i // layout["cols"]] + str(i % layout["cols"] + 1)
+            for i in range(len(layout["rows"]) * layout["cols"])
+            if not (sold[i >> 3] >> (7 - (i & 7))) & 1
+        ]
+        return config, free
+
+    async def book(self, config, free, payload):
+        count = random.randint(1, self.config.max_seats)
+        payload.update(show_id=self.config.show_id, count=count)
+        if config["mode"] == "auto":
+            payload["preference"] = random.choice(PREFERENCES)
+        else:
+            if len(free) < count:
+                return "sold_out"
+            payload["selected_seats"] = random.sample(free, count)
+        await asyncio.sleep(random.uniform(0, self.config.think_time))
+        # 逾時重送沿用同一個 Idempotency-Key
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        for attempt in range(self.config.retries + 1):
+            try:
+                status, _ = await self.call("book", "POST", "/api/book", json=payload, headers=headers)
+                return "ok" if status == 200 else f"book_{status}"
+            except asyncio.TimeoutError:
+                if attempt == self.config.retries:
+                    return "book_timeout"
+
+    async def guest(self):
+        status, flow = await self.call("init_flow", "GET", "/api/init-flow")
+        if status != 200 or not flow or flow.get("target") != "booking_guest.html":
+            return "guest_checkout_off"
+        config, free = await self.seat_config()
+        if config is None:
+            return "seat_config_failed"
+        return await self.book(config, free, {"email": f"load{random.randint(0, 10 ** 9)}@example.com"})
+
+    async def member(self):
+        status, _ = await self.call("login", "POST", "/api/login", json={"username": self.config.username, "password": self.config.password})
+        if status != 200:
+            return "login_failed"
+        config, free = await self.seat_config()
+        if config is None:
+            return "seat_config_failed"
+        return await self.book(config, free, {})
+
+    async def browse(self):
+        await self.call("index", "GET", "/")
+        config, _ = await self.seat_config()
+        return "ok" if config is not None else "seat_config_failed"
+
+
+async def user_session(connector, config, stats, scenario, scheduled_at):
+    # 每個虛擬使用者一個 cookie jar (= 一個瀏覽器)，連線池共用
+    async with aiohttp.ClientSession(
+        connector=connector, connector_owner=False,
+        cookie_jar=aiohttp.CookieJar(unsafe=True),
+        timeout=aiohttp.ClientTimeout(total=config.timeout),
+    ) as http:
+        try:
+            outcome = await getattr(VirtualUser(http, config, stats), scenario)()
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            outcome = "timeout" if isinstance(e, asyncio.TimeoutError) else type(e).__name__
+    # 從「預定抵達時間」起算，client 端排隊也算進去 (避免 coordinated omission)
+    stats.scenarios[scenario].observe(time.perf_counter() - scheduled_at, error=None if outcome == "ok" else outcome)
+
+
+def parse_mix(spec):
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, weight = item.partition("=")
+        if name not in ("guest", "member", "browse"):
+            raise argparse.ArgumentTypeError(f"unknown scenario: {name}")
+        weights[name] = float(weight or 1)
+    if not weights or sum(weights.values()) <= 0:
+        raise argparse.ArgumentTypeError("mix needs at least one scenario with a positive weight")
+    return weights
+
+
+def arrival_gaps(rate, poisson=True, rng=random):
+    while True:
+        yield rng.expovariate(rate) if poisson else 1.0 / rate
+
+
+async def run(config):
+    stats = LoadStats()
+    scenarios, weights = zip(*config.mix.items())
+    connector = aiohttp.TCPConnector(limit=config.connections)
+    tasks = set()
+    loop = asyncio.get_running_loop()
+    try:
+        start = loop.time()
+        next_at = start
+        gaps = arrival_gaps(config.rate, config.arrivals == "poisson")
+        stats.started_at = time.perf_counter()
+        while next_at - start < config.duration:
+            delay = next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            stats.arrivals += 1
+            if len(tasks) >= config.max_users:
+                stats.dropped += 1
+            else:
+                scheduled_at = time.perf_counter() - (loop.time() - next_at)
+                task = asyncio.ensure_future(user_session(connector, config, stats, random.choices(scenarios, weights)[0], scheduled_at))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            next_at += next(gaps)
+        if tasks:
+            await asyncio.wait(tasks, timeout=config.timeout * (config.retries + 2))
+    finally:
+        for task in tasks:
+            task.cancel()
+        stats.finished_at = time.perf_counter()
+        await connector.close()
+    return stats
+
+
+def write_csv(report, path):
+    fields = ["kind", "name", "requests", "rps", "errors", "error_rate"] + [f"p{q:g}_ms" for q in PERCENTILES] + ["mean_ms", "max_ms"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        for kind in ("endpoints", "scenarios"):
+            for name, row in report[kind].items():
+                latency = row["latency_ms"]
+                writer.writerow(
+                    [kind[:-1], name, row["requests"], f"{row['rps']:.2f}", row["errors"], f"{row['error_rate']:.4f}"]
+                    + [f"{latency[f'p{q:g}']:.2f}" for q in PERCENTILES]
+                    + [f"{latency['mean']:.2f}", f"{latency['max']:.2f}"]
+                )
+
+
+def print_report(report, out=sys.stdout):
+    print(f"target={report['target']} rate={report['rate']}/s duration={report['duration_s']:.1f}s "
+          f"arrivals={report['arrivals']} dropped={report['dropped_arrivals']}", file=out)
+    header = f"{'':<22}{'reqs':>8}{'rps':>9}{'err%':>8}" + "".join(f"{f'p{q:g}':>10}" for q in PERCENTILES) + f"{'max':>10}"
+    for kind in ("endpoints", "scenarios"):
+        print(f"\n{header}", file=out)
+        for name, row in report[kind].items():
+            latency = row["latency_ms"]
+            print(f"{kind[:-1] + ':' + name:<22}{row['requests']:>8}{row['rps']:>9.1f}{row['error_rate'] * 100:>7.2f}%"
+                  + "".join(f"{latency[f'p{q:g}']:>8.1f}ms" for q in PERCENTILES) + f"{latency['max']:>8.1f}ms", file=out)
+            for kind_name, n in sorted(row["error_kinds"].items(), key=lambda kv: -kv[1])[:5]:
+                print(f"    {n:>8}  {kind_name}", file=out)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target", default="http://127.0.0.1:5000", help="base URL, e.g. http://127.0.0.1:5000")
+    parser.add_argument("--rate", type=float, default=20.0, help="virtual-user arrivals per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep arriving")
+    parser.add_argument("--arrivals", choices=("poisson", "uniform"), default="poisson")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("guest=6,member=3,browse=1"))
+    parser.add_argument("--max-users", type=int, default=5000, help="concurrent virtual users before arrivals are dropped")
+    parser.add_argument("--connections", type=int, default=500, help="max open TCP connections")
+    parser.add_argument("--timeout", type=float, default=10.0, help="per-request timeout in seconds")
+    parser.add_argument("--retries", type=int, default=1, help="booking retries after a timeout")
+    parser.add_argument("--think-time", type=float, default=0.3, help="max seconds between seat-config and book")
+    parser.add_argument("--max-seats", type=int, default=2)
+    parser.add_argument("--show-id", type=int, default=None)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="1234")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--csv", dest="csv_path")
+    config = parser.parse_args(argv)
+    config.target = config.target.rstrip("/")
+    return config
+
+
+def main(argv=None):
+    config = parse_args(argv)
+    if config.seed is not None:
+        random.seed(config.seed)
+    stats = asyncio.run(run(config))
+    report = stats.report(config)
+    print_report(report)
+    if config.json_path:
+        with open(config.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if config.csv_path:
+        write_csv(report, config.csv_path)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import re
+
+_SEAT_CODE = re.compile(r"^([A-Za-z]+)(\d+)$")
+
+
+def _bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _runs(mask, count):
+    # bit i 有值 = 從 i 開始連續 count 個位子都在 mask 內
+    runs = mask
+    for k in range(1, count):
+        runs &= mask >> k
+    return runs
+
+
+class SeatIndex:
+    """Per-row occupancy bitmaps for contiguous auto-seating.
+
+    Built once from the static ``(seat_code, seat_type)`` layout; bit ``c - 1``
+    of a row mask stands for column ``c``. Occupancy comes from a
+    ``SeatSnapshot`` and is recomputed only when the snapshot version changes.
+    """
+
+    def __init__(self, seats):
+        self.codes = {}      # row -> {bit: seat_code}
+        self.row_masks = {}  # row -> every seat in the row
+        self.type_masks = {} # seat_type -> {row -> mask}
+        self.positions = {}  # seat_code -> (row, bit)
+        for code, seat_type in seats:
+            match = _SEAT_CODE.match(code)
+            if not match:
+                continue
+            row, bit = match.group(1), int(match.group(2)) - 1
+            self.codes.setdefault(row, {})[bit] = code
+            self.row_masks[row] = self.row_masks.get(row, 0) | (1 << bit)
+            per_row = self.type_masks.setdefault(seat_type, {})
+            per_row[row] = per_row.get(row, 0) | (1 << bit)
+            self.positions[code] = (row, bit)
+        self.rows = sorted(self.codes, key=lambda r: (len(r), r))
+        self._occupancy = (None, {})
+
+    def __len__(self):
+        return len(self.positions)
+
+    def free_masks(self, snapshot):
+        version, masks = self._occupancy
+        if version == snapshot.version:
+            return masks
+        taken = {}
+        for code in snapshot.sold:
+            pos = self.positions.get(code)
+            if pos:
+                taken[pos[0]] = taken.get(pos[0], 0) | (1 << pos[1])
+        masks = {row: mask & ~taken.get(row, 0) for row, mask in self.row_masks.items()}
+        self._occupancy = (snapshot.version, masks)
+        return masks
+
+    def _ideal_row(self, pref):
+        last = len(self.rows) - 1
+        if pref == "front":
+            return 0
+        if pref == "back":
+            return last
+        return last / 2
+
+    def _block(self, row, start, count):
+        return [self.codes[row][b] for b in range(start, start + count)]
+
+    def find_block(self, snapshot, count, pref=None, exclude=()):
+        """Return ``count`` seat codes for ``pref``, or None if they don't fit.
+
+        Preference order: a contiguous block made only of ``pref`` seats, then
+        a contiguous block that includes at least one ``pref`` seat (e.g. a
+        party next to the aisle), then any ``count`` free ``pref`` seats.
+        Within a tier, rows nearer the preferred depth and blocks nearer the
+        middle of the row win.
+        """
+        if count < 1 or not self.rows:
+            return None
+        free = self.free_masks(snapshot)
+        if exclude:
+            free = dict(free)
+            for code in exclude:
+                pos = self.positions.get(code)
+                if pos:
+                    free[pos[0]] &= ~(1 << pos[1])
+        type_masks = self.type_masks.get(pref) if pref in self.type_masks else None
+        ideal = self._ideal_row(pref)
+
+        best = None
+        for r_idx, row in enumerate(self.rows):
+            row_free = free[row]
+            wanted = type_masks.get(row, 0) if type_masks is not None else self.row_masks[row]
+            mid = (self.row_masks[row].bit_length() - 1) / 2
+            for tier, runs in ((0, _runs(row_free & wanted, count)), (1, _runs(row_free, count))):
+                for start in _bits(runs):
+                    if tier == 1 and not (wanted >> start) & ((1 << count) - 1):
+                        continue
+                    score = (tier, abs(r_idx - ideal), abs(start + (count - 1) / 2 - mid), start)
+                    if best is None or score < best[0]:
+                        best = (score, row, start)
+                if best is not None and best[0][0] == 0:
+                    break
+
+        if best is not None:
+            _, row, start = best
+            return self._block(row, start, count)
+
+        # 連不成一排：退回舊行為，依順序取 count 個符合偏好的空位
+        picked = []
+        for row in self.rows:
+            wanted = type_masks.get(row, 0) if type_masks is not None else self.row_masks[row]
+            for bit in _bits(free[row] & wanted):
+                picked.append(self.codes[row][bit])
+                if len(picked) == count:
+                    return picked
+        return None
@@ -0,0 +1,62 @@
+import logging
+import os
+import random
+import threading
+
+
+class HoldSweeper:
+    """Releases expired seat holds in bulk on a background thread.
+
+    ``sweep()`` releases one batch and returns how many seats it freed; a
+    full batch (``batch_size``) is followed immediately by the next one.
+    Every worker runs a sweeper, with a random offset so they don't all hit
+    the DB at once; concurrent sweeps skip rows the other one has locked.
+    Reads and claims already treat expired holds as free, so the sweeper only
+    has to keep the table (and the seat streams) tidy. ``start()`` is safe to
+    call again after a fork.
+    """
+
+    def __init__(self, sweep, interval=15.0, batch_size=500, released_counter=None):
+        self.sweep = sweep
+        self.interval = interval
+        self.batch_size = batch_size
+        self.released_counter = released_counter
+        self._pid = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        total = 0
+        while not self._stop.is_set():
+            try:
+                released = self.sweep(self.batch_size)
+            except Exception as e:
+                logging.error(f"HOLD_SWEEP_FAILED: {e}")
+                break
+            total += released
+            if self.released_counter is not None and released:
+                self.released_counter.inc(released)
+            if released < self.batch_size:
+                break
+        return total
+
+    def _run(self):
+        if self._stop.wait(random.uniform(0, self.interval)):
+            return
+        while True:
+            self.run_once()
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="hold-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,79 @@
+import base64
+import hashlib
+import json
+from collections import namedtuple
+from functools import lru_cache
+
+Layout = namedtuple("Layout", ["name", "rows", "cols", "aisle_cols", "front_rows", "back_rows"])
+
+# 每個影廳一份座位定義；tickets 由這裡批次產生，前後端的座位類型規則只有這一份
+AUDITORIUMS = {
+    "hall-1": Layout("hall-1", "ABCDEFGHIJ", 10, (1, 5, 6, 10), 3, 3),
+    "imax": Layout("imax", "ABCDEFGHIJKLMNOP", 24, (1, 6, 7, 18, 19, 24), 4, 4),
+}
+DEFAULT_AUDITORIUM = "hall-1"
+
+
+def seat_type(layout, r_idx, col):
+    if col in layout.aisle_cols:
+        return "aisle"
+    if r_idx < layout.front_rows:
+        return "front"
+    if r_idx >= len(layout.rows) - layout.back_rows:
+        return "back"
+    return "center"
+
+
+@lru_cache(maxsize=None)
+def seat_map(layout):
+    return tuple(
+        {"id": f"{row_char}{col}", "row": row_char, "col": col, "type": seat_type(layout, r_idx, col), "status": 0}
+        for r_idx, row_char in enumerate(layout.rows)
+        for col in range(1, layout.cols + 1)
+    )
+
+
+# --- 精簡格式：座位表 (幾乎不變，長時間快取) 與可售狀態 (每個座位 1 bit) 分開傳 ---
+TYPE_CODES = {"aisle": "a", "front": "f", "back": "b", "center": "c"}
+
+
+@lru_cache(maxsize=None)
+def seat_positions(layout):
+    return {s["id"]: i for i, s in enumerate(seat_map(layout))}
+
+
+@lru_cache(maxsize=None)
+def layout_fingerprint(layout):
+    return hashlib.blake2s(repr(tuple(layout)).encode("utf-8"), digest_size=6).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def layout_document(layout):
+    """Serialized static layout: seat ``i`` is ``rows[i // cols] + str(i % cols + 1)``."""
+    return json.dumps({
+        "name": layout.name,
+        "rows": layout.rows,
+        "cols": layout.cols,
+        "types": "".join(TYPE_CODES[s["type"]] for s in seat_map(layout)),
+        "type_codes": {code: name for name, code in TYPE_CODES.items()},
+    }, separators=(",", ":")).encode("utf-8")
+
+
+def sold_bits(layout, sold):
+    """Base64 bitmap in ``seat_map`` order, most significant bit first; 1 = sold."""
+    positions = seat_positions(layout)
+    bits = bytearray((len(positions) + 7) // 8)
+    for seat_id in sold:
+        i = positions.get(seat_id)
+        if i is not None:
+            bits[i >> 3] |= 0x80 >> (i & 7)
+    return base64.b64encode(bytes(bits)).decode("ascii")
+
+
+def make_layout(name, rows, cols):
+    # 沒有預先定義的影廳 (CLI 指定 --rows/--cols)：依 hall-1 的比例推出走道與前後排
+    if not 1 <= rows <= 26:
+        raise ValueError(f"rows must be between 1 and 26, got {rows}")
+    edge_rows = max(1, rows * 3 // 10)
+    aisle_cols = tuple(sorted({1, cols, (cols + 1) // 2, cols // 2 + 1}))
+    return Layout(name, "ABCDEFGHIJKLMNOPQRSTUVWXYZ"[:rows], cols, aisle_cols, edge_rows, edge_rows)
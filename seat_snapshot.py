@@ -0,0 +1,82 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+
+SeatSnapshot = namedtuple("SeatSnapshot", ["version", "sold", "loaded_at"])
+
+
+class SeatAvailabilityCache:
+    """Per-process, copy-on-write view of which seats are sold.
+
+    Readers get an immutable ``SeatSnapshot``; every change publishes a new
+    snapshot with a bumped version instead of mutating the old one. Snapshots
+    older than ``ttl`` seconds are reloaded through ``loader`` by one thread
+    while the others keep serving the previous version.
+    """
+
+    def __init__(self, loader, ttl=2.0, clock=time.monotonic):
+        self._loader = loader
+        self.ttl = ttl
+        self._clock = clock
+        self._refresh_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._snapshot = None
+        self._version = 0
+
+    def _publish(self, sold, loaded_at):
+        # caller holds _write_lock
+        self._version += 1
+        self._snapshot = SeatSnapshot(self._version, frozenset(sold), loaded_at)
+        return self._snapshot
+
+    def _is_fresh(self, snapshot):
+        return snapshot is not None and self._clock() - snapshot.loaded_at < self.ttl
+
+    def get(self):
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot):
+            return snapshot
+        # 只讓一個 thread 去查 DB，其他人先拿舊版本
+        if not self._refresh_lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            snapshot = self._snapshot
+            if self._is_fresh(snapshot):
+                return snapshot
+            started = self._clock()
+            try:
+                sold = self._loader()
+            except Exception as e:
+                logging.error(f"SEAT_SNAPSHOT_REFRESH_FAILED: {e}")
+                sold = None
+            if sold is None:
+                # 查不到就沿用舊資料，避免每個請求都重打 DB
+                sold = snapshot.sold if snapshot is not None else ()
+            with self._write_lock:
+                return self._publish(sold, started)
+        finally:
+            self._refresh_lock.release()
+
+    def mark_sold(self, seat_codes):
+        with self._write_lock:
+            current = self._snapshot
+            if current is None:
+                return
+            sold = current.sold.union(seat_codes)
+            if sold != current.sold:
+                self._publish(sold, current.loaded_at)
+
+    def mark_available(self, seat_codes):
+        with self._write_lock:
+            current = self._snapshot
+            if current is None:
+                return
+            sold = current.sold.difference(seat_codes)
+            if sold != current.sold:
+                self._publish(sold, current.loaded_at)
+
+    def invalidate(self):
+        with self._write_lock:
+            if self._snapshot is not None:
+                self._snapshot = self._snapshot._replace(loaded_at=float("-inf"))
@@ -0,0 +1,195 @@
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+SEAT_CHANNEL = "seat_changes"
+
+
+class SeatBroadcaster:
+    """Fans seat status changes out to the SSE clients of this worker.
+
+    Each subscriber gets a bounded queue; a client too slow to drain it is
+    marked ``stale`` instead of blocking the publisher, and the stream sends
+    it a full snapshot to resync.
+    """
+
+    def __init__(self, max_subscribers=2, queue_size=256, subscribers_gauge=None):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.subscribers_gauge = subscribers_gauge
+        self._lock = threading.Lock()
+        self._subscribers = {}  # show_id -> set[Subscription]
+
+    def subscribe(self, show_id):
+        """Returns a ``Subscription``, or None once ``max_subscribers`` are connected."""
+        with self._lock:
+            if sum(len(subs) for subs in self._subscribers.values()) >= self.max_subscribers:
+                return None
+            sub = Subscription(self, show_id, queue.Queue(maxsize=self.queue_size))
+            self._subscribers.setdefault(show_id, set()).add(sub)
+        if self.subscribers_gauge is not None:
+            self.subscribers_gauge.inc()
+        return sub
+
+    def _unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.show_id)
+            if not subs or sub not in subs:
+                return
+            subs.discard(sub)
+            if not subs:
+                del self._subscribers[sub.show_id]
+        if self.subscribers_gauge is not None:
+            self.subscribers_gauge.dec()
+
+    def publish(self, show_id, seats, status):
+        with self._lock:
+            subs = list(self._subscribers.get(show_id, ()))
+        event = {"seats": list(seats), "status": status}
+        for sub in subs:
+            try:
+                sub.queue.put_nowait(event)
+            except queue.Full:
+                sub.stale = True
+
+
+class Subscription:
+    __slots__ = ("broadcaster", "show_id", "queue", "stale")
+
+    def __init__(self, broadcaster, show_id, event_queue):
+        self.broadcaster = broadcaster
+        self.show_id = show_id
+        self.queue = event_queue
+        self.stale = False
+
+    def get(self, timeout):
+        """Next delta event, or None if nothing arrived within ``timeout``."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def resync(self):
+        """True (once) if events were dropped and the client needs a snapshot."""
+        if not self.stale:
+            return False
+        self.stale = False
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return True
+
+    def close(self):
+        self.broadcaster._unsubscribe(self)
+
+
+def _connect(dsn):
+    import psycopg2
+    return psycopg2.connect(dsn)
+
+
+class SeatChangeListener:
+    """LISTENs on ``seat_changes`` and hands every notification to ``callback(show_id, seats, status)``.
+
+    Bookings send the NOTIFY inside their own transaction, so it is delivered
+    only after commit, to every worker (including the one that booked). Uses
+    its own connection, not one from the pool, and reconnects with a backoff
+    if it drops. ``start()`` is fork-aware like ``SystemMetricsSampler``.
+    """
+
+    def __init__(self, dsn, callback, channel=SEAT_CHANNEL, poll_interval=5.0, connect=None):
+        self.dsn = dsn
+        self.callback = callback
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self._connect = connect or _connect
+        self._pid = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _dispatch(self, payload):
+        try:
+            event = json.loads(payload)
+            self.callback(int(event["show"]), event["seats"], int(event["status"]))
+        except Exception as e:
+            logging.error(f"SEAT_STREAM_BAD_NOTIFY payload={payload!r} error={e}")
+
+    def _listen(self, conn):
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {self.channel}")
+        while not self._stop.is_set():
+            if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                self._dispatch(conn.notifies.pop(0).payload)
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect(self.dsn)
+                backoff = 1.0
+                self._listen(conn)
+            except Exception as e:
+                logging.error(f"SEAT_STREAM_LISTEN_FAILED error={e}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def start(self):
+        if not self.dsn:
+            return
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="seat-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def sse_event(data, event=None):
+    lines = [f"event: {event}"] if event else []
+    lines.append("data: " + json.dumps(data, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+def stream_events(sub, snapshot, max_age=120.0, heartbeat=15.0, clock=time.monotonic):
+    """SSE body: a ``snapshot`` first, then ``seats`` deltas until ``max_age``.
+
+    ``snapshot()`` returns the currently sold seat ids. Comments keep idle
+    proxies from closing the connection; after ``max_age`` the stream ends
+    and ``EventSource`` reconnects, so no worker thread is held forever.
+    """
+    try:
+        yield "retry: 3000\n\n"
+        yield sse_event({"sold": sorted(snapshot())}, "snapshot")
+        deadline = clock() + max_age
+        while True:
+            remaining = deadline - clock()
+            if remaining <= 0:
+                return
+            event = sub.get(min(heartbeat, remaining))
+            if sub.resync():
+                yield sse_event({"sold": sorted(snapshot())}, "snapshot")
+            elif event is not None:
+                yield sse_event(event, "seats")
+            else:
+                yield ": keepalive\n\n"
+    finally:
+        sub.close()
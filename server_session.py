@@ -0,0 +1,166 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+
+
+class MemorySessionStore:
+    """In-process LRU of ``sid -> (payload, expires_at)``; for a single worker."""
+
+    def __init__(self, maxsize=10000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            item = self._items.get(sid)
+            if item is None:
+                return None
+            if item[1] <= self.clock():
+                del self._items[sid]
+                return None
+            self._items.move_to_end(sid)
+            return item[0], item[1] - self.clock()
+
+    def set(self, sid, payload, ttl):
+        with self._lock:
+            self._items[sid] = (payload, self.clock() + ttl)
+            self._items.move_to_end(sid)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._items.pop(sid, None)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class SqliteSessionStore:
+    """Sessions in a local SQLite file, shared by every gunicorn worker on the host.
+
+    One connection per thread (re-opened after fork); expired rows are
+    ignored on read and purged at most every ``purge_interval`` seconds.
+    """
+
+    def __init__(self, path, purge_interval=60, clock=time.time):
+        self.path = path
+        self.purge_interval = purge_interval
+        self.clock = clock
+        self._local = threading.local()
+        self._next_purge = 0
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_idx ON sessions (expires)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, sid):
+        now = self.clock()
+        row = self._connect().execute("SELECT data, expires FROM sessions WHERE id = ? AND expires > ?", (sid, now)).fetchone()
+        return None if row is None else (row[0], row[1] - now)
+
+    def set(self, sid, payload, ttl):
+        now = self.clock()
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)", (sid, payload, now + ttl))
+        if now >= self._next_purge:
+            self._next_purge = now + self.purge_interval
+            conn.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+
+    def delete(self, sid):
+        self._connect().execute("DELETE FROM sessions WHERE id = ?", (sid,))
+
+
+class ServerSession(SecureCookieSession):
+    """Same change/access tracking as Flask's session, plus where it is stored."""
+
+    def __init__(self, initial=None, sid=None, payload=None, remaining=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.payload = payload
+        self.remaining = remaining
+        self.identity = self._identity()
+        self.accessed = False
+
+    def _identity(self):
+        return self.get("role"), self.get("user_id")
+
+    @property
+    def new(self):
+        return self.payload is None
+
+    @property
+    def identity_changed(self):
+        return self.sid is not None and self._identity() != self.identity
+
+
+class ServerSessionInterface(SessionInterface):
+    """The cookie only carries an opaque random id; the data lives in ``store``.
+
+    Unlike the signed-cookie session there is nothing to verify or re-sign:
+    a response writes the store only when the serialized data changed (or
+    half the TTL has passed, to keep an active session alive) and sends
+    Set-Cookie only when the id is new. Guest sessions (``role == "guest"``)
+    expire after ``guest_ttl`` seconds of inactivity, others after ``ttl``.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, ttl=86400, guest_ttl=1800):
+        self.store = store
+        self.ttl = ttl
+        self.guest_ttl = guest_ttl
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and len(sid) <= 64:
+            found = self.store.get(sid)
+            if found is not None:
+                payload, remaining = found
+                return ServerSession(self.serializer.loads(payload), sid, payload, remaining)
+        return ServerSession()
+
+    def _ttl(self, session):
+        return self.guest_ttl if session.get("role") == "guest" else self.ttl
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        cookie = dict(domain=self.get_cookie_domain(app), path=self.get_cookie_path(app), secure=self.get_cookie_secure(app),
+                      samesite=self.get_cookie_samesite(app), httponly=self.get_cookie_httponly(app))
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified and session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, **cookie)
+            return
+
+        ttl = self._ttl(session)
+        payload = self.serializer.dumps(dict(session))
+        if payload == session.payload and session.remaining > ttl / 2:
+            return
+        # 登入 / 換身分時換一個新的 id，舊 id 作廢 (避免 session fixation)
+        if session.identity_changed:
+            self.store.delete(session.sid)
+            session.sid = None
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(24)
+            response.set_cookie(name, session.sid, **cookie)
+        self.store.set(session.sid, payload, ttl)
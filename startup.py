@@ -0,0 +1,61 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """Wall time of each startup phase (imports, toggles, warm-up...), in seconds.
+
+    ``mark(name)`` closes a phase that started at the previous mark (or at
+    ``started``); ``phase(name)`` times a block, which may run on another
+    thread. ``export()`` copies the phases into a gauge labelled by phase.
+    """
+
+    def __init__(self, started=None, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock() if started is None else started
+        self.phases = {}
+        self._last = self.started
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        now = self.clock()
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + now - self._last
+            self._last = now
+
+    @contextmanager
+    def phase(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            elapsed = self.clock() - start
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def total(self):
+        return self.clock() - self.started
+
+    def export(self, gauge):
+        with self._lock:
+            phases = dict(self.phases)
+        for name, seconds in phases.items():
+            gauge.labels(phase=name).set(seconds)
+        return phases
+
+
+def run_in_background(name, steps):
+    """Runs ``steps`` (callables) one after another on a daemon thread; a failing step doesn't stop the rest."""
+
+    def run():
+        for step in steps:
+            try:
+                step()
+            except Exception as e:
+                logging.error(f"WARMUP_FAILED step={getattr(step, '__name__', step)} error={e}")
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
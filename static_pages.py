@@ -0,0 +1,89 @@
+import gzip
+import hashlib
+
+from werkzeug.http import parse_accept_header, parse_etags
+
+
+class PrerenderedPage:
+    """One page rendered once, with its gzip (and brotli) bodies and their ETags."""
+
+    def __init__(self, name, body, content_type="text/html; charset=utf-8"):
+        self.name = name
+        self.content_type = content_type
+        digest = hashlib.blake2s(body, digest_size=10).hexdigest()
+        self.variants = {None: (body, f'"{digest}"')}
+        self.variants["gzip"] = (gzip.compress(body, 9, mtime=0), f'"{digest}-gz"')
+        # brotli 只在 render 頁面時用到，不放在 import 路徑上
+        try:
+            import brotli
+        except ImportError:  # 沒裝 brotli 時只提供 gzip
+            return
+        self.variants["br"] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+
+
+class PrerenderedPages:
+    """WSGI middleware answering GET/HEAD for fixed pages before Flask sees the request.
+
+    The pages (templates without context) are rendered and compressed once;
+    a hit only picks the encoding, compares ETags and bumps ``view_counter``
+    (labelled by page), with no request context, session, before/after_request
+    hooks or Flask extensions (CORS headers, per-request metrics), so
+    ``on_view(page_name)`` only gets the page name. Anything else goes to
+    ``app``, and so does every page until ``load()`` is called (pages can be
+    rendered after startup).
+    """
+
+    def __init__(self, app, pages=None, max_age=60, view_counter=None, on_view=None):
+        self.app = app
+        self.cache_control = f"public, max-age={max_age}"
+        self.view_counter = view_counter
+        self.on_view = on_view
+        self.pages = {}
+        self._views = {}
+        if pages:
+            self.load(pages)
+
+    def load(self, pages):
+        """``pages``: path -> PrerenderedPage; replaces the current set in one assignment."""
+        views = {path: self.view_counter.labels(page=page.name) for path, page in pages.items()} if self.view_counter is not None else {}
+        self._views, self.pages = views, dict(pages)
+
+    @staticmethod
+    def choose_encoding(page, accept_encoding):
+        if not accept_encoding:
+            return None
+        accepted = parse_accept_header(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in page.variants and accepted[encoding] > 0:
+                return encoding
+        return None
+
+    def __call__(self, environ, start_response):
+        page = self.pages.get(environ.get("PATH_INFO"))
+        method = environ.get("REQUEST_METHOD")
+        if page is None or method not in ("GET", "HEAD"):
+            return self.app(environ, start_response)
+
+        encoding = self.choose_encoding(page, environ.get("HTTP_ACCEPT_ENCODING"))
+        body, etag = page.variants[encoding]
+        headers = [
+            ("Content-Type", page.content_type),
+            ("ETag", etag),
+            ("Cache-Control", self.cache_control),
+            ("Vary", "Accept-Encoding"),
+        ]
+        if method == "GET":
+            counter = self._views.get(environ["PATH_INFO"])
+            if counter is not None:
+                counter.inc()
+            if self.on_view is not None:
+                self.on_view(page.name)
+
+        if parse_etags(environ.get("HTTP_IF_NONE_MATCH")).contains_weak(etag.strip('"')):
+            start_response("304 Not Modified", headers)
+            return []
+        if encoding is not None:
+            headers.append(("Content-Encoding", encoding))
+        headers.append(("Content-Length", str(len(body))))
+        start_response("200 OK", headers)
+        return [] if method == "HEAD" else [body]
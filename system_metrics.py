@@ -0,0 +1,51 @@
+import logging
+import os
+import threading
+
+
+class SystemMetricsSampler:
+    """Samples CPU / RSS on a background thread instead of per request.
+
+    Each worker labels its samples with its own pid. ``start()`` is safe to
+    call again after a fork: threads don't survive ``fork()``, so a sampler
+    inherited from the gunicorn master is restarted for the new pid.
+    """
+
+    def __init__(self, cpu_gauge, memory_gauge, interval=5.0):
+        self.cpu_gauge = cpu_gauge
+        self.memory_gauge = memory_gauge
+        self.interval = interval
+        self._pid = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        try:
+            worker = str(self._pid)
+            self.cpu_gauge.labels(worker=worker).set(self._psutil.cpu_percent(interval=None))
+            self.memory_gauge.labels(worker=worker).set(self._process.memory_info().rss)
+        except Exception as e:
+            logging.error(f"Metrics error: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        # psutil 等真的開始取樣才 import，不拖慢 app 的 import
+        import psutil
+        self._psutil = psutil
+        self._pid = os.getpid()
+        self._process = psutil.Process(self._pid)
+        self._stop = threading.Event()
+        # 第一次呼叫 cpu_percent 只是建立基準，之後每個 interval 取一次
+        self.sample()
+        self._thread = threading.Thread(target=self._run, name="system-metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -2,15 +2,89 @@ import pytest
 from app import app
 from flask import session
 
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+class FakeConn:
+    def __init__(self, rows=()):
+        self.cur = FakeCursor(rows)
+        self.closed = 0
+        self.committed = False
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
 # --- 測試環境設定 (Fixture) ---
 @pytest.fixture
-def client():
+def client(monkeypatch):
     app.config['TESTING'] = True
     app.secret_key = 'test-secret-key'
+    # 稽核紀錄預設 async，測試的假訂單不要留在 buffer 裡 (atexit 時會真的去寫 DB)
+    monkeypatch.setattr('app.BOOKING_AUDIT_MODE', 'off')
     # 使用 Flask 的測試客戶端，這樣不用真的啟動伺服器也能測
     with app.test_client() as client:
         yield client
 
+@pytest.fixture
+def member_client(client):
+    with client.session_transaction() as sess:
+        sess['role'] = 'member'
+        sess['user_id'] = 'admin'
+    return client
+
+@pytest.fixture
+def guest_client(client):
+    with client.session_transaction() as sess:
+        sess['role'] = 'guest'
+        sess['guest_token'] = 'tok'
+    return client
+
+@pytest.fixture
+def fake_db(mocker):
+    """fake_db(*rows)：換掉連線池，rows 依序是每次 fetchone() 的結果；回傳 FakeConn"""
+    def install(*rows):
+        conn = FakeConn(rows=rows)
+        mocker.patch('app.get_db_connection', return_value=conn)
+        mocker.patch('app.release_db_connection')
+        return conn
+    return install
+
+@pytest.fixture
+def manual_seating(mocker):
+    """手動選位模式，場次固定是 hall-1 的座位表"""
+    import app as app_module
+    mocker.patch('app.toggles.auto_seating', False)
+    mocker.patch('app.get_show_layout', return_value=app_module.AUDITORIUMS["hall-1"])
+
+@pytest.fixture
+def prerendered():
+    import app as app_module
+    app_module.prerender_pages()  # 平常由啟動後的背景暖機執行
+    yield app_module.prerendered_pages
+    # 清掉，之後的測試才會再經過 Flask 的 route
+    app_module.prerendered_pages.load({})
+
 # --- 測試案例 1: 驗證 Toggle OFF (回歸測試) ---
 def test_toggle_off_redirects_to_login(client, mocker):
     """
@@ -79,4 +153,432 @@ def test_security_violation_no_session(client):
     
     # [Assert] 預期系統要擋下來 (401 Unauthorized)
     assert response.status_code == 401
-    assert "Unauthorized" in response.get_json()['error']
\ No newline at end of file
+    assert "Unauthorized" in response.get_json()['error']
+
+# --- 測試案例 5: 連線池耗盡時回傳 503 (而不是卡住 worker) ---
+def test_book_returns_503_when_pool_exhausted(client, mocker):
+    """
+    場景：尖峰時段 DB 連線池被借光，訂票 API 應快速回 503 並帶 Retry-After
+    """
+    from db_pool import PoolTimeout
+    mocker.patch('app.db_pool', mocker.Mock(getconn=mocker.Mock(side_effect=PoolTimeout("busy"))))
+    with client.session_transaction() as sess:
+        sess['role'] = 'member'
+        sess['user_id'] = 'admin'
+
+    response = client.post('/api/book', json={"selected_seats": ["A1"]})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+# --- 測試案例 6: 手動選位讀取快照，且不會改到共用的座位表 ---
+def test_manual_seat_config_uses_snapshot_without_mutating_seat_map(client, mocker):
+    """
+    場景：手動模式下查詢座位，已售座位標記為 1，但快取的座位表保持乾淨
+    """
+    import app as app_module
+    layout = app_module.AUDITORIUMS["hall-1"]
+    mocker.patch('app.toggles.auto_seating', False)
+    mocker.patch('app.get_show_layout', return_value=layout)
+    mocker.patch('app.get_seat_cache', return_value=app_module.SeatAvailabilityCache(lambda: {"A1"}, ttl=60))
+
+    data = client.get('/api/seat-config?show_id=1').get_json()
+
+    statuses = {s['id']: s['status'] for s in data['seats']}
+    assert statuses['A1'] == 1
+    assert statuses['A2'] == 0
+    assert all(s['status'] == 0 for s in app_module.seat_map(layout))
+
+# --- 測試案例 7: 手動訂多張票也只有一次 DB round-trip ---
+def test_manual_booking_claims_seats_in_one_statement(member_client, fake_db, manual_seating):
+    """
+    場景：會員一次訂 3 個座位，鎖位 + 更新 + 建立訂單應在同一個 statement 完成
+    """
+    conn = fake_db(("ORD-042", "A1,A2,A3", False))
+
+    response = member_client.post('/api/book', json={"selected_seats": ["A1", "A2", "A3"]})
+    data = response.get_json()
+
+    assert data['success'] is True
+    assert data['order_id'] == 'ORD-042'
+    assert len(conn.cur.executed) == 1
+    assert conn.cur.executed[0][1]['count'] == 3
+    assert conn.committed
+
+# --- 測試案例 8: 不存在的場次回傳 404 ---
+def test_unknown_show_returns_404(client, mocker):
+    mocker.patch('app.get_show_layout', return_value=None)
+
+    response = client.get('/api/seat-config?show_id=999')
+
+    assert response.status_code == 404
+
+# --- 測試案例 9: 座位初始化改由 CLI 執行 ---
+def test_seats_init_cli_provisions_requested_layout(mocker):
+    """
+    場景：`flask seats init --rows 12 --cols 20` 會用自訂座位表建立預設場次的座位
+    """
+    provision = mocker.patch('app.provision_show', return_value=240)
+
+    result = app.test_cli_runner().invoke(args=['seats', 'init', '--rows', '12', '--cols', '20'])
+
+    assert result.exit_code == 0
+    show_id, layout = provision.call_args[0]
+    assert (len(layout.rows), layout.cols) == (12, 20)
+    assert '240 seats created' in result.output
+
+# --- 測試案例 10: 訂票排隊爆滿時回 429 + Retry-After ---
+def test_book_sheds_load_with_retry_after(member_client, mocker):
+    import app as app_module
+    from booking_limiter import BookingRejected
+    mocker.patch.object(app_module.booking_limiter, 'admit', side_effect=BookingRejected(429, "queue_full", 2))
+
+    response = member_client.post('/api/book', json={"selected_seats": ["A1"]})
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+
+# --- 測試案例 11: 斷路器打開時智慧配位自動退回手動 ---
+def test_open_breaker_degrades_auto_seating_to_manual(client, mocker):
+    """
+    場景：toggle 仍是 auto，但斷路器已打開 -> 座位設定回傳手動地圖，智慧配位訂票回 503
+    """
+    import app as app_module
+    layout = app_module.AUDITORIUMS["hall-1"]
+    mocker.patch('app.toggles.auto_seating', True)
+    mocker.patch.object(app_module.auto_seating_breaker, 'is_open', return_value=True)
+    mocker.patch.object(app_module.auto_seating_breaker, 'allow', return_value=False)
+    mocker.patch('app.get_show_layout', return_value=layout)
+    mocker.patch('app.get_seat_cache', return_value=app_module.SeatAvailabilityCache(lambda: set(), ttl=60))
+    with client.session_transaction() as sess:
+        sess['role'] = 'member'
+        sess['user_id'] = 'admin'
+
+    config = client.get('/api/seat-config?show_id=1').get_json()
+    response = client.post('/api/book', json={"show_id": 1, "count": 2, "preference": "center"})
+
+    assert config['mode'] == 'manual'
+    assert len(config['seats']) == 100
+    assert response.status_code == 503
+    assert response.get_json()['mode'] == 'manual'
+
+# --- 測試案例 12: 同一個 Idempotency-Key 重送只成交一次 ---
+def test_repeated_submit_returns_stored_booking(member_client, fake_db, manual_seating):
+    """
+    場景：逾時重試帶同一個 Idempotency-Key，第二次直接回傳第一次的訂單，不再碰 DB
+    """
+    import app as app_module
+    conn = fake_db(("ORD-077", "B1", False))
+
+    headers = {'Idempotency-Key': 'retry-test-1'}
+    first = member_client.post('/api/book', json={"selected_seats": ["B1"]}, headers=headers)
+    second = member_client.post('/api/book', json={"selected_seats": ["B1"]}, headers=headers)
+
+    assert first.get_json()['order_id'] == second.get_json()['order_id'] == 'ORD-077'
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert app_module.get_db_connection.call_count == 1
+    assert conn.cur.executed[0][1]['idempotency_key'] is not None
+
+# --- 測試案例 13: 別的 worker 已成交的 key，回傳既有訂單 ---
+def test_submit_with_key_already_booked_in_db_is_replayed(member_client, fake_db, manual_seating):
+    conn = fake_db(("ORD-005", "C3,C4", True))
+
+    response = member_client.post('/api/book', json={"selected_seats": ["C3", "C4"]}, headers={'Idempotency-Key': 'other-worker'})
+
+    assert response.get_json()['order_id'] == 'ORD-005'
+    assert response.headers['Idempotent-Replayed'] == 'true'
+    assert not conn.committed
+
+# --- 測試案例 14: SSE 先送目前已售座位，再推送其他 worker 的變動 ---
+def test_seat_stream_sends_snapshot_then_deltas(client, mocker):
+    import app as app_module
+    mocker.patch('app.get_show_layout', return_value=app_module.AUDITORIUMS["hall-1"])
+    mocker.patch('app.get_seat_cache', return_value=app_module.SeatAvailabilityCache(lambda: {"A1"}, ttl=60))
+
+    response = client.get('/api/seat-stream?show_id=7', buffered=False)
+    chunks = response.iter_encoded()
+    next(chunks)
+    snapshot = next(chunks).decode()
+    app_module.on_seat_change(7, ["B2"], 1)
+    delta = next(chunks).decode()
+    response.close()
+
+    assert response.mimetype == 'text/event-stream'
+    assert snapshot == 'event: snapshot\ndata: {"sold":["A1"]}\n\n'
+    assert delta == 'event: seats\ndata: {"seats":["B2"],"status":1}\n\n'
+
+# --- 測試案例 15: 精簡座位格式 + ETag，輪詢沒變動時回 304 且不寫 session ---
+def test_compact_seat_config_is_conditional_and_cookie_free(client, mocker):
+    """
+    場景：手動模式用 format=compact 取得 1 bit/座位的售出狀態；輪詢帶 If-None-Match 重查時回 304
+    """
+    import base64
+    import app as app_module
+    layout = app_module.AUDITORIUMS["hall-1"]
+    mocker.patch('app.toggles.auto_seating', False)
+    mocker.patch('app.get_show_layout', return_value=layout)
+    mocker.patch('app.get_seat_cache', return_value=app_module.SeatAvailabilityCache(lambda: {"A1", "A10"}, ttl=60))
+
+    first = client.get('/api/seat-config?show_id=1&format=compact')
+    second = client.get('/api/seat-config?show_id=1&format=compact&poll=1', headers={'If-None-Match': first.headers['ETag']})
+
+    data = first.get_json()
+    assert base64.b64decode(data['sold'])[:2] == bytes([0b10000000, 0b01000000])
+    assert 'Set-Cookie' in first.headers
+    assert second.status_code == 304
+    assert 'Set-Cookie' not in second.headers
+
+# --- 測試案例 16: 座位表文件帶指紋時可以永久快取 ---
+def test_seat_layout_is_cached_by_fingerprint(client, mocker):
+    import app as app_module
+    layout = app_module.AUDITORIUMS["imax"]
+    mocker.patch('app.get_show_layout', return_value=layout)
+
+    url = f"/api/seat-layout?show_id=2&v={app_module.layout_fingerprint(layout)}"
+    response = client.get(url)
+    revalidated = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+
+    doc = response.get_json()
+    assert (doc['rows'], doc['cols'], len(doc['types'])) == (layout.rows, 24, 16 * 24)
+    assert 'immutable' in response.headers['Cache-Control']
+    assert revalidated.status_code == 304
+
+# --- 測試案例 17: 訂票各階段的耗時分別記錄，db_write_latency 也會更新 ---
+def test_booking_records_stage_latencies(member_client, fake_db, manual_seating, mocker):
+    import app as app_module
+    fake_db(("ORD-050", "D1", False))
+    db_write = mocker.patch.object(app_module.db_write_latency, 'set')
+
+    def stage_count(stage):
+        return app_module.booking_stage_latency.labels(stage=stage)._sum.get()
+
+    before = {stage: stage_count(stage) for stage in ("db.claim", "db.commit", "booking")}
+    member_client.post('/api/book', json={"selected_seats": ["D1"]}, headers={'Idempotency-Key': 'stage-test'})
+
+    assert all(stage_count(stage) > before[stage] for stage in before)
+    assert db_write.call_count == 1
+
+# --- 測試案例 18: 成交事件帶座位頁停留時間與 visit，且用過即清除 ---
+def test_booking_completed_carries_dwell_and_visit(member_client, fake_db, manual_seating, mocker):
+    """
+    場景：進座位頁取得 seat_visit，訂票成功後 METRIC_BOOKING_COMPLETED 帶 mode / dwell / visit (給 experiments.py)
+    """
+    import app as app_module
+    fake_db(("ORD-060", "E1", False))
+    mocker.patch('app.get_seat_cache', return_value=app_module.SeatAvailabilityCache(lambda: set(), ttl=60))
+    log_event = mocker.patch('app.log_event')
+
+    member_client.get('/api/seat-config?show_id=1')
+    with member_client.session_transaction() as sess:
+        visit = sess['seat_visit']
+    member_client.post('/api/book', json={"selected_seats": ["E1"]}, headers={'Idempotency-Key': 'dwell-test'})
+
+    events = {call.args[0]: call.kwargs for call in log_event.call_args_list}
+    assert events["METRIC_SEAT_PAGE_ENTER"]["visit"] == visit
+    completed = events["METRIC_BOOKING_COMPLETED"]
+    assert (completed["mode"], completed["visit"]) == ("manual", visit)
+    assert completed["dwell"] >= 0
+    with member_client.session_transaction() as sess:
+        assert "seat_page_enter_at" not in sess and "seat_visit" not in sess
+
+# --- 測試案例 19: 靜態頁面預先 render + 壓縮，不經過 session 也能計數 ---
+def test_pages_are_prerendered_and_compressed(client, mocker, prerendered):
+    import gzip
+    import app as app_module
+    views = app_module.page_views.labels(page="booking_guest")
+    before = views._value.get()
+    render = mocker.patch('app.render_template')
+    log_event = mocker.patch('app.log_event')
+
+    response = client.get('/booking_guest.html', headers={'Accept-Encoding': 'gzip'})
+    revalidated = client.get('/booking_guest.html', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+
+    assert b'<html' in gzip.decompress(response.data)
+    assert 'Set-Cookie' not in response.headers
+    assert revalidated.status_code == 304
+    assert views._value.get() == before + 2
+    render.assert_not_called()
+    # 跟其他 METRIC_PAGE_VIEW 一樣帶 role (讀不到 session，記成 unknown)
+    log_event.assert_called_with("METRIC_PAGE_VIEW", page="booking_guest", role="unknown")
+
+# --- 測試案例 20: 選位先保留 (全部成功才生效)，被別人保留的座位回 409 ---
+def test_hold_seats_then_conflict(guest_client, fake_db, manual_seating, mocker):
+    held_until = mocker.Mock(isoformat=lambda: "2026-01-01T00:05:00+00:00")
+    conn = fake_db((True, ["A1", "A2"], None, held_until, 1), (False, None, None, None, 0))
+    cache = mocker.Mock()
+    mocker.patch('app.get_seat_cache', return_value=cache)
+
+    held = guest_client.post('/api/hold', json={"selected_seats": ["A2", "A1"]})
+    conflict = guest_client.post('/api/hold', json={"selected_seats": ["A3"]})
+
+    assert held.get_json()["seats"] == ["A1", "A2"]
+    params = conn.cur.executed[0][1]
+    assert params["seats"] == ["A1", "A2"] and params["holder"] and params["ttl"] > 0
+    cache.mark_sold.assert_called_once_with(["A1", "A2"])
+    assert conflict.status_code == 409
+    cache.invalidate.assert_called_once()
+
+    unauthorized = app.test_client().post('/api/hold', json={"selected_seats": ["A1"]})
+    assert unauthorized.status_code == 401
+
+# --- 測試案例 21: BOOKING_AUDIT_MODE=async 時稽核紀錄在 commit 之後才放進 buffer ---
+def test_async_booking_audit_is_buffered_after_commit(member_client, fake_db, manual_seating, mocker):
+    conn = fake_db(("ORD-070", "F1,F2", False))
+    mocker.patch('app.BOOKING_AUDIT_MODE', 'async')
+    committed_at_put = []
+    put = mocker.patch('app.booking_audit.put', side_effect=lambda row: committed_at_put.append(conn.committed))
+
+    response = member_client.post('/api/book', json={"selected_seats": ["F1", "F2"]})
+
+    assert response.get_json()['success'] is True
+    assert len(conn.cur.executed) == 1  # 只有搶位 statement，稽核不在這個交易裡
+    row = put.call_args.args[0]
+    assert row[:6] == ("ORD-070", 1, "MEMBER-admin", "member", "manual", 2)
+    assert committed_at_put == [True]
+
+# --- 測試案例 22: SSE 連線滿了回 503，前端改輪詢 seat-config (不算進頁面) ---
+def test_full_seat_stream_falls_back_to_polling(client, mocker):
+    import app as app_module
+    layout = app_module.AUDITORIUMS["hall-1"]
+    mocker.patch('app.toggles.auto_seating', False)
+    mocker.patch('app.get_show_layout', return_value=layout)
+    mocker.patch('app.get_seat_cache', return_value=app_module.SeatAvailabilityCache(lambda: {"A1"}, ttl=60))
+    mocker.patch('app.seat_broadcaster.subscribe', return_value=None)
+    log_event = mocker.patch('app.log_event')
+
+    stream = client.get('/api/seat-stream?show_id=1')
+    client.get('/api/seat-config?show_id=1&format=compact')
+    polled = client.get('/api/seat-config?show_id=1&format=compact&poll=1')
+
+    assert stream.status_code == 503
+    assert polled.status_code == 200 and polled.headers['ETag']
+    assert [call.args[0] for call in log_event.call_args_list].count("METRIC_SEAT_PAGE_ENTER") == 1
+    assert app_module.seat_broadcaster.max_subscribers == app_module.GUNICORN_THREADS - 4
+
+# --- 測試案例 23: 重新整理後拿回自己保留的座位；不存在的座位回 400 而不是 409 ---
+def test_held_by_me_and_unknown_seats(guest_client, fake_db, manual_seating):
+    import datetime
+    held_until = datetime.datetime(2026, 1, 1, 0, 5, tzinfo=datetime.timezone.utc)
+    conn = fake_db(("A1", held_until), ("A2", held_until))
+
+    mine = guest_client.get('/api/hold?show_id=1')
+    unknown = guest_client.post('/api/hold', json={"show_id": 1, "selected_seats": ["A1", "Z99"]})
+
+    assert mine.get_json()["seats"] == ["A1", "A2"]
+    assert mine.get_json()["held_until"] == "2026-01-01T00:05:00+00:00"
+    assert conn.cur.executed[0][1]["holder"] and conn.cur.executed[0][1]["show_id"] == 1
+    assert unknown.status_code == 400 and "Z99" in unknown.get_json()["error"]
+    assert len(conn.cur.executed) == 1  # 座位不存在時不會碰 DB
+
+# --- 測試案例 24: 測試中第一個請求不啟動背景 thread，也不在背景暖機 ---
+def test_first_request_skips_start_app_when_testing(client, mocker):
+    import app as app_module
+    start_app = mocker.patch('app.start_app')
+    log_event = mocker.patch('app.log_event')
+    mocker.patch('app.startup_logged', False)
+
+    client.get('/api/init-flow')  # 一定經過 Flask (不會被預先 render 的頁面攔下)
+
+    assert app_module.startup_logged is True
+    assert "STARTUP" in [call.args[0] for call in log_event.call_args_list]
+    start_app.assert_not_called()
+
+# --- 測試案例 25: 同一個 Idempotency-Key 同時送兩次，拿不到座位的那一個回傳已成交的訂單 ---
+def test_concurrent_same_key_replays_instead_of_conflict(member_client, fake_db, manual_seating):
+    import app as app_module
+    # 搶位 statement 沒拿到任何座位 (被同一個 key 的請求鎖住)，再查 key 時對方已經成交
+    conn = fake_db(None, ("ORD-009", "C3,C4"))
+
+    response = member_client.post('/api/book', json={"selected_seats": ["C3", "C4"]}, headers={'Idempotency-Key': 'double-click'})
+
+    assert response.status_code == 200
+    assert response.get_json()['order_id'] == 'ORD-009'
+    assert response.headers['Idempotent-Replayed'] == 'true'
+    assert conn.cur.executed[1][0] == app_module.FIND_BOOKING_BY_KEY_SQL
+    assert not conn.committed
+
+# --- 測試案例 26: 智慧配位在借 DB 連線之前就讀好座位快照，重試時不再另外借連線 ---
+def test_auto_seating_loads_snapshot_before_borrowing_connection(member_client, fake_db, mocker):
+    import app as app_module
+    conn = fake_db(None, ("ORD-011", "E4,E5", False))
+    def load_sold():
+        # 快照載入時，訂票交易還沒拿著連線
+        assert app_module.get_db_connection.call_count == 0
+        return set()
+    mocker.patch('app.toggles.auto_seating', True)
+    mocker.patch.object(app_module.auto_seating_breaker, 'allow', return_value=True)
+    mocker.patch('app.get_show_layout', return_value=app_module.AUDITORIUMS["hall-1"])
+    loader = mocker.Mock(side_effect=load_sold)
+    mocker.patch('app.get_seat_cache', return_value=app_module.SeatAvailabilityCache(loader, ttl=60))
+
+    response = member_client.post('/api/book', json={"show_id": 1, "count": 2, "preference": "center"})
+
+    assert response.get_json()['order_id'] == 'ORD-011'
+    assert loader.call_count == 1  # 第一次搶位失敗後 invalidate 了，但重試沿用同一份快照
+    assert app_module.get_db_connection.call_count == 1
+    first, second = (params["seats"] for _, params in conn.cur.executed)
+    assert not set(first) & set(second)
+
+# --- 測試案例 27: 不存在的場次短暫記住，亂帶 show_id 不會每次都查 DB ---
+def test_unknown_show_is_cached_briefly(client, mocker):
+    import app as app_module
+    conn = FakeConn(rows=[None])
+    get_conn = mocker.patch('app.get_db_connection', return_value=conn)
+    mocker.patch('app.release_db_connection')
+    mocker.patch.dict(app_module.unknown_shows, clear=True)
+    mocker.patch('app.SHOW_NOT_FOUND_CACHE_SIZE', 2)
+
+    first = client.get('/api/seat-config?show_id=4242')
+    second = client.get('/api/seat-config?show_id=4242')
+
+    assert first.status_code == second.status_code == 404
+    assert get_conn.call_count == 1
+
+    app_module.remember_unknown_show(4343)
+    app_module.remember_unknown_show(4444)
+    assert list(app_module.unknown_shows) == [4343, 4444]  # 有上限，滿了丟最早的
+
+# --- 測試案例 28: 保留座位有自己的限流，hold 塞滿時同場次的訂票不會被 429 ---
+def test_hold_burst_does_not_shed_bookings(member_client, mocker):
+    import app as app_module
+    for limiter in (app_module.hold_limiter, app_module.booking_limiter):
+        mocker.patch.object(limiter, 'max_concurrency', 1)
+        mocker.patch.object(limiter, 'max_queue', 0)
+    mocker.patch('app.get_show_layout', return_value=None)
+
+    with app_module.hold_limiter.admit(1):
+        hold = member_client.post('/api/hold', json={'show_id': 1, 'selected_seats': ['A1']})
+        book = member_client.post('/api/book', json={'show_id': 1, 'count': 1})
+
+    assert hold.status_code == 429
+    assert book.status_code == 404  # 有進到訂票流程 (場次不存在)，沒有被 hold 的隊伍擋下
+
+# --- 測試案例 29: 未登入的訂票在拿限流名額之前就被擋下 ---
+def test_unauthorized_booking_does_not_take_a_slot(client, mocker):
+    import app as app_module
+    admit = mocker.patch.object(app_module.booking_limiter, 'admit')
+
+    response = client.post('/api/book', json={"show_id": 1, "selected_seats": ["A1"]})
+
+    assert response.status_code == 401
+    admit.assert_not_called()
+
+# --- 測試案例 30: 每次進座位頁都更新進入時間，visit 不變；輪詢不動 session ---
+def test_seat_page_reentry_refreshes_enter_time(client, manual_seating, mocker):
+    import app as app_module
+    mocker.patch('app.get_seat_cache', return_value=app_module.SeatAvailabilityCache(lambda: set(), ttl=60))
+
+    client.get('/api/seat-config?show_id=1')
+    with client.session_transaction() as sess:
+        visit = sess['seat_visit']
+        sess['seat_page_enter_at'] = '2020-01-01T00:00:00+00:00'
+
+    polled = client.get('/api/seat-config?show_id=1&poll=1')
+    with client.session_transaction() as sess:
+        assert sess['seat_page_enter_at'] == '2020-01-01T00:00:00+00:00'
+
+    client.get('/api/seat-config?show_id=1')
+    with client.session_transaction() as sess:
+        assert sess['seat_page_enter_at'] > '2020-01-01T00:00:00+00:00'
+        assert sess['seat_visit'] == visit
+    assert 'Set-Cookie' not in polled.headers
@@ -0,0 +1,290 @@
+"""Hot-path benchmarks. Opt-in, so the normal test run stays fast:
+
+    RUN_BENCHMARKS=1 python -m pytest -q -s test_benchmarks.py
+    RUN_BENCHMARKS=1 BENCHMARK_SAVE=1 python -m pytest -q test_benchmarks.py   # record new baselines
+
+Every benchmark runs against an in-memory fake of the tickets table (with a
+simulated round-trip latency); set BENCHMARK_DATABASE_URL to also run them
+against a real Postgres (a dedicated show, BENCHMARK_SHOW_ID, is provisioned
+and reset between rounds). Medians are compared with benchmark_baseline.json
+and a test fails when it is more than BENCHMARK_TOLERANCE (default 50%)
+slower than its baseline. Wall-clock baselines only mean something on the
+machine that recorded them, so the file is not in git: record one locally
+with BENCHMARK_SAVE=1 first (baselines from another machine are ignored).
+"""
+import os
+import random
+import threading
+import time
+import uuid
+
+import pytest
+
+import app as app_module
+import importtime_check
+from benchmark import BaselineStore, measure
+from db_pool import ConnectionPool
+from seat_layout import AUDITORIUMS, seat_map
+
+pytestmark = pytest.mark.skipif(not os.environ.get("RUN_BENCHMARKS"), reason="set RUN_BENCHMARKS=1 to run benchmarks")
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+ROUNDS = int(os.environ.get("BENCHMARK_ROUNDS", "50"))
+SAVE = bool(os.environ.get("BENCHMARK_SAVE"))
+SHOW_ID = int(os.environ.get("BENCHMARK_SHOW_ID", "9001"))
+LAYOUT = AUDITORIUMS["imax"]
+
+
+# --- 假資料庫：記憶體裡的 tickets，語意跟 CLAIM_SQL 一樣 (全部搶到或全部不動) ---
+class FakeTicketDB:
+    def __init__(self, layout, latency=0.0002):
+        self.status = {s["id"]: 0 for s in seat_map(layout)}
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.orders = 0
+
+    def connect(self):
+        return FakeDBConn(self)
+
+    def reset(self):
+        with self.lock:
+            self.status = dict.fromkeys(self.status, 0)
+
+    def sold_count(self):
+        return sum(self.status.values())
+
+
+class FakeDBConn:
+    def __init__(self, db):
+        self.db = db
+        self.pending = []
+        self.rows = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        time.sleep(self.db.latency)  # 模擬一次 DB round-trip
+        db = self.db
+        if "WITH picked" in sql:
+            seats = params["seats"]
+            with db.lock:
+                if len(seats) == params["count"] and all(db.status.get(s) == 0 for s in seats):
+                    for s in seats:
+                        db.status[s] = 1
+                    self.pending.extend(seats)
+                    db.orders += 1
+                    self.rows = [(f"ORD-{db.orders:03d}", ",".join(seats), False)]
+                else:
+                    self.rows = []
+        elif "FROM tickets" in sql:
+            with db.lock:
+                self.rows = [(code,) for code, status in db.status.items() if status]
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+    def commit(self):
+        self.pending = []
+
+    def rollback(self):
+        with self.db.lock:
+            for s in self.pending:
+                self.db.status[s] = 0
+        self.pending = []
+
+
+class FakeBackend:
+    name = "fake"
+
+    def install(self, monkeypatch):
+        self.db = FakeTicketDB(LAYOUT)
+        monkeypatch.setattr(app_module, "get_db_connection", self.db.connect)
+        monkeypatch.setattr(app_module, "release_db_connection", lambda conn, discard=False: conn.rollback())
+        monkeypatch.setattr(app_module, "get_show_layout", lambda show_id: LAYOUT)
+
+    def reset(self):
+        self.db.reset()
+        app_module.seat_caches.pop(SHOW_ID, None)
+
+    def sold_count(self):
+        return self.db.sold_count()
+
+
+class PostgresBackend:
+    name = "postgres"
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+
+    def install(self, monkeypatch):
+        self.pool = ConnectionPool(self.dsn, minconn=1, maxconn=16)
+        monkeypatch.setattr(app_module, "db_pool", self.pool)
+        app_module.show_layouts.pop(SHOW_ID, None)
+        app_module.provision_show(SHOW_ID, LAYOUT)
+
+    def execute(self, sql):
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, (SHOW_ID,))
+            row = cur.fetchone() if cur.description else None
+            conn.commit()
+            return row
+
+    def reset(self):
+        self.execute("UPDATE tickets SET status = 0 WHERE show_id = %s AND status <> 0")
+        self.execute("DELETE FROM bookings WHERE show_id = %s")
+        app_module.seat_caches.pop(SHOW_ID, None)
+
+    def sold_count(self):
+        return self.execute("SELECT count(*) FROM tickets WHERE show_id = %s AND status = 1")[0]
+
+
+BACKENDS = ["fake"] + (["postgres"] if os.environ.get("BENCHMARK_DATABASE_URL") else [])
+
+
+@pytest.fixture(scope="module", params=BACKENDS)
+def backend(request):
+    backend = FakeBackend() if request.param == "fake" else PostgresBackend(os.environ["BENCHMARK_DATABASE_URL"])
+    with pytest.MonkeyPatch.context() as mp:
+        backend.install(mp)
+        mp.setattr(app_module, "seat_caches", {})
+        mp.setattr(app_module, "seat_indexes", {})
+        backend.reset()
+        yield backend
+        backend.reset()
+        if request.param == "postgres":
+            backend.pool.closeall()
+
+
+@pytest.fixture(scope="module")
+def baselines():
+    store = BaselineStore(BASELINE_PATH, tolerance=float(os.environ.get("BENCHMARK_TOLERANCE", "0.5")))
+    if not store.baselines and not SAVE:
+        print(f"\nno baselines for this machine ({store.machine}); record them with BENCHMARK_SAVE=1")
+    yield store
+    if SAVE:
+        store.save()
+
+
+@pytest.fixture
+def bench(baselines, request):
+    def run(fn, setup=None, rounds=ROUNDS, warmup=3):
+        result = measure(fn, rounds=rounds, warmup=warmup, setup=setup)
+        name = request.node.name
+        print(f"\n{name}: median={result['median'] * 1000:.3f}ms p95={result['p95'] * 1000:.3f}ms rounds={result['rounds']}")
+        regression = baselines.check(name, result)
+        if regression and not SAVE:
+            pytest.fail(regression)
+        return result
+    return run
+
+
+def member_client():
+    app_module.app.config["TESTING"] = True  # 不啟動背景 thread / 暖機 (見 log_startup_once)
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess["role"] = "member"
+        sess["user_id"] = "bench"
+    return client
+
+
+# --- 智慧配位：記憶體挑位 + 一個 statement 搶位 ---
+def test_auto_allocate_and_claim(bench, backend, monkeypatch):
+    def allocate_and_claim():
+        conn = app_module.get_db_connection()
+        try:
+            seats = app_module.allocate_seats(SHOW_ID, LAYOUT, "center", 4)
+            claim = app_module.claim_seats(conn.cursor(), SHOW_ID, app_module.PICK_BY_CODE_SQL, {"seats": seats},
+                                           4, "MEMBER-bench")
+            conn.commit()
+        finally:
+            app_module.release_db_connection(conn)
+        assert claim is not None
+
+    bench(allocate_and_claim, setup=backend.reset)
+
+
+# --- 手動選位訂 N 張票 (整個 /api/book) ---
+@pytest.mark.parametrize("seats", [1, 4, 8])
+def test_manual_book_ticket(bench, backend, monkeypatch, seats):
+    monkeypatch.setattr(app_module.toggles, "auto_seating", False)
+    client = member_client()
+    selected = [s["id"] for s in seat_map(LAYOUT)[100:100 + seats]]
+
+    def book():
+        response = client.post("/api/book", json={"show_id": SHOW_ID, "selected_seats": selected},
+                               headers={"Idempotency-Key": uuid.uuid4().hex})
+        assert response.status_code == 200, response.get_json()
+
+    bench(book, setup=backend.reset)
+
+
+# --- 座位設定：兩種模式 / 兩種格式 ---
+@pytest.mark.parametrize("mode,fmt", [("auto", "full"), ("manual", "full"), ("manual", "compact")])
+def test_get_seat_config(bench, backend, monkeypatch, mode, fmt):
+    monkeypatch.setattr(app_module.toggles, "auto_seating", mode == "auto")
+    client = member_client()
+    url = f"/api/seat-config?show_id={SHOW_ID}&format={fmt}"
+
+    def seat_config():
+        response = client.get(url)
+        assert response.status_code == 200
+
+    backend.reset()
+    bench(seat_config, rounds=ROUNDS * 4)
+
+
+# --- 開賣搶票：多個 client 同時搶到整廳賣完，不能超賣 ---
+def test_sell_out_contention(bench, backend, monkeypatch):
+    monkeypatch.setattr(app_module.toggles, "auto_seating", False)
+    bookers = int(os.environ.get("BENCHMARK_BOOKERS", "32"))
+    total = len(seat_map(LAYOUT))
+    booked = []
+
+    def booker(rng):
+        client = member_client()
+        while True:
+            sold = app_module.get_seat_cache(SHOW_ID).get().sold
+            free = [s["id"] for s in seat_map(LAYOUT) if s["id"] not in sold]
+            if not free:
+                return
+            picked = rng.sample(free, min(len(free), rng.randint(1, 4)))
+            response = client.post("/api/book", json={"show_id": SHOW_ID, "selected_seats": picked},
+                                   headers={"Idempotency-Key": uuid.uuid4().hex})
+            if response.status_code == 200:
+                booked.extend(response.get_json()["seats"])
+            elif response.status_code in (429, 503):
+                time.sleep(0.001)
+
+    def sell_out():
+        threads = [threading.Thread(target=booker, args=(random.Random(i),)) for i in range(bookers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def reset():
+        backend.reset()
+        booked.clear()
+
+    bench(sell_out, setup=reset, rounds=max(3, ROUNDS // 10), warmup=1)
+
+    assert backend.sold_count() == total
+    assert sorted(booked) == sorted(s["id"] for s in seat_map(LAYOUT))
+
+
+# --- 冷啟動：import app 的時間 (python -X importtime，見 importtime_check.py) ---
+def test_import_app(baselines):
+    result, _ = importtime_check.measure_import("app", rounds=max(3, ROUNDS // 10))
+    print(f"\nimport_app: median={result['median'] * 1000:.1f}ms rounds={result['rounds']}")
+    regression = baselines.check("import_app", result)
+    if regression and not SAVE:
+        pytest.fail(regression)
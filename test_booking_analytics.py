@@ -0,0 +1,121 @@
+import datetime
+import json
+import random
+
+import pytest
+
+import booking_analytics
+from booking_analytics import TDigest, collect, iter_bookings, iter_log_events, parse_log_line
+
+
+# --- 測試案例 1: t-digest 的分位數跟精確值差不多，centroid 數量固定上限 ---
+def test_tdigest_quantiles_with_bounded_size():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(-3, 0.8) for _ in range(200_000)]
+    digest = TDigest(compression=100)
+    for v in values:
+        digest.add(v)
+
+    ordered = sorted(values)
+    for q in (0.5, 0.9, 0.99, 0.999):
+        estimate = digest.quantile(q)
+        rank = sum(1 for v in ordered if v <= estimate) / len(ordered)
+        assert rank == pytest.approx(q, abs=0.005)
+    assert len(digest.centroids()) <= 100
+    assert digest.count == len(values)
+    assert digest.mean == pytest.approx(sum(values) / len(values))
+    assert digest.quantile(0) == ordered[0] and digest.quantile(1) == ordered[-1]
+
+
+# --- 測試案例 2: 分開算再合併，結果跟一起算一樣 ---
+def test_tdigest_merge():
+    rng = random.Random(3)
+    left, right, whole = TDigest(), TDigest(), TDigest()
+    for i in range(20_000):
+        v = rng.random()
+        (left if i % 2 else right).add(v)
+        whole.add(v)
+
+    merged = left.merge(right)
+
+    assert merged.count == whole.count
+    assert merged.quantile(0.95) == pytest.approx(whole.quantile(0.95), abs=0.005)
+
+
+# --- 測試案例 3: 解析 key=value 與 JSON 兩種 log，略過其他事件 ---
+def test_parse_log_lines():
+    lines = [
+        "2025-12-01 10:00:05,123 [INFO] METRIC_AUTO_SEATING_USED role=guest pref=center seats=A1,A2 duration=0.042",
+        '2025-12-01 10:20:00,001 [INFO] {"event": "METRIC_MANUAL_SEATING_USED", "role": "member", "seats": ["B1"], "duration": 0.1}',
+        "2025-12-01 10:30:00,000 [INFO] METRIC_MANUAL_SEATING_USED role=guest seats=C1 duration=0.200 sample_rate=0.25",
+        "2025-12-01 10:30:01,000 [INFO] METRIC_BOOKING_COMPLETED role=guest order=ORD-001",
+        "garbage",
+    ]
+
+    events = list(iter_log_events(lines))
+
+    assert events[0] == ("auto", "guest", 0.042, datetime.datetime(2025, 12, 1, 10, 0, 5), 1)
+    assert events[1][:3] == ("manual", "member", 0.1)
+    assert events[2][4] == 4
+    assert len(events) == 3
+    assert parse_log_line("METRIC_AUTO_SEATING_USED role=guest duration=oops") is None
+
+
+# --- 測試案例 4: DB 來源用 named cursor 串流，依 mode/role 與時間區間彙整 ---
+def test_collect_from_bookings_stream():
+    class NamedCursor:
+        def __init__(self, name):
+            self.name = name
+            self.itersize = 2000
+            self.rows = [
+                ("auto", "GUEST-abc", 40.0, datetime.datetime(2025, 12, 1, 10, 5)),
+                ("auto", "MEMBER-7", 60.0, datetime.datetime(2025, 12, 1, 11, 5)),
+                ("manual", "GUEST-def", 200.0, datetime.datetime(2025, 12, 1, 10, 6)),
+            ]
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def execute(self, sql, params):
+            self.params = params
+
+        def __iter__(self):
+            return iter(self.rows)
+
+    class Conn:
+        def cursor(self, name=None):
+            assert name, "必須用 server-side cursor，不能一次 fetchall"
+            self.cur = NamedCursor(name)
+            return self.cur
+
+    conn = Conn()
+    stats = collect(iter_bookings(conn, itersize=500), bucket=3600)
+    summary = stats.summary()
+
+    assert conn.cur.itersize == 500
+    assert set(summary["by_mode_role"]) == {"auto/guest", "auto/member", "manual/guest"}
+    assert summary["by_mode"]["auto"]["count"] == 2
+    assert summary["by_mode"]["manual"]["p50"] == pytest.approx(0.2)
+    assert len(stats.timeline) == 3
+    json.dumps(summary)
+
+
+# --- 測試案例 5: CLI 讀 log 檔，輸出摘要 JSON 與圖檔 ---
+def test_cli_log_source(tmp_path):
+    pytest.importorskip("matplotlib")
+    log = tmp_path / "app.log"
+    log.write_text("\n".join(
+        f"2025-12-01 10:{i % 60:02d}:00,000 [INFO] METRIC_{'AUTO' if i % 2 else 'MANUAL'}_SEATING_USED "
+        f"role=guest seats=A{i} duration={0.01 * (i % 7 + 1):.3f}"
+        for i in range(200)
+    ), encoding="utf-8")
+
+    summary = booking_analytics.main(["--source", "log", "--log-file", str(log), "--bucket", "600",
+                                      "--json", str(tmp_path / "out.json"), "--chart", str(tmp_path / "out.png")])
+
+    assert summary["by_mode"]["auto"]["count"] == 100
+    assert json.loads((tmp_path / "out.json").read_text(encoding="utf-8"))["by_mode"]["manual"]["count"] == 100
+    assert (tmp_path / "out.png").stat().st_size > 0
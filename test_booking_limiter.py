@@ -0,0 +1,67 @@
+import threading
+import pytest
+from booking_limiter import BookingRejected, ShowLimiter
+
+def hold_slot(limiter, key, entered, release):
+    with limiter.admit(key):
+        entered.set()
+        release.wait(5)
+
+# --- 測試案例 1: 排隊已滿時立刻回 429，不佔住 worker ---
+def test_rejects_with_429_when_queue_full():
+    limiter = ShowLimiter(max_concurrency=1, max_queue=0, timeout=1)
+    entered, release = threading.Event(), threading.Event()
+    t = threading.Thread(target=hold_slot, args=(limiter, 1, entered, release))
+    t.start()
+    entered.wait(5)
+    try:
+        with pytest.raises(BookingRejected) as exc:
+            with limiter.admit(1):
+                pass
+        assert exc.value.status == 429
+        # 其他場次不受影響
+        with limiter.admit(2):
+            pass
+    finally:
+        release.set()
+        t.join()
+
+# --- 測試案例 2: 排隊等太久回 503；slot 釋放後可以再進來 ---
+def test_waiter_times_out_with_503_then_recovers():
+    limiter = ShowLimiter(max_concurrency=1, max_queue=1, timeout=0.05)
+    entered, release = threading.Event(), threading.Event()
+    t = threading.Thread(target=hold_slot, args=(limiter, 1, entered, release))
+    t.start()
+    entered.wait(5)
+
+    with pytest.raises(BookingRejected) as exc:
+        with limiter.admit(1):
+            pass
+    assert exc.value.status == 503
+
+    release.set()
+    t.join()
+    with limiter.admit(1):
+        pass
+
+# --- 測試案例 3: 亂帶 show_id 不會讓 lane 無限增加；使用中的 lane 不會被丟掉 ---
+def test_idle_lanes_are_evicted_but_busy_lanes_kept():
+    limiter = ShowLimiter(max_concurrency=1, max_queue=0, timeout=1, max_lanes=4)
+    entered, release = threading.Event(), threading.Event()
+    t = threading.Thread(target=hold_slot, args=(limiter, "busy", entered, release))
+    t.start()
+    entered.wait(5)
+    try:
+        for key in range(100):
+            with limiter.admit(key):
+                pass
+        assert len(limiter._lanes) <= 4
+        assert "busy" in limiter._lanes
+        # 同一個場次還是同一條 lane，仍然受限
+        with pytest.raises(BookingRejected):
+            with limiter.admit("busy"):
+                pass
+    finally:
+        release.set()
+        t.join()
+    assert limiter._lanes["busy"].users == 0
@@ -0,0 +1,102 @@
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, LatencyCircuitBreaker
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_breaker(clock, **kwargs):
+    options = dict(latency_threshold=0.4, window=60, min_samples=10, cooldown=30, probes=3, clock=clock)
+    options.update(kwargs)
+    return LatencyCircuitBreaker(**options)
+
+# --- 測試案例 1: P95 超過門檻就打開，樣本不足時不動作 ---
+def test_trips_on_rolling_p95_latency():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+
+    for _ in range(9):
+        breaker.record(1.0)
+    assert breaker.state == CLOSED
+
+    breaker.record(1.0)
+    assert breaker.state == OPEN
+    assert breaker.is_open()
+    assert not breaker.allow()
+
+# --- 測試案例 2: 少數慢請求不會讓 P95 超標；舊樣本會滑出視窗 ---
+def test_ignores_outliers_and_expired_samples():
+    clock = FakeClock()
+    breaker = make_breaker(clock, min_samples=20)
+
+    for _ in range(19):
+        breaker.record(2.0)
+    clock.now = 120
+    for _ in range(19):
+        breaker.record(0.05)
+    breaker.record(2.0)
+
+    assert breaker.state == CLOSED
+
+# --- 測試案例 3: 冷卻後半開，試探請求都成功就關閉 ---
+def test_half_open_probes_close_the_breaker():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(10):
+        breaker.record(1.0, error=True)
+    assert breaker.state == OPEN
+
+    clock.now = 31
+    assert not breaker.is_open()
+    assert [breaker.allow() for _ in range(4)] == [True, True, True, False]
+    assert breaker.state == HALF_OPEN
+
+    for _ in range(3):
+        breaker.record(0.1)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+# --- 測試案例 4: 試探請求太慢就重新打開 ---
+def test_slow_probe_reopens_the_breaker():
+    clock = FakeClock()
+    transitions = []
+
+    class Counter:
+        def labels(self, from_state, to_state):
+            transitions.append((from_state, to_state))
+            return self
+
+        def inc(self):
+            pass
+
+    breaker = make_breaker(clock, transitions_counter=Counter())
+    for _ in range(10):
+        breaker.record(1.0)
+    clock.now = 31
+    assert breaker.allow()
+    breaker.record(0.9)
+
+    assert breaker.state == OPEN
+    assert transitions == [(CLOSED, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, OPEN)]
+    assert breaker.is_open()
+
+# --- 測試案例 5: 半開且試探名額用完時 is_open() 跟 allow() 一致 (座位頁不會再給 auto) ---
+def test_is_open_while_half_open_probes_are_used_up():
+    clock = FakeClock()
+    breaker = make_breaker(clock)
+    for _ in range(10):
+        breaker.record(1.0)
+    clock.now = 31
+
+    for _ in range(3):
+        assert not breaker.is_open()
+        assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert breaker.is_open()
+    assert not breaker.allow()
+
+    clock.now = 62  # 試探一直沒回報：冷卻後重新發試探
+    assert not breaker.is_open()
+    assert breaker.allow()
@@ -0,0 +1,47 @@
+import pytest
+from psycopg2 import extensions
+from db_pool import ConnectionPool, PoolTimeout
+
+class FakeConn:
+    def __init__(self, dsn):
+        self.closed = 0
+        self.rolled_back = False
+
+    def get_transaction_status(self):
+        return extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        self.closed = 1
+
+# --- 測試案例 1: 歸還後的連線會被重複使用 ---
+def test_pool_reuses_returned_connection():
+    pool = ConnectionPool("dsn", minconn=1, maxconn=2, connect=FakeConn)
+
+    conn = pool.getconn()
+    pool.putconn(conn)
+
+    assert pool.getconn() is conn
+    assert pool.in_use == 1
+    assert pool.idle == 0
+
+# --- 測試案例 2: 連線池用完時要在時限內失敗，而不是無限等待 ---
+def test_pool_exhausted_raises_timeout():
+    pool = ConnectionPool("dsn", minconn=0, maxconn=1, timeout=0.05, connect=FakeConn)
+    pool.getconn()
+
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+
+# --- 測試案例 3: 已斷線的連線不會被借出 ---
+def test_pool_discards_closed_connection():
+    pool = ConnectionPool("dsn", maxconn=1, connect=FakeConn)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.closed = 1
+
+    fresh = pool.getconn()
+    assert fresh is not conn
+    assert pool.in_use == 1
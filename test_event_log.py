@@ -0,0 +1,45 @@
+import logging
+import queue
+from event_log import DroppingQueueHandler, Event, EventLogger, parse_sample_rates
+
+# --- 測試案例 1: key=value 格式維持舊的 log 樣子，方便 grep / 解析 ---
+def test_event_renders_key_value_line():
+    event = Event("METRIC_AUTO_SEATING_USED", {"role": "guest", "seats": ["A1", "A2"], "duration": 0.1234})
+    assert str(event) == "METRIC_AUTO_SEATING_USED role=guest seats=A1,A2 duration=0.123"
+
+# --- 測試案例 2: JSON 格式輸出事件 ---
+def test_event_renders_json():
+    event = Event("METRIC_PAGE_VIEW", {"page": "index"}, as_json=True)
+    assert str(event) == '{"event": "METRIC_PAGE_VIEW", "page": "index"}'
+
+# --- 測試案例 3: 抽樣率 0 的事件完全不寫 log，其他事件照常 ---
+def test_sampling_drops_configured_events(caplog):
+    log_event = EventLogger(sample_rates=parse_sample_rates("METRIC_PAGE_VIEW=0"))
+    with caplog.at_level(logging.INFO):
+        log_event("METRIC_PAGE_VIEW", page="index")
+        log_event("METRIC_BOOKING_COMPLETED", order="ORD-001")
+
+    assert [r.getMessage() for r in caplog.records] == ["METRIC_BOOKING_COMPLETED order=ORD-001"]
+
+# --- 測試案例 4: buffer 滿了就丟棄並計數，不會卡住 request thread ---
+def test_full_queue_drops_and_counts():
+    class Counter:
+        value = 0
+        def inc(self):
+            self.value += 1
+
+    counter = Counter()
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1), counter)
+    record = logging.LogRecord("root", logging.INFO, __file__, 1, "msg", (), None)
+
+    handler.handle(record)
+    handler.handle(record)
+
+    assert counter.value == 1
+
+# --- 測試案例 5: 含 = 或換行的值會加上引號，不能偽造欄位或整行 log ---
+def test_key_value_quotes_equals_and_newlines():
+    event = Event("METRIC_PAGE_VIEW", {"page": "a role=admin\nMETRIC_FAKE x=1", "role": "k=v"})
+    line = str(event)
+    assert "\n" not in line
+    assert line == 'METRIC_PAGE_VIEW page="a role=admin\\nMETRIC_FAKE x=1" role="k=v"'
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+import experiments
+from experiments import ExperimentEvents, analyze, bootstrap, sequential_test, visits
+
+
+def make_events(n, auto_rate, seed):
+    """n 次座位頁造訪 (各 1~3 次 enter)，manual 轉換率 30%，auto 轉換率 auto_rate。"""
+    rng = np.random.default_rng(seed)
+    start = np.sort(rng.uniform(0, 86400, n))
+    mode = rng.integers(0, 2, n).astype(np.int8)
+    converted = rng.random(n) < np.where(mode == 1, auto_rate, 0.30)
+    visit = rng.permutation(n).astype(np.int64)
+    repeats = rng.integers(1, 4, n)
+    enter_time = np.repeat(start, repeats) + np.concatenate([np.arange(r) for r in repeats])
+    order = np.argsort(enter_time, kind="stable")
+    done = np.flatnonzero(converted)
+    dwell = rng.lognormal(np.where(mode[done] == 1, 3.3, 3.5), 0.5)
+    done_order = np.argsort(start[done] + dwell)
+    return ExperimentEvents(
+        enter_visit=np.repeat(visit, repeats)[order], enter_time=enter_time[order],
+        enter_mode=np.repeat(mode, repeats)[order], enter_role=np.zeros(enter_time.size),
+        done_visit=visit[done][done_order], done_time=(start[done] + dwell)[done_order],
+        done_mode=mode[done][done_order], done_role=np.zeros(done.size), done_dwell=dwell[done_order],
+    )
+
+
+# --- 測試案例 1: 從 log 串起座位頁與成交，算出轉換率與停留時間 ---
+def test_events_from_log_join_visits(tmp_path):
+    lines = [
+        "2025-12-01 10:00:00,000 [INFO] METRIC_SEAT_PAGE_ENTER role=guest mode=auto show=1 time=x visit=00000000000a",
+        "2025-12-01 10:00:03,000 [INFO] METRIC_SEAT_PAGE_ENTER role=guest mode=auto show=1 time=x visit=00000000000a",
+        "2025-12-01 10:00:05,000 [INFO] METRIC_SEAT_PAGE_ENTER role=member mode=manual show=1 time=x visit=00000000000b",
+        '2025-12-01 10:00:06,000 [INFO] {"event": "METRIC_SEAT_PAGE_ENTER", "role": "guest", "mode": "manual", "visit": "00000000000c"}',
+        "2025-12-01 10:00:40,000 [INFO] METRIC_BOOKING_COMPLETED role=guest customer=GUEST-x order=ORD-1 show=1 mode=auto dwell=40.000 visit=00000000000a",
+        "2025-12-01 10:00:41,000 [INFO] METRIC_BOOKING_COMPLETED role=member customer=MEMBER-y order=ORD-2 show=1",
+    ]
+
+    events = ExperimentEvents.from_log(lines)
+    events.save(tmp_path / "events.npz")
+    events = ExperimentEvents.load(tmp_path / "events.npz")
+    ids, _, arm, converted = visits(events, "mode")
+
+    assert list(ids) == [10, 11, 12]
+    assert list(arm) == [1, 0, 0]
+    assert list(converted) == [True, False, False]
+    assert list(events.done_dwell) == [40.0]
+
+
+# --- 測試案例 2: 分組 bootstrap 的信賴區間涵蓋真實的平均與中位數 ---
+def test_binned_bootstrap_intervals():
+    rng = np.random.default_rng(0)
+    x = rng.lognormal(3, 0.7, 500_000)
+
+    means, medians = bootstrap(x, n_boot=1000, rng=rng)
+
+    lo, hi = experiments.interval(means)
+    assert lo < np.exp(3 + 0.7 ** 2 / 2) < hi
+    lo, hi = experiments.interval(medians)
+    assert lo - 0.05 < np.exp(3) < hi + 0.05
+    assert means.std() == pytest.approx(x.std() / np.sqrt(x.size), rel=0.1)
+
+
+# --- 測試案例 3: mSPRT 沒有差異時不會停，有差異時提早停 ---
+def test_sequential_test_stops_only_on_real_effect():
+    rng = np.random.default_rng(5)
+    arm = rng.integers(0, 2, 100_000)
+    same = rng.random(arm.size) < 0.3
+    lifted = rng.random(arm.size) < np.where(arm == 1, 0.36, 0.3)
+
+    assert not sequential_test(arm, same, 0, 1)["stopped"]
+    result = sequential_test(arm, lifted, 0, 1, times=np.arange(arm.size))
+    assert result["stopped"] and result["stop_after"] < arm.size / 2
+    assert result["estimate"] == pytest.approx(0.06, abs=0.01)
+
+
+# --- 測試案例 4: 完整報表：auto 轉換率較高、停留較短 ---
+def test_analyze_reports_per_variant_and_difference():
+    report = analyze(make_events(50_000, 0.34, seed=2), variant="mode", n_boot=500, seed=1)
+
+    auto, manual = report["variants"]["auto"], report["variants"]["manual"]
+    assert auto["visits"] + manual["visits"] == 50_000
+    assert manual["conversion_ci"][0] < 0.30 < manual["conversion_ci"][1]
+    assert report["difference"]["conversion_ci"][0] > 0
+    assert report["difference"]["dwell_mean_ci"][1] < 0
+    assert report["sequential"]["conversion"]["stopped"]
@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from idempotency import IdempotencyCache, fingerprint
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+# --- 測試案例 1: 完成後的結果在 TTL 內會被重播，過期後重新處理 ---
+def test_completed_result_is_replayed_until_ttl():
+    clock = FakeClock()
+    cache = IdempotencyCache(ttl=60, clock=clock)
+
+    assert cache.begin("k") is None
+    cache.complete("k", {"order_id": "ORD-001"})
+    assert cache.begin("k") == {"order_id": "ORD-001"}
+
+    clock.now = 61
+    assert cache.begin("k") is None
+
+# --- 測試案例 2: 失敗 (release) 不留結果，重試可以重新處理 ---
+def test_released_key_can_be_retried():
+    cache = IdempotencyCache()
+
+    assert cache.begin("k") is None
+    cache.release("k")
+
+    assert cache.begin("k") is None
+
+# --- 測試案例 3: 處理中的重複請求等第一個完成，拿同一份結果 ---
+def test_concurrent_duplicate_waits_for_first_result():
+    cache = IdempotencyCache(wait_timeout=2)
+    assert cache.begin("k") is None
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cache.begin("k")))
+    waiter.start()
+
+    cache.complete("k", {"order_id": "ORD-002"})
+    waiter.join()
+
+    assert results == [{"order_id": "ORD-002"}]
+
+# --- 測試案例 4: 等太久還沒完成就放棄 (InFlight) ---
+def test_concurrent_duplicate_gives_up_after_wait_timeout():
+    cache = IdempotencyCache(wait_timeout=0.01)
+    cache.begin("k")
+
+    with pytest.raises(IdempotencyCache.InFlight):
+        cache.begin("k")
+
+# --- 測試案例 5: 超過上限時最舊的 key 被淘汰；fingerprint 結果固定 ---
+def test_oldest_keys_are_evicted_and_fingerprint_is_stable():
+    cache = IdempotencyCache(maxsize=2)
+    for key in ("a", "b", "c"):
+        cache.begin(key)
+        cache.complete(key, key)
+
+    assert cache.begin("a") is None
+    assert fingerprint("MEMBER-admin", 1, ["A1"]) == fingerprint("MEMBER-admin", 1, ["A1"])
+    assert len(fingerprint("x")) == 64
@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from latency_histogram import LatencyHistogram
+
+# --- 測試案例 1: 各種量級的百分位數誤差都在 ~1.6% 以內 ---
+def test_percentiles_stay_within_relative_error():
+    rng = random.Random(7)
+    values = sorted(rng.lognormvariate(-4, 1.5) for _ in range(20000))
+    histogram = LatencyHistogram()
+    for v in values:
+        histogram.record(v)
+
+    for q in (50, 90, 99, 99.9):
+        exact = values[int(q / 100 * len(values)) - 1]
+        assert histogram.percentile(q) == pytest.approx(exact, rel=0.02, abs=2e-6)
+    assert histogram.count == 20000
+    assert histogram.percentile(100) == pytest.approx(values[-1], rel=0.02)
+
+# --- 測試案例 2: 每個值都落在自己 bucket 的上下界之間 ---
+def test_bucket_bounds_cover_each_value():
+    histogram = LatencyHistogram(precision_bits=4)
+    for value in range(0, 5000):
+        low, high = histogram._bounds(histogram._index(value))
+        assert low <= value <= high
+
+# --- 測試案例 3: 合併時次數相加，精度設定不同就拒絕 ---
+def test_merge_adds_counts_and_rejects_mismatched_settings():
+    a, b = LatencyHistogram(), LatencyHistogram()
+    a.record(0.010)
+    b.record(0.200, count=3)
+
+    a.merge(b)
+
+    assert (a.count, a.max) == (4, 0.200)
+    assert a.percentile(50) == pytest.approx(0.200, rel=0.02)
+    assert sum(n for _, _, n in a.buckets()) == 4
+    with pytest.raises(ValueError):
+        a.merge(LatencyHistogram(precision_bits=5))
@@ -0,0 +1,39 @@
+import argparse
+import csv
+import itertools
+import random
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+import load_test  # noqa: E402
+
+# --- 測試案例 1: 流量組合解析，抵達間隔平均符合設定的速率 ---
+def test_parse_mix_and_arrival_gaps():
+    assert load_test.parse_mix("guest=6, member=3,browse") == {"guest": 6.0, "member": 3.0, "browse": 1.0}
+    with pytest.raises(argparse.ArgumentTypeError):
+        load_test.parse_mix("admin=1")
+
+    gaps = list(itertools.islice(load_test.arrival_gaps(100, rng=random.Random(1)), 5000))
+    assert sum(gaps) / len(gaps) == pytest.approx(0.01, rel=0.1)
+    assert set(itertools.islice(load_test.arrival_gaps(4, poisson=False), 3)) == {0.25}
+
+# --- 測試案例 2: 報表依 endpoint 分開統計錯誤類型，並輸出 CSV ---
+def test_report_breaks_down_errors_per_endpoint(tmp_path):
+    stats = load_test.LoadStats()
+    stats.endpoints["book"].observe(0.020, 200)
+    stats.endpoints["book"].observe(0.030, 400, load_test.classify(400, '{"error": "所選座位已被搶先預訂"}'.encode()))
+    stats.endpoints["seat_config"].observe(0.005, error="timeout")
+    config = argparse.Namespace(target="http://127.0.0.1:5000", rate=10)
+
+    report = stats.report(config)
+    load_test.write_csv(report, tmp_path / "report.csv")
+
+    book = report["endpoints"]["book"]
+    assert book["error_kinds"] == {"http_400: 所選座位已被搶先預訂": 1}
+    assert book["status"] == {"200": 1, "400": 1}
+    assert book["latency_ms"]["max"] == pytest.approx(30)
+    with open(tmp_path / "report.csv", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [(r["kind"], r["name"], r["errors"]) for r in rows] == [("endpoint", "book", "1"), ("endpoint", "seat_config", "1")]
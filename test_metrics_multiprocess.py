@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+SCRIPT = """
+import sys
+from app import app
+client = app.test_client()
+client.get('/api/init-flow')
+if sys.argv[1] == 'scrape':
+    print(client.get('/metrics').get_data(as_text=True))
+"""
+
+def run_worker(env, role):
+    result = subprocess.run([sys.executable, "-c", SCRIPT, role], env=env, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+# --- 測試案例 1: 多個 worker 的 metrics 會被彙總，不再只看到被 scrape 到的那一個 ---
+def test_metrics_are_aggregated_across_workers(tmp_path):
+    """
+    場景：兩個獨立 process (模擬兩個 gunicorn worker) 各處理一個請求，
+    任一個 worker 回傳的 /metrics 都要看到兩個請求
+    """
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path), DATABASE_URL="")
+
+    run_worker(env, "serve")
+    output = run_worker(env, "scrape")
+
+    assert 'flask_http_request_total{method="GET",status="200"} 2.0' in output
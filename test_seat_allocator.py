@@ -0,0 +1,45 @@
+from seat_allocator import SeatIndex
+from seat_snapshot import SeatSnapshot
+
+def make_index():
+    seats = []
+    for r_idx, row in enumerate("ABCD"):
+        for col in range(1, 9):
+            s_type = "front" if r_idx == 0 else "center"
+            if col in (1, 8): s_type = "aisle"
+            seats.append((f"{row}{col}", s_type))
+    return SeatIndex(seats)
+
+def snapshot(sold=(), version=1):
+    return SeatSnapshot(version, frozenset(sold), 0.0)
+
+# --- 測試案例 1: 四人同行要坐在同一排、連續的位子 ---
+def test_party_gets_contiguous_block_in_one_row():
+    index = make_index()
+    seats = index.find_block(snapshot({"B4", "C5"}), 4, "center")
+
+    rows = {s[0] for s in seats}
+    cols = sorted(int(s[1:]) for s in seats)
+    assert len(rows) == 1
+    assert cols == list(range(cols[0], cols[0] + 4))
+
+# --- 測試案例 2: 偏好前排時優先選最前面的排 ---
+def test_front_preference_picks_front_row():
+    index = make_index()
+    assert index.find_block(snapshot(), 2, "front") == ["A4", "A5"]
+
+# --- 測試案例 3: 沒有足夠連續位子時退回零散配位，完全不夠才失敗 ---
+def test_falls_back_to_scattered_then_none():
+    index = make_index()
+    sold = {f"{r}{c}" for r in "ABCD" for c in range(1, 9)} - {"A1", "C8"}
+
+    assert sorted(index.find_block(snapshot(sold), 2, "aisle")) == ["A1", "C8"]
+    assert index.find_block(snapshot(sold), 3, "aisle") is None
+
+# --- 測試案例 4: 搶位失敗的座位下次會被排除 ---
+def test_exclude_skips_previously_failed_seats():
+    index = make_index()
+    first = index.find_block(snapshot(), 2, "center")
+    second = index.find_block(snapshot(), 2, "center", exclude=first)
+
+    assert not set(first) & set(second)
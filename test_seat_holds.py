@@ -0,0 +1,35 @@
+from prometheus_client import CollectorRegistry, Counter
+from seat_holds import HoldSweeper
+
+# --- 測試案例 1: 一批滿了就接著清下一批，並累計到 counter ---
+def test_sweeper_drains_full_batches():
+    registry = CollectorRegistry()
+    released = Counter('released', 'released', registry=registry)
+    batches = [3, 3, 1]
+    calls = []
+
+    def sweep(limit):
+        calls.append(limit)
+        return batches.pop(0)
+
+    sweeper = HoldSweeper(sweep, batch_size=3, released_counter=released)
+
+    assert sweeper.run_once() == 7
+    assert calls == [3, 3, 3]
+    assert registry.get_sample_value('released_total') == 7
+
+# --- 測試案例 2: DB 出錯時記 log 並等下一輪，不會讓背景 thread 掛掉 ---
+def test_sweeper_survives_failed_sweep(caplog):
+    def sweep(limit):
+        raise RuntimeError("db down")
+
+    sweeper = HoldSweeper(sweep, batch_size=3)
+
+    assert sweeper.run_once() == 0
+    assert "HOLD_SWEEP_FAILED" in caplog.text
+
+# --- 測試案例 3: interval <= 0 代表關閉 ---
+def test_zero_interval_disables_sweeper():
+    sweeper = HoldSweeper(lambda limit: 0, interval=0)
+    sweeper.start()
+    assert sweeper._thread is None
@@ -0,0 +1,54 @@
+from seat_snapshot import SeatAvailabilityCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+# --- 測試案例 1: TTL 內不重查 DB，過期才重新載入 ---
+def test_snapshot_refreshes_after_ttl():
+    calls = []
+    clock = FakeClock()
+    cache = SeatAvailabilityCache(lambda: calls.append(1) or {"A1"}, ttl=2.0, clock=clock)
+
+    first = cache.get()
+    assert cache.get() is first
+    clock.now = 2.5
+    second = cache.get()
+
+    assert len(calls) == 2
+    assert second.version > first.version
+
+# --- 測試案例 2: 訂票成功後發布新版本，舊快照不會被改動 (copy-on-write) ---
+def test_mark_sold_is_copy_on_write():
+    cache = SeatAvailabilityCache(lambda: {"A1"}, ttl=60)
+    before = cache.get()
+
+    cache.mark_sold(["B2"])
+    after = cache.get()
+
+    assert before.sold == {"A1"}
+    assert after.sold == {"A1", "B2"}
+    assert after.version == before.version + 1
+
+# --- 測試案例 3: DB 暫時失敗時沿用上一版快照 ---
+def test_failed_refresh_keeps_previous_snapshot():
+    clock = FakeClock()
+    results = [{"A1"}, None]
+    cache = SeatAvailabilityCache(lambda: results.pop(0), ttl=1.0, clock=clock)
+    cache.get()
+    clock.now = 5.0
+
+    assert cache.get().sold == {"A1"}
+
+# --- 測試案例 4: 保留過期 / 取消時把座位放回快照 ---
+def test_mark_available_releases_seats():
+    cache = SeatAvailabilityCache(lambda: {"A1", "A2"}, ttl=60)
+    before = cache.get()
+
+    cache.mark_available(["A2", "C9"])
+
+    assert before.sold == {"A1", "A2"}
+    assert cache.get().sold == {"A1"}
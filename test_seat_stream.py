@@ -0,0 +1,62 @@
+import json
+
+from seat_stream import SeatBroadcaster, SeatChangeListener, stream_events
+
+def parse(chunk):
+    fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+    return fields.get("event"), json.loads(fields["data"])
+
+# --- 測試案例 1: 只推給同一場次的訂閱者，超過上限就拒絕 ---
+def test_broadcaster_fans_out_per_show_and_caps_subscribers():
+    broadcaster = SeatBroadcaster(max_subscribers=2)
+    show1 = broadcaster.subscribe(1)
+    show2 = broadcaster.subscribe(2)
+
+    assert broadcaster.subscribe(1) is None
+    broadcaster.publish(1, ["A1", "A2"], 1)
+
+    assert show1.get(0.01) == {"seats": ["A1", "A2"], "status": 1}
+    assert show2.get(0.01) is None
+    show2.close()
+    assert broadcaster.subscribe(1) is not None
+
+# --- 測試案例 2: 消化太慢的 client 不會卡住 publish，改送一次完整快照 ---
+def test_slow_subscriber_is_resynced_with_snapshot():
+    broadcaster = SeatBroadcaster(queue_size=1)
+    sub = broadcaster.subscribe(1)
+    broadcaster.publish(1, ["A1"], 1)
+    broadcaster.publish(1, ["A2"], 1)
+
+    chunks = stream_events(sub, lambda: {"A1", "A2"}, max_age=1, heartbeat=0.01)
+    assert next(chunks).startswith("retry:")
+    assert parse(next(chunks)) == ("snapshot", {"sold": ["A1", "A2"]})
+    assert parse(next(chunks)) == ("snapshot", {"sold": ["A1", "A2"]})
+    assert next(chunks) == ": keepalive\n\n"
+    chunks.close()
+
+    assert broadcaster.subscribe(1) is not None
+
+# --- 測試案例 3: 只推有變動的座位，超過 max_age 就結束連線 ---
+def test_stream_sends_deltas_and_ends_after_max_age():
+    now = [0.0]
+    broadcaster = SeatBroadcaster()
+    sub = broadcaster.subscribe(1)
+    chunks = stream_events(sub, lambda: set(), max_age=30, heartbeat=0.01, clock=lambda: now[0])
+    next(chunks), next(chunks)
+
+    broadcaster.publish(1, ["C3"], 1)
+    assert parse(next(chunks)) == ("seats", {"seats": ["C3"], "status": 1})
+
+    now[0] = 31
+    assert list(chunks) == []
+    assert broadcaster.subscribe(1) is not None
+
+# --- 測試案例 4: NOTIFY payload 轉成 callback(show_id, seats, status)，壞資料只記 log ---
+def test_listener_dispatches_notifications():
+    received = []
+    listener = SeatChangeListener("", lambda *args: received.append(args))
+
+    listener._dispatch('{"show":2,"seats":["A1","A2"],"status":1}')
+    listener._dispatch("not json")
+
+    assert received == [(2, ["A1", "A2"], 1)]
@@ -0,0 +1,130 @@
+import pytest
+from flask import Flask, session
+
+from server_session import MemorySessionStore, ServerSessionInterface, SqliteSessionStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingStore(MemorySessionStore):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.writes = 0
+
+    def set(self, sid, payload, ttl):
+        self.writes += 1
+        super().set(sid, payload, ttl)
+
+
+def make_app(store, **kwargs):
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.session_interface = ServerSessionInterface(store, **kwargs)
+
+    @app.route("/guest")
+    def guest():
+        session["role"] = "guest"
+        session["guest_token"] = "tok"
+        return "ok"
+
+    @app.route("/login")
+    def login():
+        session["role"] = "member"
+        session["user_id"] = "admin"
+        return "ok"
+
+    @app.route("/touch")
+    def touch():
+        # 寫入同樣的值：資料沒變就不應該寫 store
+        session["role"] = session.get("role", "anon")
+        return session.get("role")
+
+    @app.route("/logout")
+    def logout():
+        session.clear()
+        return "ok"
+
+    return app
+
+
+# --- 測試案例 1: cookie 只帶 id，資料沒變時不寫 store、不送 Set-Cookie ---
+def test_writes_only_when_session_changes():
+    store = CountingStore()
+    client = make_app(store).test_client()
+
+    first = client.get("/guest")
+    again = client.get("/touch")
+
+    assert len(first.headers["Set-Cookie"].split(";")[0].split("=", 1)[1]) == 32
+    assert again.get_data(as_text=True) == "guest"
+    assert "Set-Cookie" not in again.headers
+    assert store.writes == 1
+
+
+# --- 測試案例 2: 訪客 session 閒置超過 guest_ttl 就失效；活躍時自動延長 ---
+def test_guest_sessions_expire_after_guest_ttl():
+    clock = Clock()
+    store = CountingStore(clock=clock)
+    client = make_app(store, ttl=3600, guest_ttl=100).test_client()
+    client.get("/guest")
+
+    clock.now += 60
+    assert client.get("/touch").get_data(as_text=True) == "guest"
+    assert store.writes == 2  # 剩不到一半的 TTL，順便延長
+
+    clock.now += 90
+    assert client.get("/touch").get_data(as_text=True) == "guest"
+    clock.now += 101
+    assert client.get("/touch").get_data(as_text=True) == "anon"
+
+
+# --- 測試案例 3: 登入換新 id，登出刪除 ---
+def test_login_rotates_id_and_logout_deletes():
+    store = MemorySessionStore()
+    client = make_app(store).test_client()
+    client.get("/guest")
+    guest_sid = client.get_cookie("session").value
+
+    client.get("/login")
+    member_sid = client.get_cookie("session").value
+    assert member_sid != guest_sid
+    assert store.get(guest_sid) is None
+
+    client.get("/logout")
+    assert store.get(member_sid) is None
+    assert client.get_cookie("session") is None
+
+
+# --- 測試案例 4: LRU 上限 ---
+def test_memory_store_evicts_least_recently_used():
+    store = MemorySessionStore(maxsize=2)
+    store.set("a", "{}", 60)
+    store.set("b", "{}", 60)
+    store.get("a")
+    store.set("c", "{}", 60)
+
+    assert store.get("b") is None
+    assert store.get("a") is not None and len(store) == 2
+
+
+# --- 測試案例 5: SQLite store 由多個 worker 共用，過期資料會被清掉 ---
+def test_sqlite_store_is_shared_and_purges(tmp_path):
+    clock = Clock()
+    path = str(tmp_path / "sessions.sqlite3")
+    worker_a = SqliteSessionStore(path, purge_interval=0, clock=clock)
+    worker_b = SqliteSessionStore(path, purge_interval=0, clock=clock)
+
+    worker_a.set("sid-1", '{"role": "guest"}', 30)
+    assert worker_b.get("sid-1") == ('{"role": "guest"}', pytest.approx(30))
+
+    clock.now += 31
+    assert worker_b.get("sid-1") is None
+    worker_b.set("sid-2", "{}", 30)
+    count = worker_a._connect().execute("SELECT count(*) FROM sessions").fetchone()[0]
+    assert count == 1
@@ -0,0 +1,67 @@
+import threading
+
+import importtime_check
+from prometheus_client import CollectorRegistry, Gauge
+from startup import StartupTimer, run_in_background
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 10.0
+
+    def __call__(self):
+        return self.now
+
+
+# --- 測試案例 1: 各階段的耗時 (mark 接續上一次，phase 只算區塊本身) 匯出成 gauge ---
+def test_startup_phases_are_exported():
+    clock = FakeClock()
+    timer = StartupTimer(started=9.0, clock=clock)
+    timer.mark("imports")
+    clock.now = 10.5
+    with timer.phase("toggles"):
+        clock.now = 10.75
+    clock.now = 11.0
+    timer.mark("module")
+
+    registry = CollectorRegistry()
+    gauge = Gauge('startup', 'startup', ['phase'], registry=registry)
+    timer.export(gauge)
+
+    assert registry.get_sample_value('startup', {'phase': 'imports'}) == 1.0
+    assert registry.get_sample_value('startup', {'phase': 'toggles'}) == 0.25
+    assert registry.get_sample_value('startup', {'phase': 'module'}) == 1.0
+    assert timer.total() == 2.0
+
+# --- 測試案例 2: 背景暖機某一步失敗時記 log，後面的步驟照常執行 ---
+def test_warm_up_continues_after_failed_step(caplog):
+    done = threading.Event()
+
+    def connect_db():
+        raise RuntimeError("db down")
+
+    run_in_background("warm-up", [connect_db, done.set]).join(5)
+
+    assert done.is_set()
+    assert "WARMUP_FAILED step=connect_db" in caplog.text
+
+# --- 測試案例 3: -X importtime 的輸出依樹狀結構解析 ---
+def test_parse_importtime_tree():
+    rows = importtime_check.parse_importtime(
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       100 |        100 |   certifi\n"
+        "import time:       200 |        300 | site\n"
+        "import time:       500 |        500 |     jinja2\n"
+        "import time:      1000 |       1500 |   flask\n"
+        "import time:        50 |         50 |   db_pool\n"
+        "import time:      2000 |       3550 | app\n"
+    )
+
+    assert importtime_check.direct_imports(rows, "app") == [(0.0015, "flask"), (0.00005, "db_pool")]
+    assert rows[-1] == ("app", 0.002, 0.00355, 0)
+
+# --- 測試案例 4: import app 不載入 psycopg2 / psutil / featuretoggles，也不連 DB ---
+def test_import_app_keeps_heavy_modules_lazy():
+    rows = importtime_check.import_once("app")
+
+    assert importtime_check.eager_lazy_modules(rows) == []
@@ -0,0 +1,61 @@
+import gzip
+
+import pytest
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from static_pages import PrerenderedPage, PrerenderedPages
+
+brotli = pytest.importorskip("brotli")
+
+
+class Counter:
+    def __init__(self):
+        self.values = {}
+
+    def labels(self, page):
+        counter = self
+
+        class Child:
+            def inc(self):
+                counter.values[page] = counter.values.get(page, 0) + 1
+        return Child()
+
+
+def make_client(counter=None):
+    fallback = Response("from flask")
+    pages = {"/": PrerenderedPage("index", "<h1>影城</h1>".encode("utf-8") * 50)}
+    return Client(PrerenderedPages(fallback, pages, max_age=30, view_counter=counter))
+
+
+# --- 測試案例 1: 依 Accept-Encoding 回傳預先壓縮好的內容 ---
+def test_serves_precompressed_variants():
+    client = make_client()
+
+    br = client.get("/", headers={"Accept-Encoding": "gzip, deflate, br"})
+    gz = client.get("/", headers={"Accept-Encoding": "gzip;q=1, br;q=0"})
+    plain = client.get("/")
+
+    assert br.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(br.data) == plain.data
+    assert gz.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(gz.data) == plain.data
+    assert "Content-Encoding" not in plain.headers
+    assert len({br.headers["ETag"], gz.headers["ETag"], plain.headers["ETag"]}) == 3
+    assert br.headers["Cache-Control"] == "public, max-age=30"
+    assert br.headers["Vary"] == "Accept-Encoding"
+
+
+# --- 測試案例 2: ETag 相同回 304；其他路徑與方法交給 Flask ---
+def test_conditional_get_and_fallthrough():
+    counter = Counter()
+    client = make_client(counter)
+    etag = client.get("/", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+
+    revalidated = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+
+    assert revalidated.status_code == 304 and revalidated.data == b""
+    assert client.get("/api/x").data == b"from flask"
+    assert client.post("/").data == b"from flask"
+    assert client.head("/").data == b""
+    assert counter.values == {"index": 2}
@@ -0,0 +1,23 @@
+import os
+from prometheus_client import CollectorRegistry, Gauge
+from system_metrics import SystemMetricsSampler
+
+# --- 測試案例 1: 取樣結果以 worker (pid) 為 label ---
+def test_sample_sets_per_worker_gauges():
+    registry = CollectorRegistry()
+    cpu = Gauge('cpu', 'cpu', ['worker'], registry=registry)
+    mem = Gauge('mem', 'mem', ['worker'], registry=registry)
+    sampler = SystemMetricsSampler(cpu, mem, interval=60)
+
+    sampler.start()
+    sampler.stop()
+
+    worker = str(os.getpid())
+    assert registry.get_sample_value('mem', {'worker': worker}) > 0
+    assert registry.get_sample_value('cpu', {'worker': worker}) is not None
+
+# --- 測試案例 2: interval <= 0 代表關閉取樣 ---
+def test_zero_interval_disables_sampler():
+    sampler = SystemMetricsSampler(None, None, interval=0)
+    sampler.start()
+    assert sampler._thread is None
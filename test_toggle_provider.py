@@ -0,0 +1,49 @@
+import os
+from app import CinemaToggles, load_cinema_toggles
+from toggle_provider import ReloadingToggles
+
+TEMPLATE = """
+guest_checkout:
+  value: true
+  name: Guest Checkout MVF
+  jira: DEVOPS-001
+  creation_date: 2025-11-22
+auto_seating:
+  value: {auto}
+  name: Smart Seat Allocation
+  jira: DEVOPS-002
+  creation_date: 2025-11-22
+"""
+
+def write(path, text, mtime):
+    path.write_text(text)
+    os.utime(path, (mtime, mtime))
+
+# --- 測試案例 1: 修改 toggles.yaml 後不用重啟就會生效 (Kill Switch) ---
+def test_reload_picks_up_changed_file(tmp_path):
+    path = tmp_path / "toggles.yaml"
+    write(path, TEMPLATE.format(auto="true"), 1000)
+    toggles = ReloadingToggles(str(path), CinemaToggles, interval=0, loader=load_cinema_toggles)
+    assert toggles.auto_seating is True
+
+    write(path, TEMPLATE.format(auto="false"), 2000)
+    assert toggles.reload() is True
+    assert toggles.auto_seating is False
+    assert toggles.guest_checkout is True
+
+# --- 測試案例 2: 設定檔寫壞時沿用上一份正確的設定 ---
+def test_broken_file_keeps_last_good_snapshot(tmp_path):
+    path = tmp_path / "toggles.yaml"
+    write(path, TEMPLATE.format(auto="true"), 1000)
+    toggles = ReloadingToggles(str(path), CinemaToggles, interval=0, loader=load_cinema_toggles)
+
+    write(path, "auto_seating: [", 2000)
+    toggles.reload()
+
+    assert toggles.auto_seating is True
+
+# --- 測試案例 3: 找不到設定檔時全部關閉 ---
+def test_missing_file_defaults_to_off(tmp_path):
+    toggles = ReloadingToggles(str(tmp_path / "missing.yaml"), CinemaToggles, interval=0, loader=load_cinema_toggles)
+    assert toggles.guest_checkout is False
+    assert toggles.auto_seating is False
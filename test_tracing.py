@@ -0,0 +1,112 @@
+import json
+import os
+
+import pytest
+
+from tracing import NOOP_SPAN, JsonLinesSpanExporter, Tracer
+
+class FakeHistogram:
+    def __init__(self):
+        self.observed = []
+
+    def labels(self, stage):
+        self.stage = stage
+        return self
+
+    def observe(self, value):
+        self.observed.append((self.stage, value))
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+# --- 測試案例 1: 巢狀 span 共用同一個 trace，每個階段各自記到 histogram ---
+def test_nested_spans_share_trace_and_feed_stage_histogram():
+    histogram, exporter = FakeHistogram(), ListExporter()
+    tracer = Tracer(stage_histogram=histogram, exporter=exporter)
+
+    @tracer.traced("db.commit")
+    def commit():
+        pass
+
+    with tracer.span("booking", show=1) as root:
+        with tracer.span("db.claim", seats=2):
+            pass
+        commit()
+
+    claim, commit_span, booking = exporter.spans
+    assert [stage for stage, _ in histogram.observed] == ["db.claim", "db.commit", "booking"]
+    assert claim.trace_id == commit_span.trace_id == booking.trace_id
+    assert claim.parent_id == commit_span.parent_id == root.span_id
+    assert root.duration >= claim.duration > 0
+
+# --- 測試案例 2: 階段失敗時 span 標記錯誤並把例外往外丟 ---
+def test_failed_stage_is_marked_and_reraised():
+    exporter = ListExporter()
+    tracer = Tracer(exporter=exporter)
+
+    with pytest.raises(RuntimeError):
+        with tracer.span("db.claim"):
+            raise RuntimeError("deadlock")
+
+    assert exporter.spans[0].error == "RuntimeError"
+
+# --- 測試案例 3: 關閉時只回傳共用的 no-op span ---
+def test_disabled_tracer_returns_shared_noop_span():
+    tracer = Tracer(stage_histogram=FakeHistogram(), enabled=False)
+
+    with tracer.span("db.commit") as span:
+        pass
+
+    assert span is NOOP_SPAN
+    assert span.duration == 0.0
+
+# --- 測試案例 4: 匯出成 OTLP/JSON，一行一批 ---
+def test_exporter_writes_otlp_json_lines(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    exporter = JsonLinesSpanExporter(str(path))
+    exporter._pid = os.getpid()  # 不啟動背景 thread，最後直接 flush
+    tracer = Tracer(exporter=exporter)
+
+    with tracer.span("booking", show=3, role="member"):
+        with tracer.span("db.commit"):
+            pass
+    exporter.flush()
+
+    batch = json.loads(path.read_text(encoding="utf-8").splitlines()[0])
+    spans = batch["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in spans] == ["db.commit", "booking"]
+    assert spans[0]["parentSpanId"] == spans[1]["spanId"]
+    assert {"key": "show", "value": {"intValue": "3"}} in spans[1]["attributes"]
+    assert int(spans[1]["endTimeUnixNano"]) >= int(spans[1]["startTimeUnixNano"])
+    assert spans[1]["status"] == {"code": 1}
+
+# --- 測試案例 5: 多個 thread 同時第一次匯出，只會啟動一個寫入 thread ---
+def test_concurrent_first_exports_start_one_writer(tmp_path, monkeypatch):
+    import threading
+    import time
+    exporter = JsonLinesSpanExporter(str(tmp_path / "spans.jsonl"))
+    started = []
+    original = threading.Thread.start
+    def slow_start(thread):
+        if thread.name == "span-exporter":
+            started.append(thread)
+            time.sleep(0.01)  # 拉長「檢查 -> 啟動」之間的空檔
+        original(thread)
+    monkeypatch.setattr(threading.Thread, "start", slow_start)
+    barrier = threading.Barrier(8)
+
+    def work():
+        barrier.wait()
+        exporter.start()
+
+    workers = [threading.Thread(target=work) for _ in range(8)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+    assert len(started) == 1
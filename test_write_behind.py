@@ -0,0 +1,53 @@
+from prometheus_client import CollectorRegistry, Counter
+from write_behind import WriteBehindBuffer
+
+# --- 測試案例 1: 依 batch_size 分批寫入 ---
+def test_flush_writes_in_batches():
+    batches = []
+    buffer = WriteBehindBuffer(batches.append, batch_size=2)
+    for i in range(5):
+        buffer.put(i)
+
+    assert buffer.flush() == 5
+    assert batches == [[0, 1], [2, 3], [4]]
+
+# --- 測試案例 2: buffer 滿了直接丟掉，不會卡住 request thread ---
+def test_full_buffer_drops_rows():
+    registry = CollectorRegistry()
+    dropped = Counter('dropped', 'dropped', registry=registry)
+    buffer = WriteBehindBuffer(lambda rows: None, max_size=2, dropped_counter=dropped)
+
+    assert [buffer.put(i) for i in range(3)] == [True, True, False]
+    assert registry.get_sample_value('dropped_total') == 1
+
+# --- 測試案例 3: 寫入失敗的批次記 log 並計數，後面的批次照常寫 ---
+def test_failed_batch_is_counted_and_skipped(caplog):
+    registry = CollectorRegistry()
+    dropped = Counter('dropped', 'dropped', registry=registry)
+    written = []
+
+    def write(rows):
+        if rows[0] == 0:
+            raise RuntimeError("db down")
+        written.extend(rows)
+
+    buffer = WriteBehindBuffer(write, batch_size=2, dropped_counter=dropped)
+    for i in range(4):
+        buffer.put(i)
+
+    assert buffer.flush() == 2
+    assert written == [2, 3]
+    assert registry.get_sample_value('dropped_total') == 2
+    assert "WRITE_BEHIND_FLUSH_FAILED" in caplog.text
+
+# --- 測試案例 4: 背景 thread 定期寫入，close() 時把剩下的寫完 ---
+def test_background_flush_and_close():
+    written = []
+    buffer = WriteBehindBuffer(written.extend, batch_size=100, interval=60)
+    buffer.start()
+    buffer.put("a")
+    buffer.put("b")
+
+    buffer.close()
+    assert written == ["a", "b"]
+    assert not buffer._thread.is_alive()
@@ -0,0 +1,216 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from functools import wraps
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed stage. ``duration`` (seconds) is set when the block exits."""
+
+    __slots__ = ("tracer", "name", "attributes", "trace_id", "span_id", "parent_id", "sampled",
+                 "start", "start_ns", "duration", "error", "_token")
+
+    def __init__(self, tracer, name, attributes, parent):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.duration = 0.0
+        self.error = None
+        if parent is None:
+            self.trace_id = None
+            self.parent_id = None
+            self.sampled = tracer.exporter is not None and random.random() < tracer.sample_rate
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            self.sampled = parent.sampled
+        if self.sampled:
+            self.trace_id = self.trace_id or os.urandom(16).hex()
+            self.span_id = os.urandom(8).hex()
+        else:
+            self.span_id = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        if self.sampled:
+            self.start_ns = time.time_ns()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self.tracer._finish(self)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+    duration = 0.0
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """``with tracer.span("db.commit"):`` / ``@tracer.traced("db.load_sold")``.
+
+    Each finished span is observed in ``stage_histogram`` (labelled by
+    ``stage``) and, for a ``sample_rate`` fraction of root spans and all their
+    children, handed to ``exporter``. Spans nest through a context variable,
+    so children share the trace id of the request's root span. A disabled
+    tracer hands out a shared no-op span: no clock reads, no allocation.
+    """
+
+    def __init__(self, stage_histogram=None, exporter=None, sample_rate=1.0, enabled=True):
+        self.stage_histogram = stage_histogram
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.enabled = enabled and (stage_histogram is not None or exporter is not None)
+        self._stages = {}
+
+    def span(self, name, **attributes):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes, _current_span.get())
+
+    def traced(self, name):
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _finish(self, span):
+        if self.stage_histogram is not None:
+            child = self._stages.get(span.name)
+            if child is None:
+                child = self._stages.setdefault(span.name, self.stage_histogram.labels(stage=span.name))
+            child.observe(span.duration)
+        if span.sampled:
+            self.exporter.export(span)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_span(span):
+    """The span in OTLP/JSON field names (one ``Span`` of ``resourceSpans[].scopeSpans[].spans``)."""
+    record = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.start_ns + int(span.duration * 1e9)),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        record["parentSpanId"] = span.parent_id
+    return record
+
+
+class JsonLinesSpanExporter:
+    """Appends spans as OTLP/JSON lines to ``path`` from a background thread.
+
+    ``export()`` only enqueues; a full buffer drops the span (counted in
+    ``dropped_counter``) rather than slowing the request down.
+    """
+
+    def __init__(self, path, service_name="cinema-booking", maxsize=10000, dropped_counter=None):
+        self.path = path
+        self.resource = {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]}
+        self.dropped_counter = dropped_counter
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._pid = None
+        self._thread = None
+        # start() / 寫檔 / flush() 共用：只會有一個寫入 thread，atexit 的 flush 也不會跟它交錯寫
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+        if hasattr(os, "register_at_fork"):
+            # fork 當下別的 thread 可能正拿著 lock，子 process 換一把新的
+            os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        if self._pid != os.getpid():
+            self.start()
+        try:
+            self._queue.put_nowait(otlp_span(span))
+        except queue.Full:
+            if self.dropped_counter is not None:
+                self.dropped_counter.inc()
+
+    def _write(self, spans):
+        line = json.dumps({"resourceSpans": [{"resource": self.resource, "scopeSpans": [
+            {"scope": {"name": "cinema.tracing"}, "spans": spans}
+        ]}]}, separators=(",", ":"))
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def _run(self):
+        while True:
+            spans = [self._queue.get()]
+            while len(spans) < 512:
+                try:
+                    spans.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self._lock:
+                    self._write(spans)
+            except Exception as e:
+                logging.error(f"TRACE_EXPORT_FAILED path={self.path} error={e}")
+
+    def flush(self):
+        with self._lock:
+            spans = []
+            while True:
+                try:
+                    spans.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if spans:
+                self._write(spans)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
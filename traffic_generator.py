@@ -1,11 +1,13 @@
+import os
 import requests
 import time
 import random
 import threading
+import uuid
 from datetime import datetime
 
-# 你的 Render 網址
-BASE_URL = "https://assignment12-ia30.onrender.com/"
+# 你的 Render 網址 (TARGET_URL 可改打本機)；要測吞吐量 / 延遲分佈請用 load_test.py
+BASE_URL = os.environ.get("TARGET_URL", "https://assignment12-ia30.onrender.com/").rstrip("/")
 
 # 模擬 User-Agent
 HEADERS = {
@@ -92,7 +94,16 @@ def simulate_real_guest_behavior():
 
             # === Step 3: 送出訂單 ===
             # 這裡一樣要用 session.post 帶上 Cookie
-            book_res = session.post(f"{BASE_URL}/api/book", json=payload)
+            # 逾時重試沿用同一個 Idempotency-Key，Server 會直接回傳第一次的結果
+            booking_headers = {"Idempotency-Key": str(uuid.uuid4())}
+            for attempt in range(3):
+                try:
+                    book_res = session.post(f"{BASE_URL}/api/book", json=payload, headers=booking_headers, timeout=10)
+                    break
+                except requests.Timeout:
+                    log(f"⏳ {log_msg} -> 逾時，重試 ({attempt + 1})")
+            else:
+                continue
             
             if book_res.status_code == 200:
                 res_data = book_res.json()
@@ -0,0 +1,101 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+
+
+class WriteBehindBuffer:
+    """Rows are queued in memory and written in batches by a background thread.
+
+    ``put()`` never blocks the request thread: once ``max_size`` rows are
+    waiting, new rows are dropped (and counted). ``write(rows)`` gets up to
+    ``batch_size`` rows at a time, at least every ``interval`` seconds or as
+    soon as a full batch is waiting. A failed batch is logged and dropped;
+    ``close()`` (also registered with atexit) writes whatever is left.
+    """
+
+    def __init__(self, write, max_size=10000, batch_size=500, interval=1.0,
+                 queued_gauge=None, dropped_counter=None, written_counter=None):
+        self.write = write
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queued_gauge = queued_gauge
+        self.dropped_counter = dropped_counter
+        self.written_counter = written_counter
+        self._queue = queue.Queue(max_size)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+
+    def put(self, row):
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            if self.dropped_counter is not None:
+                self.dropped_counter.inc()
+            return False
+        if self.queued_gauge is not None:
+            self.queued_gauge.inc()
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def _take(self):
+        rows = []
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if rows and self.queued_gauge is not None:
+            self.queued_gauge.dec(len(rows))
+        return rows
+
+    def flush(self):
+        """Writes everything queued so far; returns the number of rows written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                rows = self._take()
+                if not rows:
+                    return written
+                try:
+                    self.write(rows)
+                except Exception as e:
+                    logging.error(f"WRITE_BEHIND_FLUSH_FAILED: {len(rows)} rows dropped: {e}")
+                    if self.dropped_counter is not None:
+                        self.dropped_counter.inc(len(rows))
+                    continue
+                written += len(rows)
+                if self.written_counter is not None:
+                    self.written_counter.inc(len(rows))
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        if self._pid is None:
+            atexit.register(self.close)
+        elif self._pid != os.getpid():
+            # fork 之後 queue 的 lock 狀態不可靠，換一個新的 (master 不會有待寫的資料)
+            self._queue = queue.Queue(self.max_size)
+        self._pid = os.getpid()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout=5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        return self.flush()